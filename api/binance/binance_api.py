@@ -1,111 +1,432 @@
 #!/usr/bin/env python3
 
+import hmac
+import logging
+import hashlib
+import threading
 from os import getenv
-from math import log
+from time import time
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+import requests
 from dotenv import load_dotenv
-from binance.client import Client
-from binance.exceptions import BinanceAPIException
+from api.binance.clock_sync import clock_sync
+from api.binance.market_data_bus import market_data_reader
+from api.binance.records import (decode_json, futures_order, futures_position,
+                                 asset_balance, symbol_filter)
+
+logger = logging.getLogger('default_logger')
 
 class binance_api():
 
+    # Used by the lightweight startup requests (same endpoints as
+    # python-binance uses)
+    _futures_url = 'https://fapi.binance.com/fapi/v1/'
+
+    # Refresh cached exchange info (filters, symbols) after this many seconds
+    _exchange_info_max_age = 3600
+
+    # Prices and metadata from the market data bus are used if the feed
+    # updated them within this many seconds, otherwise they are requested
+    _market_data_max_age = 30
+
+    # Order placement attempts if the outcome of a request is unknown
+    _order_attempts = 3
+
+    # See https://binance-docs.github.io/apidocs/futures/en/#error-codes
+    _error_status_unknown = -1007  # Timeout, send status unknown
+    _error_timestamp = -1021       # Timestamp outside of recvWindow
+    _error_unknown_order = -2013   # Order does not exist
+    _error_margin_type_set = -4046 # No need to change margin type
+    _error_duplicate_order = -4116 # ClientOrderId is duplicated
+
     def __init__(self):
 
         load_dotenv()
-        self.client = Client(getenv('binance_api'),
-                        getenv('binance_secret'))
+        self._api_key = getenv('binance_api')
+        self._api_secret = getenv('binance_secret')
+
+        # The python-binance client is created on first use: importing it
+        # pulls in aiohttp and dateparser, which takes about a second
+        self._client = None
+        self._client_lock = threading.Lock()
+
+        # Filters of all symbols from the exchange info, {symbol:
+        # symbol_filter}, the rest of the exchange info is not kept
+        self._symbol_filters = {}
+        self._exchange_info_time = 0
+
+        # Offset to the server clock and recvWindow for all signed requests
+        self._clock = clock_sync()
+        self._clock.start()
+
+        # Shared market data of all bot processes on this host, see
+        # use_market_data_bus()
+        self._use_market_data = False
+        self._market_data_path = None
+        self._market_data = None
+
+        # Margin type ('ISOLATED' or 'CROSSED') and leverage per symbol as
+        # set on Binance, from the position information, so the bot only
+        # sends a change if it differs from what a bet needs
+        self._position_config = {}
+
+    @property
+    def client(self):
+        with self._client_lock:
+            if self._client is None:
+                from binance.client import Client
+                self._client = Client(self._api_key, self._api_secret)
+                self._add_fast_json(self._client)
+                self._add_clock_sync(self._client)
+        return self._client
+
+    def _add_fast_json(self, client):
+        # Decode responses with the fastest available JSON parser (see
+        # records.py) instead of response.json(), same errors as the client
+        from binance.exceptions import (BinanceAPIException,
+                                        BinanceRequestException)
+
+        def handle_response(response):
+            if not 200 <= response.status_code < 300:
+                raise BinanceAPIException(response, response.status_code,
+                                          response.text)
+            try:
+                return decode_json(response.content)
+            except ValueError:
+                raise BinanceRequestException('Invalid Response: %s' %
+                                              response.text)
+
+        client._handle_response = handle_response
+
+    def _add_clock_sync(self, client):
+        # Correct the timestamp and set recvWindow of every signed request,
+        # and repeat a request once if it was rejected for its timestamp
+        # (it was not processed, so this is safe)
+        from binance.exceptions import BinanceAPIException
+        request = client._request
+
+        def synced_request(method, uri, signed, force_params=False,
+                           **kwargs):
+            # The client adds timestamp and signature to the data dict
+            params = dict(kwargs.get('data') or {})
+            for attempt in range(2):
+                if signed:
+                    client.timestamp_offset = self._clock.offset
+                    kwargs['data'] = dict(params,
+                                          recvWindow=self._clock.recv_window)
+                try:
+                    return request(method, uri, signed, force_params,
+                                   **kwargs)
+                except BinanceAPIException as error:
+                    if (not signed or attempt or
+                            error.code != self._error_timestamp):
+                        raise
+                    logger.warning('Request rejected for its timestamp, '
+                                   'sync clock and retry: %s', error)
+                    self._clock.resync()
+
+        client._request = synced_request
+
+    def get_clock_metrics(self):
+        return self._clock.metrics()
+
+    def preload_client(self):
+        # Import and create the client in the background, e.g. while the
+        # startup snapshot is waiting for the network
+        threading.Thread(target=lambda: self.client,
+                         name='binance_client_preload',
+                         daemon=True).start()
+
+    def use_market_data_bus(self, path=None):
+        # Read mark prices and exchange info from the feed process
+        # (market_data_feed.py) when it runs, instead of requesting them in
+        # every bot process
+        self._use_market_data = True
+        self._market_data_path = path
+        self._attach_market_data_bus()
 
-        # List of all symbols for which we explicitely have set the margin type
-        # to isolated
-        self.margin_type_symbols = []
+    def _attach_market_data_bus(self):
+        if self._market_data is not None:
+            self._market_data.close()
+            self._market_data = None
+        try:
+            self._market_data = market_data_reader(self._market_data_path)
+        except (OSError, ValueError) as error:
+            logger.debug('No market data bus: %s', error)
 
-    def _convert_size_to_precision(self, size):
-        return int(round(-log(size, 10), 0))
+    def _market_data_bus(self):
+        # The bus if its data is recent, None otherwise (e.g. the feed is
+        # not running, or was restarted and the bus has to be attached again)
+        if not self._use_market_data:
+            return None
+        for attempt in range(2):
+            if self._market_data is not None:
+                age = self._market_data.age()
+                if age is not None and age < self._market_data_max_age:
+                    return self._market_data
+            if attempt == 0:
+                self._attach_market_data_bus()
+        return None
 
-    def _get_filter_element(self, filter_list, filter_type):
-        for filter_element in filter_list:
-            if filter_element['filterType'] == filter_type:
-                return filter_element
+    def _market_data_metadata(self, key):
+        market_data = self._market_data_bus()
+        if market_data is None:
+            return None
+        metadata = market_data.metadata()
+        if (metadata is None or
+                time()-metadata['time'] > self._exchange_info_max_age):
+            return None
+        return metadata.get(key)
+
+    def _futures_get(self, session, path, signed=False):
+        # Plain REST request without the python-binance client
+        params = {}
+        headers = {'X-MBX-APIKEY': self._api_key}
+        if signed:
+            params['timestamp'] = self._clock.timestamp()
+            params['recvWindow'] = self._clock.recv_window
+            params['signature'] = hmac.new(self._api_secret.encode('utf-8'),
+                                           urlencode(params).encode('utf-8'),
+                                           hashlib.sha256).hexdigest()
+        response = session.get(self._futures_url + path, params=params,
+                               headers=headers, timeout=10)
+        response.raise_for_status()
+        return decode_json(response.content)
+
+    def get_portfolio_snapshot(self):
+        # Get everything needed to set up the portfolio in one concurrent
+        # burst: account balances, exchange info and positions
+        self.preload_client()
+        with requests.Session() as session:
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                balances = executor.submit(self._futures_get, session,
+                                           'balance', signed=True)
+                exchange_info = executor.submit(self._futures_get, session,
+                                                'exchangeInfo')
+                positions = executor.submit(self._futures_get, session,
+                                            'positionRisk', signed=True)
+
+                self._set_exchange_info(exchange_info.result())
+                return {'balances': [asset_balance.from_dict(balance)
+                                     for balance in balances.result()],
+                        'symbol_filters': self._symbol_filters,
+                        'positions': [futures_position.from_dict(position)
+                                      for position in positions.result()]}
+
+    def _set_exchange_info(self, exchange_info):
+        self._symbol_filters = {info['symbol']: symbol_filter.from_dict(info)
+                                for info in exchange_info['symbols']}
+        self._exchange_info_time = time()
+
+    def _get_symbol_filters(self):
+        if time()-self._exchange_info_time > self._exchange_info_max_age:
+            exchange_info = self._market_data_metadata('exchange_info')
+            if exchange_info is None:
+                exchange_info = self.client.futures_exchange_info()
+            self._set_exchange_info(exchange_info)
+        return self._symbol_filters
+
+    @staticmethod
+    def get_asset_balance(balances, asset):
+        # balances: asset_balance records
+        for balance in balances:
+            if balance.asset == asset:
+                return balance.balance, balance.withdraw_available
 
     def get_step_size_precision(self, symbol, filter_type='MARKET_LOT_SIZE'):
         # Filters are defined by different filter types
         # For the step size, possible filter types are
         # LOT_SIZE and MARKET_LOT_SIZE
-        futures_exchange_info = self.client.futures_exchange_info()
-        for info in futures_exchange_info['symbols']:
-            if info['symbol'] == symbol:
-                step_size = float(self._get_filter_element
-                                  (info['filters'], filter_type)['stepSize']
-                                  )
-                return self._convert_size_to_precision(step_size)
+        filters = self._get_symbol_filters().get(symbol)
+        if filters is not None:
+            return filters.step_size_precision(filter_type)
 
     def get_tick_size_precision(self, symbol):
-        # Filters are defined by different filter types
-        # For the tick size, the filter type is always the same
-        filter_type = 'PRICE_FILTER'
-        futures_exchange_info = self.client.futures_exchange_info()
-        for info in futures_exchange_info['symbols']:
-            if info['symbol'] == symbol:
-                tick_size = float(self._get_filter_element
-                                  (info['filters'], filter_type)['tickSize']
-                                  )
-                return self._convert_size_to_precision(tick_size)
+        # For the tick size, the filter type is always PRICE_FILTER
+        filters = self._get_symbol_filters().get(symbol)
+        if filters is not None:
+            return filters.tick_precision
 
     def get_account_balance(self, asset):
-        for account in self.client.futures_account_balance():
-            if account['asset'] == asset:
-                return (float(account['balance']),
-                        float(account['withdrawAvailable']))
+        return self.get_asset_balance(
+            [asset_balance.from_dict(balance)
+             for balance in self.client.futures_account_balance()], asset)
 
     def get_max_leverage(self, symbol):
         return int(self.client.futures_leverage_bracket(symbol=symbol)[0]
                    ['brackets'][0]['initialLeverage'])
 
-    def get_futures_open_positions(self):
-        open_positions = []
-        for position in self.client.futures_position_information():
-            if float(position['positionAmt']) != 0.:
-                open_positions.append(position)
-        return open_positions
+    def get_leverage_brackets(self):
+        # Leverage and maintenance margin brackets of all symbols, of this
+        # account (not from the market data bus, which may be fed from
+        # another account)
+        return self.client.futures_leverage_bracket()
+
+    def get_futures_positions(self):
+        # Position information of all symbols, open or not
+        return [futures_position.from_dict(position)
+                for position in self.client.futures_position_information()]
+
+    def get_futures_open_positions(self, positions=None):
+        if positions is None:
+            positions = self.get_futures_positions()
+        # The position information contains all symbols, keep the position
+        # config up to date (e.g. after changes in the web interface)
+        self._update_position_config(positions)
+        return [position for position in positions
+                if position.position_amt != 0.]
 
     def get_futures_open_orders(self):
-        return self.client.futures_get_open_orders()
+        return [futures_order.from_dict(order)
+                for order in self.client.futures_get_open_orders()]
 
     def get_futures_market_price(self, symbol):
+        market_data = self._market_data_bus()
+        if market_data is not None:
+            price = market_data.price(symbol)
+            if price is not None:
+                return price
         return float(self.client.futures_mark_price(symbol=symbol)['markPrice'])
 
-    def _set_margin_type(self, symbol):
-        # Always use isolated mode
-        if symbol not in self.margin_type_symbols:
+    def get_futures_market_prices(self):
+        # Mark prices of all symbols with one request
+        market_data = self._market_data_bus()
+        if market_data is not None:
+            return market_data.prices()
+        return {price['symbol']: float(price['markPrice'])
+                for price in self.client.futures_mark_price()}
+
+    def _update_position_config(self, positions):
+        for position in positions:
+            self._position_config[position.symbol] = {
+                'margin_type': position.margin_type,
+                'leverage': position.leverage}
+
+    def set_position_config(self, symbol, leverage, margin_type='ISOLATED'):
+        # Change margin type and leverage of a symbol, but only if they
+        # differ from the cached position config. Loads the config of all
+        # symbols with one request if the symbol is unknown.
+        if symbol not in self._position_config:
+            self._update_position_config(self.get_futures_positions())
+        config = self._position_config.get(symbol, {})
+
+        if config.get('margin_type') != margin_type:
+            self.futures_change_margin_type(symbol, margin_type)
+        if config.get('leverage') != leverage:
+            self.futures_change_leverage(symbol, leverage)
+
+    def futures_change_margin_type(self, symbol, margin_type):
+        from binance.exceptions import BinanceAPIException
+        try:
+            self.client.futures_change_margin_type(symbol=symbol,
+                                                   marginType=margin_type)
+        except BinanceAPIException as error:
+            # Fails e.g. if there is an open position of the symbol
+            if error.code != self._error_margin_type_set:
+                raise
+        self._position_config.setdefault(symbol, {})['margin_type'] = \
+            margin_type
+
+    def get_futures_order(self, symbol, client_order_id):
+        # Returns None if there is no order with this client order ID
+        from binance.exceptions import BinanceAPIException
+        try:
+            return futures_order.from_dict(self.client.futures_get_order(
+                symbol=symbol, origClientOrderId=client_order_id))
+        except BinanceAPIException as error:
+            if error.code == self._error_unknown_order:
+                return None
+            raise
+
+    def _create_order_idempotent(self, retry=False, **params):
+        # The client order ID makes retries safe: before every send but the
+        # first, the order is looked up by that ID and only sent if it does
+        # not exist. Binance's duplicate check (-4116) only covers open
+        # orders, a MARKET order fills at once and would be bought twice.
+        # retry: the caller sends the order again (e.g. after a timeout in
+        # an earlier cycle), look it up before the first send as well. If
+        # a lookup fails, nothing is sent.
+        from binance.exceptions import BinanceAPIException
+        symbol = params['symbol']
+        client_order_id = params['newClientOrderId']
+
+        for attempt in range(1, self._order_attempts+1):
+            if retry or attempt > 1:
+                order = self.get_futures_order(symbol, client_order_id)
+                if order is not None:
+                    return order
             try:
-                self.client.futures_change_margin_type(symbol=symbol, marginType='ISOLATED')
-            except BinanceAPIException:
-                pass
-            self.margin_type_symbols.append(symbol)
-
-    def futures_create_market_order(self, symbol, side, quantity):
-        self._set_margin_type(symbol)
-        return self.client.futures_create_order(symbol=symbol, side=side,
-                                                type='MARKET',
-                                                quantity=quantity)
-
-    def futures_create_limit_order(self, symbol, side, quantity, price=-1,
-                                   timeInForce='GTC'):
-        self._set_margin_type(symbol)
-        return self.client.futures_create_order(symbol=symbol, side=side,
-                                                type='LIMIT', quantity=quantity,
-                                                price=price,
-                                                timeInForce=timeInForce)
-
-    def futures_change_position_margin(self, symbol, amount, margin_add, type=1):
+                return futures_order.from_dict(
+                    self.client.futures_create_order(**params))
+            except BinanceAPIException as error:
+                if error.code not in (self._error_status_unknown,
+                                      self._error_duplicate_order):
+                    raise
+                last_error = error
+            except requests.exceptions.RequestException as error:
+                # Timeout or connection error, the order may or may not
+                # have reached Binance
+                last_error = error
+
+        order = self.get_futures_order(symbol, client_order_id)
+        if order is not None:
+            return order
+        raise last_error
+
+    def futures_create_market_order(self, symbol, side, quantity,
+                                    client_order_id, retry=False):
+        return self._create_order_idempotent(retry=retry, symbol=symbol,
+                                             side=side, type='MARKET',
+                                             quantity=quantity,
+                                             newClientOrderId=client_order_id)
+
+    def futures_create_limit_order(self, symbol, side, quantity,
+                                   client_order_id, price=-1,
+                                   timeInForce='GTC', retry=False):
+        return self._create_order_idempotent(retry=retry, symbol=symbol,
+                                             side=side, type='LIMIT',
+                                             quantity=quantity,
+                                             price=price,
+                                             timeInForce=timeInForce,
+                                             newClientOrderId=client_order_id)
+
+    def futures_change_position_margin(self, symbol, amount, type=1):
         return (self.client.futures_change_position_margin(symbol=symbol,
-                                                           amount=myBet
-                                                           .margin_add,
+                                                           amount=amount,
                                                            type=type
                                                            ))
 
     def futures_change_leverage(self, symbol, leverage):
-        return self.client.futures_change_leverage(symbol=symbol,
-                                                   leverage=leverage)
+        response = self.client.futures_change_leverage(symbol=symbol,
+                                                       leverage=leverage)
+        self._position_config.setdefault(symbol, {})['leverage'] = \
+            int(response['leverage'])
+        return response
 
     def get_futures_all_orders(self):
-        return self.client.futures_get_all_orders()
+        return [futures_order.from_dict(order)
+                for order in self.client.futures_get_all_orders()]
+
+    def get_futures_account_trades(self, symbol, from_id=None,
+                                   start_time=None, end_time=None,
+                                   limit=1000):
+        # Trades are returned in ascending order of their ID, fromId
+        # includes the given ID. startTime and endTime are inclusive and at
+        # most 7 days apart.
+        params = {'symbol': symbol, 'limit': limit}
+        if from_id is not None:
+            params['fromId'] = from_id
+        elif start_time is not None:
+            params['startTime'] = start_time
+            if end_time is not None:
+                params['endTime'] = end_time
+        return self.client.futures_account_trades(**params)
+
+    def get_futures_income_history(self, income_type, start_time,
+                                   limit=1000):
+        # Income entries are returned in ascending order of their time,
+        # startTime includes the given time
+        return self.client.futures_income_history(incomeType=income_type,
+                                                  startTime=start_time,
+                                                  limit=limit)
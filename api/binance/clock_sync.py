@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+import logging
+import threading
+from time import time, sleep
+import requests
+
+logger = logging.getLogger('default_logger')
+
+
+class clock_sync:
+
+    _time_url = 'https://fapi.binance.com/fapi/v1/time'
+
+    # Binance accepts recvWindow up to 60 s, default is 5 s
+    _recv_window_range = (1000, 60000)
+
+    def __init__(self, interval=60., samples=4):
+
+        # Sync every interval seconds, with samples requests per sync of
+        # which the one with the shortest round trip is used (its server
+        # time is the least uncertain)
+        self._interval = interval
+        self._samples = samples
+
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+
+        # Server time - local time, round trip time (ms)
+        self._offset = 0.
+        self._rtt = 0.
+        # Change of the offset (ms per hour), i.e. how fast the clock drifts
+        self._drift = 0.
+        self._last_sync = None
+        self._syncs = 0
+        self._failures = 0
+        self._rejections = 0
+
+        self._recv_window = 5000
+
+    def start(self):
+        threading.Thread(target=self._run, name='clock_sync',
+                         daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self.sync()
+            except requests.exceptions.RequestException as error:
+                with self._lock:
+                    self._failures += 1
+                logger.warning('Could not sync clock with Binance: %s', error)
+            sleep(self._interval)
+
+    def _measure(self):
+        start = time()*1000
+        response = self._session.get(self._time_url, timeout=5)
+        end = time()*1000
+        response.raise_for_status()
+        server_time = response.json()['serverTime']
+        # Assume the server read its clock halfway through the round trip
+        return end-start, server_time-(start+end)/2
+
+    def sync(self):
+        rtt, offset = min(self._measure() for _ in range(self._samples))
+        now = time()
+
+        with self._lock:
+            if self._last_sync is not None:
+                hours = (now-self._last_sync)/3600.
+                self._drift = (offset-self._offset)/hours
+            self._offset = offset
+            self._rtt = rtt
+            self._last_sync = now
+            self._syncs += 1
+
+            # The request must arrive within recvWindow of its timestamp:
+            # allow for a few round trips and the drift until the next sync
+            recv_window = (1000 + 3*rtt +
+                           abs(self._drift)*self._interval/3600.)
+            self._recv_window = int(min(max(recv_window,
+                                            self._recv_window_range[0]),
+                                        self._recv_window_range[1]))
+
+        logger.debug('Clock offset %.1f ms, round trip %.1f ms, drift %.1f '
+                     'ms/h, recvWindow %d ms.', offset, rtt, self._drift,
+                     self._recv_window)
+
+    def resync(self):
+        # A request was rejected because of its timestamp: sync now, and
+        # widen recvWindow until the next regular sync
+        recv_window = self._recv_window
+        self.sync()
+        with self._lock:
+            self._rejections += 1
+            self._recv_window = min(max(2*recv_window, self._recv_window),
+                                    self._recv_window_range[1])
+
+    @property
+    def offset(self):
+        return self._offset
+
+    @property
+    def recv_window(self):
+        return self._recv_window
+
+    def timestamp(self):
+        # Current server time (ms) as used in signed requests
+        return int(time()*1000 + self._offset)
+
+    def metrics(self):
+        with self._lock:
+            return {'offset_ms': self._offset,
+                    'rtt_ms': self._rtt,
+                    'drift_ms_per_hour': self._drift,
+                    'recv_window_ms': self._recv_window,
+                    'syncs': self._syncs,
+                    'failures': self._failures,
+                    'rejections': self._rejections}
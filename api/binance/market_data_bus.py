@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import mmap
+import tempfile
+from time import time, sleep
+import numpy as np
+from api.binance.records import decode_json
+
+# One feed process (market_data_feed.py) writes mark prices and metadata
+# (exchange info, public data only) into a memory mapped file, every bot
+# process on the same host reads them from there instead of asking Binance.
+#
+# Layout of the file (little endian, 8 byte aligned):
+#   header   8 x int64: magic, max_symbols, slots, meta_size, symbol_count,
+#                       price_count, meta_sequence, meta_length
+#   symbols  max_symbols x 16 bytes (ASCII, append only)
+#   times    slots x int64 (ms since epoch)
+#   prices   slots x max_symbols x float64 (NaN: no price)
+#   meta     meta_size bytes (JSON)
+#
+# The prices are a ring buffer of the last slots updates. The writer fills
+# the slot after the latest one and only then increments price_count, so a
+# reader never sees a slot while it is written, and a slot it reads stays
+# valid until the writer has gone around the whole ring. The metadata is
+# guarded by a sequence lock: meta_sequence is odd while the writer changes
+# it, a reader retries if the sequence is odd or changed during its read.
+# Neither side ever waits for the other. (This relies on aligned 8 byte
+# stores being atomic and not reordered with each other, as on x86-64.)
+
+_MAGIC = 0x6b656c6c795f6d64  # 'kelly_md'
+_HEADER = 8
+(_MAGIC_FIELD, _MAX_SYMBOLS, _SLOTS, _META_SIZE, _SYMBOL_COUNT, _PRICE_COUNT,
+ _META_SEQUENCE, _META_LENGTH) = range(_HEADER)
+_SYMBOL_SIZE = 16
+
+
+def default_bus_path():
+    # /dev/shm is in memory (no disk writes) where it exists
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else \
+        tempfile.gettempdir()
+    return os.path.join(directory, 'kelly_market_data')
+
+
+def _layout(max_symbols, slots, meta_size):
+    # Offsets of the arrays and total size of the file
+    symbols = _HEADER*8
+    times = symbols + max_symbols*_SYMBOL_SIZE
+    prices = times + slots*8
+    meta = prices + slots*max_symbols*8
+    return symbols, times, prices, meta, meta + meta_size
+
+
+class _market_data_buffer:
+
+    def _map(self, buffer, max_symbols, slots, meta_size):
+        # Views of the shared memory, nothing is copied
+        symbols, times, prices, meta, _ = _layout(max_symbols, slots,
+                                                  meta_size)
+        self._header = np.frombuffer(buffer, np.int64, _HEADER, 0)
+        self._symbols = np.frombuffer(buffer, f'S{_SYMBOL_SIZE}', max_symbols,
+                                      symbols)
+        self._times = np.frombuffer(buffer, np.int64, slots, times)
+        self._prices = np.frombuffer(buffer, np.float64, slots*max_symbols,
+                                     prices).reshape(slots, max_symbols)
+        self._meta = np.frombuffer(buffer, np.uint8, meta_size, meta)
+        self._max_symbols = max_symbols
+        self._slots = slots
+        self._meta_size = meta_size
+
+
+class market_data_writer(_market_data_buffer):
+
+    def __init__(self, path=None, max_symbols=1024, slots=64,
+                 meta_size=8*1024*1024):
+        # (Re)creates the bus, readers attached to an old one see it getting
+        # stale and attach again
+        self._path = path or default_bus_path()
+        size = _layout(max_symbols, slots, meta_size)[-1]
+
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'wb') as bus_file:
+            bus_file.truncate(size)
+        os.replace(tmp_path, self._path)
+        with open(self._path, 'r+b') as bus_file:
+            self._mmap = mmap.mmap(bus_file.fileno(), size)
+
+        self._map(self._mmap, max_symbols, slots, meta_size)
+        self._header[_MAX_SYMBOLS] = max_symbols
+        self._header[_SLOTS] = slots
+        self._header[_META_SIZE] = meta_size
+        self._header[_MAGIC_FIELD] = _MAGIC
+
+        self._index = {}
+
+    @property
+    def path(self):
+        return self._path
+
+    def _symbol_index(self, symbol):
+        if symbol not in self._index:
+            count = len(self._index)
+            if count == self._max_symbols:
+                raise ValueError(f'No space for symbol {symbol} on the '
+                                 'market data bus.')
+            self._symbols[count] = symbol.encode('ascii')
+            self._index[symbol] = count
+            self._header[_SYMBOL_COUNT] = count+1
+        return self._index[symbol]
+
+    def publish_prices(self, prices, timestamp=None):
+        # prices: {symbol: price}, timestamp: ms since epoch
+        indexes = np.fromiter((self._symbol_index(symbol) for symbol in prices),
+                              np.intp, len(prices))
+        values = np.fromiter(prices.values(), np.float64, len(prices))
+
+        count = int(self._header[_PRICE_COUNT])
+        slot = count % self._slots
+        row = self._prices[slot]
+        row.fill(np.nan)
+        row[indexes] = values
+        self._times[slot] = (int(time()*1000) if timestamp is None
+                             else timestamp)
+        self._header[_PRICE_COUNT] = count+1
+
+    def publish_metadata(self, metadata):
+        data = np.frombuffer(json.dumps(metadata,
+                                        separators=(',', ':')).encode(),
+                             np.uint8)
+        if len(data) > self._meta_size:
+            raise ValueError(f'Metadata ({len(data)} bytes) does not fit on '
+                             f'the market data bus ({self._meta_size} bytes).')
+        sequence = int(self._header[_META_SEQUENCE])
+        self._header[_META_SEQUENCE] = sequence+1
+        self._meta[:len(data)] = data
+        self._header[_META_LENGTH] = len(data)
+        self._header[_META_SEQUENCE] = sequence+2
+
+    def close(self):
+        # Drop the views before closing the memory map
+        self._header = self._symbols = self._times = None
+        self._prices = self._meta = None
+        self._mmap.close()
+
+
+class market_data_reader(_market_data_buffer):
+
+    def __init__(self, path=None):
+        # Raises FileNotFoundError if there is no feed
+        self._path = path or default_bus_path()
+        with open(self._path, 'rb') as bus_file:
+            self._mmap = mmap.mmap(bus_file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+
+        header = np.frombuffer(self._mmap, np.int64, _HEADER, 0)
+        if header[_MAGIC_FIELD] != _MAGIC:
+            raise ValueError(f'{self._path} is not a market data bus.')
+        self._map(self._mmap, int(header[_MAX_SYMBOLS]), int(header[_SLOTS]),
+                  int(header[_META_SIZE]))
+
+        self._index = {}
+        self._meta_sequence = None
+        self._metadata = None
+
+    def _update_index(self):
+        # Only symbols added since the last call are decoded
+        count = int(self._header[_SYMBOL_COUNT])
+        for idx in range(len(self._index), count):
+            self._index[self._symbols[idx].decode('ascii')] = idx
+
+    def latest(self):
+        # (count, time, prices) of the latest update, prices is a view of
+        # the ring buffer (index with symbol_index()), valid as long as
+        # is_valid(count) is True. None if nothing is published yet.
+        count = int(self._header[_PRICE_COUNT])
+        if count == 0:
+            return None
+        slot = (count-1) % self._slots
+        return count, int(self._times[slot]), self._prices[slot]
+
+    def is_valid(self, count):
+        # The slot of update count is not being overwritten yet (the writer
+        # writes it while price_count is count-1+slots)
+        return int(self._header[_PRICE_COUNT]) - count < self._slots-1
+
+    def symbol_index(self, symbol):
+        if symbol not in self._index:
+            self._update_index()
+        return self._index.get(symbol)
+
+    def age(self):
+        # Seconds since the latest update, None if nothing is published yet
+        latest = self.latest()
+        if latest is None:
+            return None
+        return time() - latest[1]/1000.
+
+    def price(self, symbol):
+        # Latest price of a symbol, None if unknown
+        idx = self.symbol_index(symbol)
+        latest = self.latest()
+        if idx is None or latest is None:
+            return None
+        price = float(latest[2][idx])
+        if not self.is_valid(latest[0]):
+            return self.price(symbol)
+        return None if np.isnan(price) else price
+
+    def prices(self):
+        # {symbol: price} of the latest update
+        self._update_index()
+        while True:
+            latest = self.latest()
+            if latest is None:
+                return {}
+            count, _, row = latest
+            prices = {symbol: float(row[idx])
+                      for symbol, idx in self._index.items()}
+            if self.is_valid(count):
+                return {symbol: price for symbol, price in prices.items()
+                        if not np.isnan(price)}
+
+    def metadata(self):
+        # Latest metadata, only decoded again if the feed changed it
+        while True:
+            sequence = int(self._header[_META_SEQUENCE])
+            if sequence == self._meta_sequence:
+                return self._metadata
+            if sequence % 2:
+                sleep(0.001)
+                continue
+            data = bytes(self._meta[:int(self._header[_META_LENGTH])])
+            if int(self._header[_META_SEQUENCE]) == sequence:
+                self._metadata = decode_json(data) if data else None
+                self._meta_sequence = sequence
+                return self._metadata
+
+    def close(self):
+        # Drop the views before closing the memory map
+        self._header = self._symbols = self._times = None
+        self._prices = self._meta = None
+        self._mmap.close()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+from math import log
+
+# Responses of the futures API are decoded with the fastest JSON parser
+# available, and the orders, positions, balances and symbol filters the bot
+# works with are kept as compact records: __slots__ instead of a dict per
+# object, and numbers (which Binance sends as strings) converted once when
+# the record is created instead of by every consumer.
+try:
+    import orjson as _json
+except ImportError:
+    try:
+        import ujson as _json
+    except ImportError:
+        import json as _json
+
+
+def decode_json(data):
+    # data: bytes or str, raises ValueError if it is not valid JSON
+    return _json.loads(data)
+
+
+class futures_order:
+
+    __slots__ = ('order_id', 'client_order_id', 'symbol', 'side', 'type',
+                 'status', 'price', 'avg_price', 'orig_qty', 'executed_qty',
+                 'time', 'update_time')
+
+    def __init__(self, order_id, client_order_id, symbol, side, type, status,
+                 price, avg_price, orig_qty, executed_qty, time, update_time):
+        self.order_id = order_id
+        self.client_order_id = client_order_id
+        self.symbol = symbol
+        self.side = side
+        self.type = type
+        self.status = status
+        self.price = price
+        self.avg_price = avg_price
+        self.orig_qty = orig_qty
+        self.executed_qty = executed_qty
+        self.time = time                # ms since epoch, placement
+        self.update_time = update_time  # ms since epoch, last change
+
+    @classmethod
+    def from_dict(cls, order):
+        # New orders have no 'time' yet, their placement is updateTime
+        return cls(order['orderId'], order['clientOrderId'], order['symbol'],
+                   order['side'], order['type'], order['status'],
+                   float(order['price']), float(order['avgPrice']),
+                   float(order['origQty']), float(order['executedQty']),
+                   order.get('time', order['updateTime']),
+                   order['updateTime'])
+
+    def __repr__(self):
+        return (f'futures_order({self.order_id}, {self.client_order_id}, '
+                f'{self.symbol}, {self.side}, {self.status}, '
+                f'{self.executed_qty}/{self.orig_qty} at {self.avg_price})')
+
+
+class futures_position:
+
+    __slots__ = ('symbol', 'position_amt', 'entry_price', 'mark_price',
+                 'unrealized_profit', 'liquidation_price', 'leverage',
+                 'margin_type', 'isolated_wallet', 'notional', 'update_time')
+
+    def __init__(self, symbol, position_amt, entry_price, mark_price,
+                 unrealized_profit, liquidation_price, leverage, margin_type,
+                 isolated_wallet, notional, update_time):
+        self.symbol = symbol
+        self.position_amt = position_amt  # < 0: short
+        self.entry_price = entry_price
+        self.mark_price = mark_price
+        self.unrealized_profit = unrealized_profit
+        self.liquidation_price = liquidation_price
+        self.leverage = leverage
+        self.margin_type = margin_type    # 'ISOLATED' or 'CROSSED'
+        self.isolated_wallet = isolated_wallet
+        self.notional = notional
+        self.update_time = update_time    # ms since epoch
+
+    @classmethod
+    def from_dict(cls, position):
+        # The position information has 'isolated' or 'cross', orders and
+        # margin type changes use 'ISOLATED' and 'CROSSED'
+        return cls(position['symbol'], float(position['positionAmt']),
+                   float(position['entryPrice']),
+                   float(position['markPrice']),
+                   float(position['unRealizedProfit']),
+                   float(position['liquidationPrice']),
+                   int(position['leverage']),
+                   ('ISOLATED' if position['marginType'] == 'isolated'
+                    else 'CROSSED'),
+                   float(position['isolatedWallet']),
+                   float(position.get('notional', 0.)),
+                   position.get('updateTime', 0))
+
+    def __repr__(self):
+        return (f'futures_position({self.symbol}, {self.position_amt} at '
+                f'{self.entry_price}, {self.margin_type} {self.leverage}x)')
+
+
+class asset_balance:
+
+    __slots__ = ('asset', 'balance', 'withdraw_available')
+
+    def __init__(self, asset, balance, withdraw_available):
+        self.asset = asset
+        self.balance = balance
+        self.withdraw_available = withdraw_available
+
+    @classmethod
+    def from_dict(cls, balance):
+        return cls(balance['asset'], float(balance['balance']),
+                   float(balance['withdrawAvailable']))
+
+    def __repr__(self):
+        return (f'asset_balance({self.asset}, {self.balance}, '
+                f'{self.withdraw_available})')
+
+
+def _filter_precision(filters, filter_type, key):
+    # Decimal places of a step or tick size, e.g. '0.001' -> 3, None if the
+    # symbol has no such filter
+    if filter_type not in filters:
+        return None
+    return int(round(-log(float(filters[filter_type][key]), 10), 0))
+
+
+class symbol_filter:
+
+    __slots__ = ('symbol', 'market_step_precision', 'step_precision',
+                 'tick_precision')
+
+    def __init__(self, symbol, market_step_precision, step_precision,
+                 tick_precision):
+        # Precisions (decimal places) of quantities of market orders (filter
+        # MARKET_LOT_SIZE), of limit orders (LOT_SIZE) and of prices
+        # (PRICE_FILTER)
+        self.symbol = symbol
+        self.market_step_precision = market_step_precision
+        self.step_precision = step_precision
+        self.tick_precision = tick_precision
+
+    @classmethod
+    def from_dict(cls, info):
+        # info: element of 'symbols' of the exchange info
+        filters = {filter_element['filterType']: filter_element
+                   for filter_element in info['filters']}
+        return cls(info['symbol'],
+                   _filter_precision(filters, 'MARKET_LOT_SIZE', 'stepSize'),
+                   _filter_precision(filters, 'LOT_SIZE', 'stepSize'),
+                   _filter_precision(filters, 'PRICE_FILTER', 'tickSize'))
+
+    def step_size_precision(self, filter_type='MARKET_LOT_SIZE'):
+        if filter_type == 'MARKET_LOT_SIZE':
+            return self.market_step_precision
+        if filter_type == 'LOT_SIZE':
+            return self.step_precision
+        raise ValueError(f'No step size of filter type {filter_type}.')
+
+    def __repr__(self):
+        return (f'symbol_filter({self.symbol}, {self.market_step_precision}, '
+                f'{self.step_precision}, {self.tick_precision})')
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import glob
+import atexit
+import logging
+import threading
+from queue import Queue, Empty
+from datetime import datetime, timezone
+
+logger = logging.getLogger('default_logger')
+
+# One record per bet lifecycle (times in ms since epoch, like the Binance API)
+# numpy is only imported for loading, it is not needed by the trading loop
+BET_FIELDS = [('wallet_id', 'i8'),
+              ('symbol', 'U16'),
+              ('entry_price', 'f8'),
+              ('exit_price', 'f8'),
+              ('quantity', 'f8'),
+              ('margin', 'f8'),
+              ('leverage', 'i4'),
+              ('outcome', 'U8'),
+              ('pnl', 'f8'),
+              ('open_time', 'i8'),
+              ('close_time', 'i8')]
+
+
+def _day_of(timestamp):
+    return (datetime.fromtimestamp(timestamp/1000., tz=timezone.utc)
+            .strftime('%Y-%m-%d'))
+
+
+def load_bet_history(directory='bet_history', start_day=None, end_day=None):
+    # Load all bets (optionally of days start_day..end_day, e.g. '2021-08-21')
+    # into a numpy structured array, pandas.DataFrame(array) if needed
+    import numpy as np
+    lines = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.csv'))):
+        day = os.path.basename(path)[:-len('.csv')]
+        if ((start_day is not None and day < start_day) or
+                (end_day is not None and day > end_day)):
+            continue
+        with open(path) as day_file:
+            # Skip header
+            next(day_file)
+            lines.extend(day_file)
+
+    if not lines:
+        return np.empty(0, dtype=BET_FIELDS)
+    return np.loadtxt(lines, delimiter=',', dtype=BET_FIELDS, ndmin=1)
+
+
+class bet_history:
+
+    def __init__(self, directory='bet_history', batch_size=100):
+
+        self._directory = directory
+        os.makedirs(self._directory, exist_ok=True)
+
+        # Records are written in batches by a background thread, the trading
+        # loop never waits for the disk
+        self._batch_size = batch_size
+        self._queue = Queue()
+        self._writer = threading.Thread(target=self._write_loop,
+                                        name='bet_history_writer',
+                                        daemon=True)
+        self._writer.start()
+        # Records still queued are written on exit (the bot exits on SIGTERM
+        # from supervisor with SystemExit, see get-rich-quick-scheme.py)
+        self._closed = False
+        atexit.register(self.close)
+
+    def record(self, wallet, outcome, exit_price, pnl, close_time=None):
+        if close_time is None:
+            close_time = int(datetime.now().timestamp()*1000)
+        entry_price = wallet.entry_price
+        quantity = wallet.buy_order_executed_quantity
+        margin = entry_price*quantity/wallet.leverage+wallet.margin_added
+        self._queue.put((wallet.wallet_id, wallet.symbol, entry_price,
+                         float(exit_price), quantity, margin, wallet.leverage,
+                         outcome, float(pnl), wallet.bet_open_time,
+                         close_time))
+
+    def _write_batch(self, batch):
+        days = {}
+        for bet in batch:
+            days.setdefault(_day_of(bet[-1]), []).append(bet)
+
+        header = ','.join(name for name, _ in BET_FIELDS)+'\n'
+        for day, bets in days.items():
+            path = os.path.join(self._directory, day+'.csv')
+            new_file = not os.path.exists(path)
+            with open(path, 'a') as day_file:
+                if new_file:
+                    day_file.write(header)
+                # str() is the shortest exact representation of a float
+                day_file.writelines(','.join(map(str, bet))+'\n'
+                                    for bet in bets)
+
+    def _write_loop(self):
+        while True:
+            # Wait for a record, then take everything else already queued
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self._batch_size:
+                    batch.append(self._queue.get_nowait())
+            except Empty:
+                pass
+
+            stop = None in batch
+            batch = [bet for bet in batch if bet is not None]
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except OSError as error:
+                    logger.error('Could not write bet history: %s', error)
+            for _ in range(len(batch) + stop):
+                self._queue.task_done()
+            if stop:
+                return
+
+    def flush(self):
+        # Wait until all records so far are written
+        self._queue.join()
+
+    def close(self):
+        # Write all queued records and stop the writer, may be called again
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+
+
+if __name__ == '__main__':
+
+    # Usage: bet_history.py [<directory> [<start_day> [<end_day>]]]
+    import numpy as np
+    bets = load_bet_history(*sys.argv[1:4])
+
+    print(f'Bets: {len(bets)}')
+    for outcome in np.unique(bets['outcome']):
+        selection = bets[bets['outcome'] == outcome]
+        print(f'{outcome}: {len(selection)} bets, '
+              f'PNL {selection["pnl"].sum():.2f} USDT')
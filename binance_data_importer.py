@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import json
+import glob
+import shutil
+import zipfile
+import logging
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+logger = logging.getLogger('default_logger')
+
+# Columns of the kline CSVs from https://data.binance.vision, e.g.
+# futures/um/monthly/klines/BTCUSDT/1m/BTCUSDT-1m-2021-08.zip
+# futures/um/daily/markPriceKlines/BTCUSDT/1m/BTCUSDT-1m-2021-08-21.zip
+# (the last column 'ignore' is dropped)
+KLINE_COLUMNS = [('open_time', 'i8'),
+                 ('open', 'f8'),
+                 ('high', 'f8'),
+                 ('low', 'f8'),
+                 ('close', 'f8'),
+                 ('volume', 'f8'),
+                 ('close_time', 'i8'),
+                 ('quote_volume', 'f8'),
+                 ('count', 'i8'),
+                 ('taker_buy_volume', 'f8'),
+                 ('taker_buy_quote_volume', 'f8')]
+
+KINDS = ('klines', 'markPriceKlines', 'indexPriceKlines', 'premiumIndexKlines')
+
+_dump_name = re.compile(r'^(?P<symbol>[A-Z0-9]+)-(?P<interval>\w+)-'
+                        r'(?P<period>\d{4}-\d{2}(-\d{2})?)\.zip$')
+
+
+def parse_dump_path(path):
+    # (kind, symbol, interval, period) of a dump file, None if unknown
+    match = _dump_name.match(os.path.basename(path))
+    kinds = [kind for kind in KINDS if kind in path.split(os.sep)]
+    if match is None or not kinds:
+        return None
+    return (kinds[0], match['symbol'], match['interval'], match['period'])
+
+
+def _read_dump(path):
+    with zipfile.ZipFile(path) as dump:
+        with dump.open(dump.namelist()[0]) as csv_file:
+            lines = csv_file.read().decode('ascii').splitlines()
+    # Newer dumps have a header line
+    if lines and not lines[0][:1].isdigit():
+        lines = lines[1:]
+    columns = np.loadtxt(lines, delimiter=',', ndmin=2,
+                         usecols=range(len(KLINE_COLUMNS)), dtype=np.float64)
+    return {name: columns[:, idx].astype(dtype)
+            for idx, (name, dtype) in enumerate(KLINE_COLUMNS)}
+
+
+def _import_dump(path, chunk_dir):
+    # Decompress and parse one dump into one chunk: a directory with one
+    # .npy file per column. The chunk is written to a temporary directory
+    # first and renamed when complete, i.e. an interrupted import leaves no
+    # partial chunk behind.
+    columns = _read_dump(path)
+    tmp_dir = chunk_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    order = np.argsort(columns['open_time'], kind='stable')
+    for name, values in columns.items():
+        np.save(os.path.join(tmp_dir, name + '.npy'), values[order])
+
+    open_time = columns['open_time'][order]
+    meta = {'source': os.path.basename(path),
+            'rows': len(open_time),
+            'start': int(open_time[0]) if len(open_time) else 0,
+            'end': int(open_time[-1]) if len(open_time) else 0}
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as meta_file:
+        json.dump(meta, meta_file)
+
+    os.replace(tmp_dir, chunk_dir)
+    return chunk_dir, meta['rows']
+
+
+class binance_data_store:
+
+    def __init__(self, root='binance_data'):
+        self._root = root
+        # Memory maps of chunk columns, opened on first access
+        self._mmaps = {}
+        # Chunk index per series, loaded on first access
+        self._indexes = {}
+
+    def _series_dir(self, kind, symbol, interval):
+        return os.path.join(self._root, kind, symbol, interval)
+
+    def _chunk_dir(self, kind, symbol, interval, period):
+        return os.path.join(self._series_dir(kind, symbol, interval), period)
+
+    def _is_covered(self, kind, symbol, interval, period):
+        # A daily chunk is not needed if its monthly chunk exists
+        return (os.path.isdir(self._chunk_dir(kind, symbol, interval,
+                                              period)) or
+                (len(period) == 10 and
+                 os.path.isdir(self._chunk_dir(kind, symbol, interval,
+                                               period[:7]))))
+
+    def import_dumps(self, source_dir, workers=None):
+        # Import all dumps below source_dir which are not in the store yet
+        dumps = {}
+        for path in sorted(glob.glob(os.path.join(source_dir, '**', '*.zip'),
+                                     recursive=True)):
+            parsed = parse_dump_path(path)
+            if parsed is None:
+                logger.warning('Skip unknown dump %s.', path)
+                continue
+            if not self._is_covered(*parsed):
+                dumps[parsed] = path
+
+        # Do not import daily dumps of months imported in the same run
+        jobs = []
+        for (kind, symbol, interval, period), path in dumps.items():
+            if (len(period) == 10 and
+                    (kind, symbol, interval, period[:7]) in dumps):
+                continue
+            jobs.append((path, self._chunk_dir(kind, symbol, interval,
+                                               period)))
+
+        rows = 0
+        if jobs:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for chunk_dir, chunk_rows in executor.map(_import_dump,
+                                                          *zip(*jobs)):
+                    logger.info('Imported %d rows into %s.', chunk_rows,
+                                chunk_dir)
+                    rows += chunk_rows
+
+        # All series, not only the ones imported to: a run may have been
+        # interrupted after its chunks were renamed into place, but before
+        # the index was written
+        for kind, symbol, interval in self._series():
+            self._remove_daily_chunks_of_months(kind, symbol, interval)
+            self._write_index(kind, symbol, interval)
+
+        return len(jobs), rows
+
+    def _series(self):
+        # (kind, symbol, interval) of every series in the store
+        return [tuple(os.path.relpath(path, self._root).split(os.sep))
+                for path in sorted(glob.glob(os.path.join(self._root, '*',
+                                                          '*', '*')))
+                if os.path.isdir(path)]
+
+    def _remove_daily_chunks_of_months(self, kind, symbol, interval):
+        # Daily dumps are only needed until the monthly dump is published
+        series_dir = self._series_dir(kind, symbol, interval)
+        periods = set(period for period in os.listdir(series_dir)
+                      if os.path.isdir(os.path.join(series_dir, period)))
+        for period in periods:
+            if len(period) == 10 and period[:7] in periods:
+                shutil.rmtree(os.path.join(series_dir, period))
+
+    def _write_index(self, kind, symbol, interval):
+        # Only written if the chunks differ from the index (or it is missing)
+        series_dir = self._series_dir(kind, symbol, interval)
+        chunks = []
+        for period in os.listdir(series_dir):
+            meta_path = os.path.join(series_dir, period, 'meta.json')
+            if period.endswith('.tmp') or not os.path.exists(meta_path):
+                continue
+            with open(meta_path) as meta_file:
+                meta = json.load(meta_file)
+            if meta['rows']:
+                chunks.append([meta['start'], meta['end'], period])
+        chunks.sort()
+
+        index_path = os.path.join(series_dir, 'index.json')
+        if os.path.exists(index_path):
+            with open(index_path) as index_file:
+                if json.load(index_file) == chunks:
+                    return
+        with open(index_path + '.tmp', 'w') as index_file:
+            json.dump(chunks, index_file)
+        os.replace(index_path + '.tmp', index_path)
+        self._indexes.pop((kind, symbol, interval), None)
+
+    def _index(self, kind, symbol, interval):
+        key = (kind, symbol, interval)
+        if key not in self._indexes:
+            index_path = os.path.join(self._series_dir(*key), 'index.json')
+            with open(index_path) as index_file:
+                chunks = json.load(index_file)
+            self._indexes[key] = ([chunk[0] for chunk in chunks],
+                                  [chunk[1] for chunk in chunks],
+                                  [chunk[2] for chunk in chunks])
+        return self._indexes[key]
+
+    def _column(self, kind, symbol, interval, period, name):
+        path = os.path.join(self._chunk_dir(kind, symbol, interval, period),
+                            name + '.npy')
+        if path not in self._mmaps:
+            self._mmaps[path] = np.load(path, mmap_mode='r')
+        return self._mmaps[path]
+
+    def load_range(self, kind, symbol, interval, start, end, columns=None):
+        # All rows with start <= open_time < end (ms since epoch). Chunks
+        # are found by bisection of the index, rows by bisection of the
+        # open times. A range within one chunk is a view of the memory map.
+        if columns is None:
+            columns = [name for name, _ in KLINE_COLUMNS]
+        starts, ends, periods = self._index(kind, symbol, interval)
+
+        first = bisect_left(ends, start)
+        last = bisect_left(starts, end)
+
+        pieces = {name: [] for name in columns}
+        for period in periods[first:last]:
+            open_time = self._column(kind, symbol, interval, period,
+                                     'open_time')
+            lower = np.searchsorted(open_time, start, side='left')
+            upper = np.searchsorted(open_time, end, side='left')
+            for name in columns:
+                pieces[name].append(self._column(kind, symbol, interval,
+                                                 period, name)[lower:upper])
+
+        result = {}
+        for name, values in pieces.items():
+            if len(values) == 1:
+                result[name] = values[0]
+            elif values:
+                result[name] = np.concatenate(values)
+            else:
+                result[name] = np.empty(0, dtype=dict(KLINE_COLUMNS)[name])
+        return result
+
+
+if __name__ == '__main__':
+
+    # Usage: binance_data_importer.py <source_dir> [<store_dir> [<workers>]]
+    logging.basicConfig(level=logging.INFO)
+    store = binance_data_store(*sys.argv[2:3])
+    dumps, rows = store.import_dumps(sys.argv[1],
+                                     int(sys.argv[3]) if len(sys.argv) > 3
+                                     else None)
+    print(f'Imported {dumps} dumps with {rows} rows.')
@@ -0,0 +1,2 @@
+# Makes the top-level modules importable from tests/ (pytest puts the
+# directory of this file on sys.path)
@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 
 import os
+import sys
+import json
+import signal
 import logging
 from math import trunc
 from datetime import datetime
@@ -8,6 +11,18 @@ from time import sleep
 from api.binance.binance_api import binance_api
 from kellyBet import kellyBet
 from kelly_wallet import kelly_wallet
+from pnl_ledger import pnl_ledger
+from bet_history import bet_history, load_bet_history
+from liquidation_engine import liquidation_engine
+from portfolio_risk import portfolio_risk
+from portfolio_config import portfolio_config
+from kelly_allocator import kelly_allocator
+from memory_monitor import memory_monitor
+from volatility_indicators import volatility_indicators
+from wallet_lifecycle import (wallet_lifecycle, NEW_OR_RESETED,
+                              GOT_BET_PARAMETERS, FUTURES_ORDERED,
+                              FUTURES_PAID, SELL_ORDERED, WON, LOST, CANCELED,
+                              WON_OR_LOST_PROCESSED)
 
 def setup_logger(name, log_file, level=logging.INFO):
 
@@ -36,21 +51,197 @@ class get_rich_quick_scheme():
 
         self.dry_run = True
 
+        # RSS and top growing allocation sites per cycle (the bot runs for
+        # weeks), warns if the memory grows steadily
+        self.memory_monitor = memory_monitor()
+
         self._api = binance_api()
 
+        # Share mark prices and exchange info with other bot processes
+        # through market_data_feed.py, if it runs
+        self._api.use_market_data_bus()
+
         # Portfolio containing all wallet objects
         # replaces all dicts from previous code versions
         # wallet_portfolio is an array of wallet objects e.g.:
         # wallet_portfolio = [wallet1, wallet2, ...}
         self.wallet_portfolio = []
 
+        # Wallet IDs, symbols, sizes, leverages (and optionally gross odds
+        # and margin factors), reloaded between cycles when the file changes
+        self.portfolio_config = portfolio_config()
+
+        # Free account balance at startup, the wallet sizes are percentages
+        # of it (also of wallets added or resized later)
+        self.portfolio_capital = None
+
         # Store binance "futures_get_all_orders()" response
         # this is an expensive call and will therefore only
         # be executed once per program cycle
         self.status_of_all_binance_orders = {}
 
+        # Ledger of trades, commissions and funding fees as booked by binance
+        self.pnl_ledger = pnl_ledger(self._api)
+
+        # Local liquidation prices (from cached maintenance margin brackets)
+        self.liquidation_engine = liquidation_engine(self._api)
+
+        # Covariance of all wallet symbols, VaR and ES of the portfolio
+        # (created with the wallets), and the latest mark prices
+        self.portfolio_risk = None
+        self.market_prices = {}
+
+        # The VaR of all positions including a new bet must not exceed this
+        # fraction of the total wallet balance, otherwise the bet is scaled
+        # down, or vetoed if it would have to be smaller than min_bet_scale
+        self.max_var_fraction = 0.25
+        self.min_bet_scale = 0.1
+
+        # Adding margin to an open position is given up after this many
+        # failed attempts, the bet continues without it (i.e. with a closer
+        # liquidation price) and gets its SELL order
+        self.max_margin_failures = 3
+
+        # EMA, ATR and realized volatility per symbol, updated every cycle,
+        # suggest gross odds and margin factor of new bets
+        self.volatility_indicators = volatility_indicators()
+
+        # Columnar export of all finished bets (written in the background)
+        self.bet_history = bet_history()
+
+        # Kelly stakes of all wallets solved jointly every cycle (correlated
+        # symbols share a stake), with win probabilities learned from the
+        # bet history. The stake of a wallet is at most its fixed Kelly bet.
+        self.kelly_allocator = kelly_allocator()
+        self.kelly_allocator.load_outcomes(load_bet_history())
+        self.kelly_allocation = {}
+
+        # Bet sequence number per wallet, part of the client order IDs and
+        # therefore persisted across restarts. The file also has a salt of
+        # the IDs (see load_bet_sequences()).
+        self._bet_sequences_file = 'bet_sequences.json'
+        self.client_order_salt = ''
+        self.bet_sequences = self.load_bet_sequences()
+
+        # Every wallet advances through its lifecycle on its own, see also
+        # wallet_lifecycle_concept.txt
+        self.wallet_lifecycle = wallet_lifecycle({
+            NEW_OR_RESETED: self.add_bet_parameters_to_wallet,
+            GOT_BET_PARAMETERS: self.order_futures,
+            FUTURES_ORDERED: self.pay_futures,
+            FUTURES_PAID: self.order_sell,
+            SELL_ORDERED: self.check_for_win_or_lose,
+            WON: self.process_win,
+            LOST: self.process_loss,
+            CANCELED: self.process_cancel,
+            WON_OR_LOST_PROCESSED: self.reset_wallet})
+
+    def load_bet_sequences(self):
+        # Without the file, the sequences start at 0 again, and a new salt
+        # keeps the client order IDs of new bets from matching orders of
+        # earlier bets (e.g. if the file was lost)
+        if not os.path.exists(self._bet_sequences_file):
+            self.client_order_salt = os.urandom(3).hex()
+            return {}
+        with open(self._bet_sequences_file) as sequences_file:
+            state = json.load(sequences_file)
+        # Files written before the salt only have the sequences, their IDs
+        # have no salt
+        if 'sequences' in state:
+            self.client_order_salt = state['salt']
+            state = state['sequences']
+        return {int(wallet_id): sequence for wallet_id, sequence
+                in state.items()}
+
+    def save_bet_sequences(self):
+        with open(self._bet_sequences_file + '.tmp', 'w') as sequences_file:
+            json.dump({'salt': self.client_order_salt,
+                       'sequences': self.bet_sequences}, sequences_file)
+        os.replace(self._bet_sequences_file + '.tmp', self._bet_sequences_file)
+
+    def start_new_bet_sequence(self, wallet):
+        # Must be persisted before any order of the new bet is sent
+        wallet.bet_sequence += 1
+        self.bet_sequences[wallet.wallet_id] = wallet.bet_sequence
+        self.save_bet_sequences()
+
+    def reconcile_wallet_orders(self, wallet, open_positions=None):
+        # Look up the orders of the last bet by their client order IDs, and
+        # continue with the bet if it is still running. open_positions:
+        # futures_position records, requested if needed and not given.
+        if wallet.bet_sequence == 0:
+            return
+
+        buy_order = self._api.get_futures_order(
+            wallet.symbol, wallet.client_order_id('BUY'))
+        sell_order = self._api.get_futures_order(
+            wallet.symbol, wallet.client_order_id('SELL'))
+
+        if (sell_order is not None and sell_order.status == 'NEW' and
+                buy_order is None):
+            logger.error('Bet %d has an open SELL order %s, but no BUY '
+                         'order, check the position manually [index=%d].',
+                         wallet.bet_sequence, sell_order.order_id,
+                         wallet.wallet_id)
+        elif sell_order is not None and sell_order.status == 'NEW':
+            logger.warning('Continue bet %d with open SELL order ID %s '
+                           '[index=%d].', wallet.bet_sequence,
+                           sell_order.order_id, wallet.wallet_id)
+            wallet.entry_price = buy_order.avg_price
+            wallet.buy_order_executed_quantity = buy_order.executed_qty
+            wallet.buy_order_status = buy_order.status
+            wallet.bet_open_time = buy_order.update_time
+            if open_positions is None:
+                open_positions = self._api.get_futures_open_positions()
+            wallet.margin_added = self.get_reconciled_margin_added(
+                wallet, open_positions)
+            wallet.liquidation_price = (self.liquidation_engine
+                                        .wallet_liquidation_price(wallet))
+            self.set_sell_order_id(wallet, sell_id=sell_order.order_id)
+            self.pnl_ledger.register_order(buy_order.order_id, wallet)
+            self.pnl_ledger.register_order(sell_order.order_id, wallet)
+            wallet.status = SELL_ORDERED
+        elif sell_order is None and buy_order is not None:
+            logger.warning('Bet %d has a BUY order %s, but no SELL order, '
+                           'check the position manually [index=%d].',
+                           wallet.bet_sequence, buy_order.order_id,
+                           wallet.wallet_id)
+
+    def get_position_margin_added(self, wallet, open_positions):
+        # Margin added to the position of the bet of a wallet: isolated
+        # wallet minus initial margin of the position (the wallet's share of
+        # it, if several wallets bet on the symbol), None without position
+        quantity = wallet.buy_order_executed_quantity
+        for position in open_positions:
+            if position.symbol == wallet.symbol and position.position_amt:
+                share = (quantity/position.position_amt if quantity > 0.
+                         else 1.)
+                margin_initial = (position.entry_price*position.position_amt /
+                                  position.leverage)
+                return max((position.isolated_wallet-margin_initial)*share,
+                           0.)
+        return None
+
+    def get_reconciled_margin_added(self, wallet, open_positions):
+        # Margin added to the position of a bet running since before a
+        # restart: from the bet plan if there is one, otherwise from the
+        # position
+        if wallet.bet is not None:
+            return wallet.bet.margin_add
+        margin_added = self.get_position_margin_added(wallet, open_positions)
+        if margin_added is None:
+            logger.warning('No open position of the running bet, assume no '
+                           'margin was added [index=%d].', wallet.wallet_id)
+            return 0.
+        return margin_added
+
     def add_wallet_to_portfolio(self, wallet):
         self.wallet_portfolio.append(wallet)
+        self.pnl_ledger.register_wallet(wallet)
+
+    def remove_wallet_from_portfolio(self, wallet):
+        # The ledger keeps the PNL of the wallet
+        self.wallet_portfolio.remove(wallet)
 
     def initialize_order_ids(self, wallet, buy_id=-1, sell_id=-1):
         wallet.buy_order_id = buy_id
@@ -74,8 +265,9 @@ class get_rich_quick_scheme():
             total += current_wallet.balance
         return total
 
-    def check_sufficient_account_balance(self):
-        _, account_free = self.get_account_balance('USDT')
+    def check_sufficient_account_balance(self, account_free=None):
+        if account_free is None:
+            _, account_free = self.get_account_balance('USDT')
         if self.get_total_balance_wallets() > account_free:
             logger.error('The total of requested value for wallets is higher '
                          'than your free account balance: %.2f > %.2f',
@@ -86,20 +278,10 @@ class get_rich_quick_scheme():
         logger.info('Total free account balance: %.2f',
                     account_free)
 
-    def place_new_kelly_bet_on_closed_orders(self):
-
-        for current_wallet in self.wallet_portfolio:
-            if current_wallet.buy_order_id < 0 and current_wallet.sell_order_id < 0:
-                print(f'--> PLACE NEW KELLY BET ON {current_wallet.symbol} <--')
-                self.place_kelly_bet(current_wallet)
-
-            else:
-                # If we reach here, order IDs are both set and positive,
-                # which means we have valid current orders
-                logger.info('Current BUY order ID: %s [index=%d]',
-                            current_wallet.buy_order_id, current_wallet.wallet_id)
-                logger.info('Current SELL order ID: %s [index=%d]',
-                            current_wallet.sell_order_id, current_wallet.wallet_id)
+    def run_wallet_lifecycles(self):
+        # Advance every wallet as far as possible, a failure of one wallet
+        # is retried later and does not affect the others
+        self.wallet_lifecycle.run_all(self.wallet_portfolio)
 
     def reset_open_buy_order(self, wallet):
         logger.info('    Reset BUY order ID %s [index=%d].',
@@ -157,24 +339,27 @@ class get_rich_quick_scheme():
 
         logger.info('Number of open positions: %d', len(open_positions))
 
+        # Cross check local liquidation prices with the ones from Binance
+        self.liquidation_engine.verify(open_positions)
+
         # If there are open positions, output some info, otherwise do nothing
         for open_position in open_positions:
 
             # Collect info
-            symbol = open_position['symbol']
-            price_entry = float(open_position['entryPrice'])
-            price_market = float(open_position['markPrice'])
-            price_liq = float(open_position['liquidationPrice'])
-            quantity = float(open_position['positionAmt'])
-            leverage = int(open_position['leverage'])
+            symbol = open_position.symbol
+            price_entry = open_position.entry_price
+            price_market = open_position.mark_price
+            price_liq = open_position.liquidation_price
+            quantity = open_position.position_amt
+            leverage = open_position.leverage
             leverage_max = self.get_max_leverage(symbol)
             margin_initial = quantity*price_entry/leverage
-            margin_total = float(open_position['isolatedWallet'])
-            margin_type = open_position['marginType']
-            pnl = float(open_position['unRealizedProfit'])
+            margin_total = open_position.isolated_wallet
+            margin_type = open_position.margin_type
+            pnl = open_position.unrealized_profit
             roe = 100*pnl/margin_initial
             time = (datetime
-                    .fromtimestamp(open_position['updateTime']/1000.)
+                    .fromtimestamp(open_position.update_time/1000.)
                     .strftime('%Y-%m-%d %H:%M:%S.%f')
                     )
 
@@ -203,15 +388,15 @@ class get_rich_quick_scheme():
         for open_order in open_orders:
 
             # Collect info
-            symbol = open_order['symbol']
+            symbol = open_order.symbol
             price_market = self._api.get_futures_market_price(symbol)
-            price_sell = float(open_order['price'])
-            quantity = float(open_orders[0]['origQty'])
+            price_sell = open_order.price
+            quantity = open_order.orig_qty
             time_placement = (datetime
-                              .fromtimestamp(open_order['time']/1000.)
+                              .fromtimestamp(open_order.time/1000.)
                               .strftime('%Y-%m-%d %H:%M:%S.%f')
                               )
-            client_order_id = open_order['clientOrderId']
+            client_order_id = open_order.client_order_id
 
             logger.info('--> Symbol: %s', symbol)
             logger.info('    Market price: %.2f', price_market)
@@ -278,9 +463,14 @@ class get_rich_quick_scheme():
         if not self.dry_run:
             response = self._api.futures_create_market_order(symbol=symbol,
                                                              side='BUY',
-                                                             quantity=futures_buy
+                                                             quantity=futures_buy,
+                                                             client_order_id=wallet
+                                                             .client_order_id('BUY'),
+                                                             retry=wallet.failures > 0
                                                              )
-            self.set_buy_order_id(wallet, buy_id=response['orderId'])
+            self.set_buy_order_id(wallet, buy_id=response.order_id)
+            wallet.bet_open_time = response.update_time
+            self.pnl_ledger.register_order(response.order_id, wallet)
             logger.info('        BUY order ID: %s',
                         wallet.buy_order_id)
 
@@ -327,11 +517,15 @@ class get_rich_quick_scheme():
                         futures_create_limit_order(symbol=symbol,
                                                    side='SELL',
                                                    quantity=futures_sell,
+                                                   client_order_id=wallet
+                                                   .client_order_id('SELL'),
                                                    timeInForce='GTC',  # Good til
-                                                   price=price_new     # canceled
+                                                   price=price_new,    # canceled
+                                                   retry=wallet.failures > 0
                                                    )
                         )
-            self.set_sell_order_id(wallet, sell_id=response['orderId'])
+            self.set_sell_order_id(wallet, sell_id=response.order_id)
+            self.pnl_ledger.register_order(response.order_id, wallet)
             logger.info('        SELL order ID: %s',
                         wallet.sell_order_id)
 
@@ -344,48 +538,258 @@ class get_rich_quick_scheme():
                     myBet.asset_total,
                     myBet.roe_lose)
 
-    def place_kelly_bet(self, wallet):
-
-        # Set leverage
-        self._api.futures_change_leverage(symbol=wallet.symbol,
-                                          leverage=wallet.leverage)
-
-        self.log_new_kelly_bet(wallet)
-
-        price_market = self._api.get_futures_market_price(wallet.symbol)
-
+    def get_bet_odds(self, wallet, log=True):
+        # Gross odds and margin factor of the next bet of a wallet
+        gross_odds, margin_factor = self.volatility_indicators.suggest(
+            wallet.symbol, wallet.leverage, log)
+        config = self.portfolio_config.wallet(wallet.wallet_id)
+        if config is not None and config['gross_odds'] is not None:
+            gross_odds = config['gross_odds']
+        if config is not None and config['margin_factor'] is not None:
+            margin_factor = config['margin_factor']
+        return gross_odds, margin_factor
+
+    def plan_kelly_bet(self, wallet, balance, price_market):
         myBet = kellyBet(
-            wallet.balance, price_market, wallet.leverage)
+            balance, price_market, wallet.leverage)
 
         # ----------------------------------------------------------------------
         # Define gross odds and margin factor
+        # (from the portfolio config, or if not set there from the volatility
+        # of the symbol, 1.2 and 1.0 until enough prices are known; manual
+        # choices were 1.2/1.0, 1.4/5.0, 3.5/2.0)
 
-        gross_odds = 1.2     # 1.2 | 1.4 | 3.5
-        margin_factor = 1.0  # 1.0 | 5.0 | 2.0
+        gross_odds, margin_factor = self.get_bet_odds(wallet)
 
         myBet.kellyBet(gross_odds, margin_factor)
         # ----------------------------------------------------------------------
 
-        self.log_kelly_bet_plan(myBet, wallet.symbol)
+        # Plan with Binance's liquidation price (maintenance margin)
+        maint_margin_ratio, maint_amount = (self.liquidation_engine
+                                            .maintenance_margin(
+                                                wallet.symbol,
+                                                myBet.futures_buy*price_market))
+        myBet.set_maintenance_margin(maint_margin_ratio[0], maint_amount[0])
+        return myBet
+
+    def add_bet_parameters_to_wallet(self, wallet):
+        # Changes of the portfolio config take effect between two bets
+        config = self.portfolio_config.wallet(wallet.wallet_id)
+        if config is None:
+            logger.info('Wallet retired, no new bet [index=%d].',
+                        wallet.wallet_id)
+            return NEW_OR_RESETED
+        self.apply_wallet_config(wallet, config)
+
+        print(f'--> PLACE NEW KELLY BET ON {wallet.symbol} <--')
+
+        # Set isolated margin and leverage (only sent to Binance if the
+        # position config differs), not in a dry run
+        if not self.dry_run:
+            self._api.set_position_config(wallet.symbol, wallet.leverage)
+
+        self.log_new_kelly_bet(wallet)
 
-        self.buy_futures(myBet, wallet)
+        price_market = self._api.get_futures_market_price(wallet.symbol)
 
-        self.add_margin(myBet, wallet)
+        # Part of the balance to bet, from the joint Kelly allocation
+        balance = self.get_kelly_bet_balance(wallet)
+        if balance <= 0.:
+            logger.warning('Bet vetoed, no Kelly stake (no edge, or taken by '
+                           'correlated bets) [index=%d].', wallet.wallet_id)
+            return NEW_OR_RESETED
+
+        myBet = self.plan_kelly_bet(wallet, balance, price_market)
+
+        # All symbols are correlated, limit the exposure of the portfolio
+        scale = self.portfolio_risk.bet_scale(
+            self.portfolio_exposures(self.market_prices), wallet.symbol,
+            myBet.futures_buy*price_market)
+        if scale < self.min_bet_scale:
+            logger.warning('Bet vetoed, portfolio VaR would exceed %.2f '
+                           '[index=%d].', self.portfolio_risk.max_var,
+                           wallet.wallet_id)
+            return NEW_OR_RESETED
+        if scale < 1.:
+            logger.warning('Bet scaled to %.1f %% to limit portfolio VaR '
+                           '[index=%d].', 100*scale, wallet.wallet_id)
+            myBet = self.plan_kelly_bet(wallet, balance*scale, price_market)
 
-        self.place_sell_order(myBet, wallet)
+        self.log_kelly_bet_plan(myBet, wallet.symbol)
 
-        self.log_liquidation_info(myBet)
+        # A dry run sends no orders, and plans the same bet every cycle
+        if not self.dry_run:
+            self.start_new_bet_sequence(wallet)
+
+        wallet.bet = myBet
+        return GOT_BET_PARAMETERS
+
+    def order_futures(self, wallet):
+        # A retry after a failed BUY order: if the order is not on Binance,
+        # the plan (price, sell target) is stale, or the order was rejected
+        # (e.g. insufficient margin), plan a new bet. Otherwise sending it
+        # again is safe: the order has a deterministic client order ID, and
+        # binance_api looks it up on retries, so it is not bought twice.
+        if wallet.failures > 0 and not self.dry_run:
+            if self._api.get_futures_order(
+                    wallet.symbol, wallet.client_order_id('BUY')) is None:
+                logger.warning('BUY order of bet %d not placed, plan a new '
+                               'bet [index=%d].', wallet.bet_sequence,
+                               wallet.wallet_id)
+                wallet.bet = None
+                return NEW_OR_RESETED
+        self.buy_futures(wallet.bet, wallet)
+
+        if self.dry_run:
+            # Log the rest of the plan, and start over in the next cycle
+            self.add_margin(wallet.bet, wallet)
+            self.place_sell_order(wallet.bet, wallet)
+            self.log_liquidation_info(wallet.bet)
+            return NEW_OR_RESETED
+
+        return FUTURES_ORDERED
+
+    def pay_futures(self, wallet):
+        # Adding margin has no client order ID. If a request failed (e.g.
+        # timed out after Binance processed it), the retry first checks
+        # whether the isolated wallet of the position already holds it.
+        margin_add = wallet.bet.margin_add
+        if wallet.failures > 0 and margin_add > 0. and not self.dry_run:
+            margin_added = self.get_position_margin_added(
+                wallet, self._api.get_futures_open_positions())
+            # Fees make it slightly less, but it is all or nothing
+            if margin_added is not None and margin_added >= margin_add/2.:
+                logger.warning('Margin %.2f already added (%.2f in the '
+                               'position), not added again [index=%d].',
+                               margin_add, margin_added, wallet.wallet_id)
+                wallet.margin_added = margin_add
+                return FUTURES_PAID
+            # The position is open, it must not stay without SELL order
+            if wallet.failures >= self.max_margin_failures:
+                logger.error('Could not add margin %.2f in %d attempts, '
+                             'continue the bet without it [index=%d].',
+                             margin_add, wallet.failures, wallet.wallet_id)
+                wallet.margin_added = 0.
+                return FUTURES_PAID
+        self.add_margin(wallet.bet, wallet)
+        return FUTURES_PAID
+
+    def order_sell(self, wallet):
+        self.place_sell_order(wallet.bet, wallet)
+        self.log_liquidation_info(wallet.bet)
+        return SELL_ORDERED
 
     def get_futures_all_orders(self):
-        self.status_of_all_binance_orders = self._api.get_futures_all_orders()
+        # {order ID: futures_order}, every wallet looks up its orders by ID
+        self.status_of_all_binance_orders = {
+            order.order_id: order
+            for order in self._api.get_futures_all_orders()}
+
+    def update_pnl_ledger(self):
+        self.pnl_ledger.update()
+
+    def portfolio_exposures(self, prices):
+        # Notional of all open (or opening) positions per symbol
+        exposures = {}
+        for current_wallet in self.wallet_portfolio:
+            if current_wallet.status not in (FUTURES_ORDERED, FUTURES_PAID,
+                                             SELL_ORDERED):
+                continue
+            quantity = current_wallet.buy_order_executed_quantity
+            if quantity <= 0. and current_wallet.bet is not None:
+                quantity = current_wallet.bet.futures_buy
+            symbol = current_wallet.symbol
+            exposures[symbol] = (exposures.get(symbol, 0.) +
+                                 max(quantity, 0.)*prices.get(symbol, 0.))
+        return exposures
+
+    def update_portfolio_risk(self):
+        self.market_prices = self._api.get_futures_market_prices()
+        self.portfolio_risk.update(self.market_prices)
+        self.portfolio_risk.publish(
+            self.portfolio_exposures(self.market_prices))
+
+    def get_open_stake(self, wallet):
+        # Money at stake in the running bet of a wallet. A bet continued
+        # after a restart has no plan, its stake is initial plus added
+        # margin of its orders (see reconcile_wallet_orders()).
+        if wallet.status not in (FUTURES_ORDERED, FUTURES_PAID, SELL_ORDERED):
+            return 0.
+        if wallet.bet is not None:
+            return wallet.bet.asset_total
+        if wallet.entry_price > 0. and wallet.buy_order_executed_quantity > 0.:
+            return (wallet.entry_price*wallet.buy_order_executed_quantity /
+                    wallet.leverage + max(wallet.margin_added, 0.))
+        return 0.
+
+    def update_kelly_allocation(self):
+        # Re-solve the stakes of all wallets: running bets keep theirs, the
+        # others share what is optimal given the correlations
+        stakes = [self.get_open_stake(wallet)
+                  for wallet in self.wallet_portfolio]
+        capital = self.get_total_balance_wallets() + sum(stakes)
+        if capital <= 0.:
+            self.kelly_allocation = {wallet.wallet_id: 0.
+                                     for wallet in self.wallet_portfolio}
+            return
+
+        gross_odds = []
+        caps = []
+        locked = []
+        for current_wallet, stake in zip(self.wallet_portfolio, stakes):
+            # A bet continued after a restart has no plan, assume the odds
+            # of a new bet
+            if stake > 0. and current_wallet.bet is not None:
+                gross_odds.append(current_wallet.bet.gross_odds)
+            else:
+                gross_odds.append(self.get_bet_odds(current_wallet,
+                                                    log=False)[0])
+            if stake > 0.:
+                caps.append(stake/capital)
+                locked.append(stake/capital)
+            else:
+                caps.append(kellyBet.fixed_bet_size_factor *
+                            max(current_wallet.balance, 0.)/capital)
+                locked.append(float('nan'))
+
+        symbols = [wallet.symbol for wallet in self.wallet_portfolio]
+        fractions = self.kelly_allocator.allocate(
+            [wallet.wallet_id for wallet in self.wallet_portfolio], symbols,
+            gross_odds, self.portfolio_risk.correlation(symbols), caps,
+            locked)
+        # Stakes of the wallets which can place a bet
+        self.kelly_allocation = {
+            wallet.wallet_id: fractions[wallet.wallet_id]*capital
+            for wallet, stake in zip(self.wallet_portfolio, stakes)
+            if stake == 0.}
+        logger.info('Kelly stakes: %s.', ', '.join(
+            f'{wallet_id}: {stake:.2f}'
+            for wallet_id, stake in self.kelly_allocation.items()))
+
+    def get_kelly_bet_balance(self, wallet):
+        # Balance for kellyBet, so its fixed bet size factor gives the
+        # allocated stake. A wallet whose bet ended in this cycle was not
+        # free when the stakes were solved, solve again.
+        if wallet.wallet_id not in self.kelly_allocation:
+            try:
+                self.update_kelly_allocation()
+            except Exception as error:
+                logger.error('Could not update Kelly allocation, use fixed '
+                             'bet size: %s', error)
+                return wallet.balance
+        stake = self.kelly_allocation[wallet.wallet_id]
+        return min(stake/kellyBet.fixed_bet_size_factor, wallet.balance)
+
+    def update_volatility_indicators(self):
+        # Uses the mark prices fetched by update_portfolio_risk()
+        self.volatility_indicators.update(self.market_prices)
+        self.volatility_indicators.save()
 
     def get_buy_order_liquidation_price(self,wallet):
-            all_orders =self._api.get_futures_open_positions()
-            
-            for order in all_orders:
-                if order['symbol']==wallet.symbol: # compare by symbol, API response has no orderId's
-                    wallet.liquidation_price = order['liquidationPrice']
-                    print(f'{wallet.symbol} WALLET LIQUIDATION PRICE: {wallet.liquidation_price}')
+            # Calculated locally, cross checked with Binance in
+            # show_open_positions()
+            wallet.liquidation_price = self.liquidation_engine.wallet_liquidation_price(wallet)
+            print(f'{wallet.symbol} WALLET LIQUIDATION PRICE: {wallet.liquidation_price}')
 
     def update_status_of_all_buy_orders(self):
 
@@ -395,14 +799,13 @@ class get_rich_quick_scheme():
             # If there is a current buy order
             if current_wallet.buy_order_id != -1:
 
-                # Loop over all orders (from API)
-                all_orders = self.status_of_all_binance_orders
-                for order in all_orders:
-                    # Match the two orders
-                    if order['orderId'] == current_wallet.buy_order_id:
-                        current_wallet.buy_order_status = order['status']
-                        current_wallet.buy_order_executed_quantity = order['executedQty']
-                        current_wallet.entry_price = order['avgPrice']
+                # Match it with the orders from the API
+                order = self.status_of_all_binance_orders.get(
+                    current_wallet.buy_order_id)
+                if order is not None:
+                    current_wallet.buy_order_status = order.status
+                    current_wallet.buy_order_executed_quantity = order.executed_qty
+                    current_wallet.entry_price = order.avg_price
 
     def check_buy_order_status(self, current_wallet):
         wallet_idx = current_wallet.wallet_id
@@ -411,7 +814,11 @@ class get_rich_quick_scheme():
         entry_price = current_wallet.entry_price
         executed_quantity = current_wallet.buy_order_executed_quantity
 
-        if buy_order_status == 'NEW':
+        if buy_order_status == 'none':
+            logger.info('Buy order with ID %s not yet in order status '
+                        '[index=%d].',
+                        buy_order_id, wallet_idx)
+        elif buy_order_status == 'NEW':
             logger.info('Buy order with ID %s still open '
                         '[index=%d].',
                         buy_order_id, wallet_idx)
@@ -421,7 +828,7 @@ class get_rich_quick_scheme():
             logger.info('Buy order withd ID %s filled at %.2f '
                         '[index=%d].',
                         buy_order_id,
-                        float(entry_price),
+                        entry_price,
                         wallet_idx)
             self.get_buy_order_liquidation_price(current_wallet) 
             self.reset_open_buy_order(current_wallet)
@@ -429,8 +836,8 @@ class get_rich_quick_scheme():
             logger.info('    Wallet balance wallet before: %.2f',
                         current_wallet.balance)
             # Subtract cost of futures
-            current_wallet.balance -= (float(entry_price) *
-                                       float(executed_quantity) /
+            current_wallet.balance -= (entry_price *
+                                       executed_quantity /
                                        current_wallet.leverage
                                        )
             # Subtract added margin
@@ -443,25 +850,13 @@ class get_rich_quick_scheme():
                            buy_order_id, buy_order_status, wallet_idx)
             print(f'BUY ORDER {current_wallet.symbol} HAS UNKNOW STATUS {buy_order_status}')
 
-    def check_status_of_all_buy_orders(self):
-        for current_wallet in self.wallet_portfolio:
-
-            # If there is no current buy order, skip
-            if current_wallet.buy_order_id < 0:
-                logger.info('No current open buy order for index=%d',
-                            current_wallet.wallet_id)
-                # return # no, process all other positions as well, since we got the expensive get_all_orders() info
-
-            else:
-                self.check_buy_order_status(current_wallet)
-
     def calculate_pnl(self, executed_quantity, sell_price, wallet):
         # See dev.binance.vision/t/pnl-manual-calculation/1723
-        pnl = (float(executed_quantity) *
+        pnl = (executed_quantity *
                wallet.entry_price *
                (1/wallet.leverage-1.) +
-               float(sell_price) *
-               float(executed_quantity)
+               sell_price *
+               executed_quantity
                )
         print(f'QTY:{executed_quantity} ENTRY_PRICE:{wallet.entry_price} SELL PRICE:{sell_price} LEVERAGE:{wallet.leverage} --> PNL: {pnl:.2f}')
         return pnl
@@ -474,123 +869,356 @@ class get_rich_quick_scheme():
             # If there is a current sell order
             if current_wallet.sell_order_id != -1:
 
-                # Loop over all orders (from API)
-                all_orders = self.status_of_all_binance_orders
-                for order in all_orders:
-                    # Match the two orders
-                    if order['orderId'] == current_wallet.sell_order_id:
-                        current_wallet.sell_order_status = order['status']
-                        current_wallet.sell_order_executed_quantity = order['executedQty']
-                        # sell order has no 'avgPrice'
+                # Match it with the orders from the API
+                order = self.status_of_all_binance_orders.get(
+                    current_wallet.sell_order_id)
+                if order is not None:
+                    current_wallet.sell_order_status = order.status
+                    current_wallet.sell_order_executed_quantity = order.executed_qty
+                    # sell order has no avg_price
    
     def get_filled_order_avg_price(self, wallet):
-            all_orders= self._api.get_futures_all_orders()
-            for order in all_orders:
-                if order['orderId']== wallet.sell_order_id:
-                    return order['avgPrice']
-            
+            # Order status is up to date, it is fetched at each cycle start
+            order = self.status_of_all_binance_orders.get(wallet.sell_order_id)
+            if order is not None:
+                return order.avg_price
+
             print('FILLED SELL ORDER NOT FOUND !!!')
             logger.error('FILLED SELL ORDER NOT FOUND !!!')
 
-    def check_sell_order_status(self, current_wallet):
+    def check_for_win_or_lose(self, current_wallet):
+        # Process the buy order once it is filled
+        if current_wallet.buy_order_id >= 0:
+            self.check_buy_order_status(current_wallet)
+
         wallet_idx = current_wallet.wallet_id
         sell_order_id = current_wallet.sell_order_id
         sell_order_status = current_wallet.sell_order_status
-        executed_quantity = current_wallet.buy_order_executed_quantity
 
-        if sell_order_status == 'NEW':
-            logger.info('Sell order with ID %s still open '
+        if sell_order_status == 'none':
+            logger.info('Sell order with ID %s not yet in order status '
                         '[index=%d].',
                         sell_order_id, wallet_idx)
-        elif sell_order_status == 'FILLED':
-            # We won!
-            # We get money
-            # Update sell order
-            print(f'*** {current_wallet.symbol} WON !!! ***')
-            logger.info('Sell order withd ID %s filled '
+        elif sell_order_status == 'NEW':
+            logger.info('Sell order with ID %s still open '
                         '[index=%d].',
                         sell_order_id, wallet_idx)
-            sell_price = self.get_filled_order_avg_price(current_wallet)
-            self.reset_open_sell_order(current_wallet)
-
-            # Update wallet
-            logger.info('    Balance wallet before: %.2f',
-                        current_wallet.wallet_id)
-
-            current_wallet.balance += self.calculate_pnl(
-                executed_quantity, sell_price, current_wallet)
-            current_wallet.balance += current_wallet.margin_added
-            logger.info('    Balance wallet after (ignoring fees): '
-                        '%.2f', current_wallet.balance)
+        elif sell_order_status == 'FILLED':
+            return WON
         elif sell_order_status == 'CANCELED':
-            # Canceled, no money
-            # Update sell order
-            print(f'*** {current_wallet.symbol} CANCELED ***')
-            logger.info('Sell order withd ID %s canceled '
-                        '[index=%d].',
-                        sell_order_id, wallet_idx)
-            self.reset_open_sell_order(current_wallet)
+            return CANCELED
         elif sell_order_status == 'EXPIRED':
-            # We lost!
-            # We lose money
-            # Update sell order
-            print(f'*** {current_wallet.symbol} LOST !!! ***')
-            logger.info('Sell order with ID %s expired '
-                        '[index=%d].',
-                        sell_order_id, wallet_idx)
-            self.reset_open_sell_order(current_wallet)
-            # Update wallet
-            logger.info('Wallet balance: %.2f',
-                        current_wallet.balance)
-            # See dev.binance.vision/t/pnl-manual-calculation/1723
-            sell_price=current_wallet.liquidation_price
-            current_wallet.balance += (  # += not -= because PNL value is already negative
-                self.calculate_pnl(executed_quantity, sell_price, current_wallet))
-            logger.info('Wallet after (ignoring fees): '
-                        '%.2f', current_wallet.balance)
+            return LOST
         else:
-            # Update sell order
-            print(f'BUY ORDER {current_wallet.symbol} HAS UNKNOW STATUS {sell_order_status}')
+            print(f'SELL ORDER {current_wallet.symbol} HAS UNKNOW STATUS {sell_order_status}')
             logger.warning('Sell order with ID %s has unknown '
                            'state %s [index=%d].',
                            sell_order_id, sell_order_status, wallet_idx)
             logger.warning('Should I reset the open order?')
 
-    def check_status_of_all_sell_orders(self):
-        # Loop over current orders (stored in this instance)
-        for current_wallet in self.wallet_portfolio:
+        return SELL_ORDERED
 
-            # If there is no current sell order, skip this wallet
-            if current_wallet.sell_order_id == -1:
-                logger.info('No current open sell order. index=%d',
-                            current_wallet.wallet_id)
+    def process_win(self, current_wallet):
+        # We won!
+        # We get money
+        # Update sell order
+        wallet_idx = current_wallet.wallet_id
+        executed_quantity = current_wallet.buy_order_executed_quantity
 
-            # Loop over all orders (from API)
-            # for order in all_orders:
-            else:
-                self.check_sell_order_status(current_wallet)
+        print(f'*** {current_wallet.symbol} WON !!! ***')
+        logger.info('Sell order withd ID %s filled '
+                    '[index=%d].',
+                    current_wallet.sell_order_id, wallet_idx)
+        sell_price = self.get_filled_order_avg_price(current_wallet)
+
+        # Update wallet
+        logger.info('    Balance wallet before: %.2f',
+                    current_wallet.balance)
+
+        pnl = self.calculate_pnl(executed_quantity, sell_price,
+                                 current_wallet)
+        self.bet_history.record(current_wallet, 'WON', sell_price, pnl)
+        self.kelly_allocator.record_outcome(current_wallet.symbol, True)
+        current_wallet.balance += pnl
+        current_wallet.balance += current_wallet.margin_added
+        # Only now, a retry of a failed step above needs the order ID
+        self.reset_open_sell_order(current_wallet)
+        logger.info('    Balance wallet after (ignoring fees): '
+                    '%.2f', current_wallet.balance)
+        logger.info('    Realized PNL of wallet (incl. fees and '
+                    'funding): %.2f',
+                    self.pnl_ledger.wallet_pnl(current_wallet.wallet_id))
+        return WON_OR_LOST_PROCESSED
+
+    def process_loss(self, current_wallet):
+        # We lost!
+        # We lose money
+        # Update sell order
+        wallet_idx = current_wallet.wallet_id
+        executed_quantity = current_wallet.buy_order_executed_quantity
 
-    def calculate_wallet_balance(self, wallet_size_percentage):
-        _, account_free = self.get_account_balance('USDT')
+        print(f'*** {current_wallet.symbol} LOST !!! ***')
+        logger.info('Sell order with ID %s expired '
+                    '[index=%d].',
+                    current_wallet.sell_order_id, wallet_idx)
+        # Update wallet
+        logger.info('Wallet balance: %.2f',
+                    current_wallet.balance)
+        # See dev.binance.vision/t/pnl-manual-calculation/1723
+        sell_price=current_wallet.liquidation_price
+        pnl = self.calculate_pnl(executed_quantity, sell_price,
+                                 current_wallet)
+        self.bet_history.record(current_wallet, 'LOST', sell_price, pnl)
+        self.kelly_allocator.record_outcome(current_wallet.symbol, False)
+        current_wallet.balance += pnl  # += not -= because PNL value is already negative
+        # Only now, a retry of a failed step above needs the order ID
+        self.reset_open_sell_order(current_wallet)
+        logger.info('Wallet after (ignoring fees): '
+                    '%.2f', current_wallet.balance)
+        logger.info('    Realized PNL of wallet (incl. fees and '
+                    'funding): %.2f',
+                    self.pnl_ledger.wallet_pnl(current_wallet.wallet_id))
+        return WON_OR_LOST_PROCESSED
+
+    def process_cancel(self, current_wallet):
+        # Canceled, no money
+        # Update sell order
+        print(f'*** {current_wallet.symbol} CANCELED ***')
+        logger.info('Sell order withd ID %s canceled '
+                    '[index=%d].',
+                    current_wallet.sell_order_id, current_wallet.wallet_id)
+        self.reset_open_sell_order(current_wallet)
+        return WON_OR_LOST_PROCESSED
+
+    def reset_wallet(self, wallet):
+        logger.info('Reset wallet after bet %d [index=%d].',
+                    wallet.bet_sequence, wallet.wallet_id)
+        self.pnl_ledger.release_orders(wallet)
+        wallet.reset()
+        return NEW_OR_RESETED
+
+    def calculate_wallet_balance(self, wallet_size_percentage,
+                                 account_free=None):
+        if account_free is None:
+            _, account_free = self.get_account_balance('USDT')
         wallet_balance = trunc(account_free*wallet_size_percentage/100)
         return wallet_balance
 
+    def create_wallet(self, config, open_position_symbols=()):
+        # Create wallet with id and symbol
+        current_wallet = kelly_wallet(config['wallet_id'], config['symbol'])
+
+        # Add known parameters
+        current_wallet.leverage = config['leverage']
+        current_wallet.balance = self.calculate_wallet_balance(
+            config['size_percentage'], self.portfolio_capital)
+        current_wallet.initial_balance = current_wallet.balance
+        current_wallet.bet_sequence = self.bet_sequences.get(
+            current_wallet.wallet_id, 0)
+        current_wallet.client_order_salt = self.client_order_salt
+
+        if current_wallet.symbol in open_position_symbols:
+            logger.warning('There is already an open position for %s '
+                           '[index=%d].',
+                           current_wallet.symbol, current_wallet.wallet_id)
+        return current_wallet
+
+    def apply_wallet_config(self, wallet, config):
+        # Resize the wallet by the change of its initial balance, i.e. it
+        # keeps what it won or lost so far
+        initial_balance = self.calculate_wallet_balance(
+            config['size_percentage'], self.portfolio_capital)
+        if initial_balance != wallet.initial_balance:
+            logger.info('Resize wallet from %.2f to %.2f [index=%d].',
+                        wallet.initial_balance, initial_balance,
+                        wallet.wallet_id)
+            wallet.balance += initial_balance - wallet.initial_balance
+            wallet.initial_balance = initial_balance
+
+        if config['leverage'] != wallet.leverage:
+            logger.info('Change leverage from %d to %d [index=%d].',
+                        wallet.leverage, config['leverage'], wallet.wallet_id)
+            wallet.leverage = config['leverage']
+
+    def initialize_portfolio(self):
+
+        # Get balances, exchange info and positions at once, instead of one
+        # request per wallet
+        snapshot = self._api.get_portfolio_snapshot()
+        _, account_free = self._api.get_asset_balance(snapshot['balances'],
+                                                      'USDT')
+        self.portfolio_capital = account_free
+        open_positions = self._api.get_futures_open_positions(
+            snapshot['positions'])
+        open_position_symbols = [position.symbol
+                                 for position in open_positions]
+
+        # Create wallets, and add them to wallet portfolio
+        self.portfolio_config.reload()
+        if not self.portfolio_config.wallets:
+            raise ValueError('No valid wallets in portfolio config.')
+        for config in self.portfolio_config.wallets.values():
+
+            current_wallet = self.create_wallet(config, open_position_symbols)
+
+            # Add wallet to portfolio
+            self.add_wallet_to_portfolio(current_wallet)
+            self.volatility_indicators.indicator(current_wallet.symbol)
+
+            # Pick up a bet still running from before a restart
+            self.reconcile_wallet_orders(current_wallet, open_positions)
+
+        # Check if account balance is sufficient to host wallets
+        self.check_sufficient_account_balance(account_free)
+
+        self.portfolio_risk = portfolio_risk(
+            [wallet.symbol for wallet in self.wallet_portfolio],
+            max_var=self.max_var_fraction * self.get_total_balance_wallets())
+
+    def reload_portfolio_config(self):
+        # Remove wallets no longer in the config file once their bet is
+        # finished, and add wallets new in it. Existing wallets keep their
+        # state and orders, resizes and new leverages are applied before
+        # their next bet (see add_bet_parameters_to_wallet).
+        self.portfolio_config.reload()
+
+        for current_wallet in list(self.wallet_portfolio):
+            if (self.portfolio_config.wallet(current_wallet.wallet_id) is None
+                    and current_wallet.status == NEW_OR_RESETED):
+                logger.info('Remove retired wallet for %s with %.2f '
+                            '[index=%d].', current_wallet.symbol,
+                            current_wallet.balance, current_wallet.wallet_id)
+                self.remove_wallet_from_portfolio(current_wallet)
+
+        # Also retried in later cycles, e.g. if the balance was too low
+        wallet_ids = [wallet.wallet_id for wallet in self.wallet_portfolio]
+        new_configs = [config for wallet_id, config
+                       in self.portfolio_config.wallets.items()
+                       if wallet_id not in wallet_ids]
+        if new_configs:
+            _, account_free = self.get_account_balance('USDT')
+
+        for config in new_configs:
+            current_wallet = self.create_wallet(config)
+            if (self.get_total_balance_wallets() +
+                    current_wallet.balance > account_free):
+                logger.error('Free account balance %.2f too low for new '
+                             'wallet with %.2f [index=%d].', account_free,
+                             current_wallet.balance, current_wallet.wallet_id)
+                continue
+            logger.info('Add wallet for %s with %.2f [index=%d].',
+                        current_wallet.symbol, current_wallet.balance,
+                        current_wallet.wallet_id)
+            self.add_wallet_to_portfolio(current_wallet)
+            self.volatility_indicators.indicator(current_wallet.symbol)
+            self.portfolio_risk.add_symbol(current_wallet.symbol)
+            self.reconcile_wallet_orders(current_wallet)
+
+        self.portfolio_risk.max_var = (self.max_var_fraction *
+                                       self.get_total_balance_wallets())
+
     def print_info_of_all_wallets(self):
         for current_wallet in self.wallet_portfolio:
             current_wallet.print_wallet_info()
+        self.pnl_ledger.print_ledger_info()
+
+    def record_memory_usage(self):
+        rss = self.memory_monitor.record()
+        logger.debug('Resident memory: %.1f MB', rss/2**20)
+
+    def log_clock_metrics(self):
+        metrics = self._api.get_clock_metrics()
+        logger.info('Clock offset to Binance: %.1f ms (round trip %.1f ms, '
+                    'drift %.1f ms/h), recvWindow %d ms, %d rejected '
+                    'timestamps.', metrics['offset_ms'], metrics['rtt_ms'],
+                    metrics['drift_ms_per_hour'], metrics['recv_window_ms'],
+                    metrics['rejections'])
+
+    def update_api_info(self):
+        # Get the information all wallets need in this cycle, only the order
+        # status is essential
+        try:
+            # Log open positions and open orders
+            self.show_open_positions()
+            self.show_open_orders()
+        except Exception as error:
+            logger.error('Could not show open positions and orders: %s',
+                         error)
+
+        try:
+            # Get status of all binance orders
+            self.get_futures_all_orders()
+        except Exception as error:
+            error_message = 'CAUGHT AN ERROR WHILE GETTING ALL ORDERS !!!'
+            print(error_message, error)
+            logger.error('%s %s', error_message, error)
+            return False
+
+        try:
+            # Book new trades, commissions and funding fees
+            self.update_pnl_ledger()
+        except Exception as error:
+            logger.error('Could not update PNL ledger: %s', error)
+
+        try:
+            # Update covariances, publish VaR and ES
+            self.update_portfolio_risk()
+        except Exception as error:
+            logger.error('Could not update portfolio risk: %s', error)
+        else:
+            try:
+                # Update EMA, ATR and volatility with the new prices
+                self.update_volatility_indicators()
+            except Exception as error:
+                logger.error('Could not update volatility indicators: %s',
+                             error)
+
+        try:
+            # Joint Kelly stakes of the wallets without a running bet
+            self.update_kelly_allocation()
+        except Exception as error:
+            self.kelly_allocation = {}
+            logger.error('Could not update Kelly allocation, use fixed bet '
+                         'sizes: %s', error)
+
+        try:
+            # Log clock drift (corrected in every signed request)
+            self.log_clock_metrics()
+        except Exception as error:
+            logger.error('Could not log clock metrics: %s', error)
+
+        try:
+            # Update status of all wallets with information from binance
+            self.update_status_of_all_buy_orders()
+            self.update_status_of_all_sell_orders()
+        except Exception as error:
+            error_message = 'CAUGHT AN ERROR WHILE UPDATING ORDER STATUS !!!'
+            print(error_message, error)
+            logger.error('%s %s', error_message, error)
+            return False
+
+        try:
+            # Print info of all wallet objects in portfolio
+            self.print_info_of_all_wallets()
+        except Exception as error:
+            logger.error('Could not print wallet info: %s', error)
+
+        return True
 
 
 if __name__ == '__main__':
 
+    # Exit normally when supervisor stops the bot, so exit handlers run
+    # (e.g. queued bet history records are written)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
     # Create object
     loseitall = get_rich_quick_scheme()
 
     # --------------------------------------------------------------------------
-    # Define investment
-    wallet_ids = [111, 222, 333, 444, 555]
-    symbols = ['BTCUSDT', 'VETUSDT', 'ADAUSDT', 'ETHUSDT', 'XRPUSDT']
-    wallet_size_percentages = [20, 20, 20, 20, 20]  # sum <= 100
-    leverages = [20, 20, 20, 20, 20]  # leverage max. 20 for a new account
+    # Define investment in portfolio.json (wallet IDs, symbols, sizes in
+    # percent with sum <= 100, leverages max. 20 for a new account), changes
+    # are picked up between cycles
     # --------------------------------------------------------------------------
 
     # --------------------------------------------------------------------------
@@ -598,22 +1226,9 @@ if __name__ == '__main__':
     #loseitall.turn_off_dry_run()
     # --------------------------------------------------------------------------
 
-    # Create wallets, and add them to wallet portfolio
-    for idx, wallet_id in enumerate(wallet_ids):
-
-        # Create wallet with id and symbol
-        current_wallet = kelly_wallet(wallet_id, symbols[idx])
-
-        # Add known parameters
-        current_wallet.leverage = leverages[idx]
-        current_wallet.balance = loseitall.calculate_wallet_balance(wallet_size_percentages[idx])
-        current_wallet.initial_balance = current_wallet.balance
-
-        # Add wallet to portfolio
-        loseitall.add_wallet_to_portfolio(current_wallet)
-
-    # Check if account balance is sufficient to host wallets
-    loseitall.check_sufficient_account_balance()
+    # Create wallets from one snapshot of the account, and check if the
+    # account balance is sufficient to host them
+    loseitall.initialize_portfolio()
 
     # --------------------------------------------------------------------------
     # DEBUG INFO
@@ -631,34 +1246,27 @@ if __name__ == '__main__':
     # Go into an endless loop
     while True:
 
+        # Add, retire and resize wallets as defined in portfolio.json
         try:
-            # Log open positions and open orders
-            loseitall.show_open_positions()
-            loseitall.show_open_orders()
-
-            # Get status of all binance orders
-            loseitall.get_futures_all_orders()
-
-            # Update status of all wallets with information from binance
-            loseitall.update_status_of_all_buy_orders()
-            loseitall.update_status_of_all_sell_orders()
-
-            # Print info of all wallet objects in portfolio
-            loseitall.print_info_of_all_wallets()
-
-            # Check status of all current orders, reset them if necessary, and
-            # update wallet
-            loseitall.check_status_of_all_buy_orders()
-            loseitall.check_status_of_all_sell_orders()
-            # SELL_ORDER = FILLED  -> WE WON
-            # SELL_ORDER = EXPIRED -> WE LOST
+            loseitall.reload_portfolio_config()
+        except Exception as error:
+            logger.error('Could not reload portfolio config: %s', error)
 
-            # Place new bets on closed orders
-            loseitall.place_new_kelly_bet_on_closed_orders()
-   
+        # If the order status is known, let every wallet advance through its
+        # lifecycle: check its orders, process wins and losses, and place new
+        # bets. Failed wallets are retried with backoff, the others continue.
+        try:
+            if loseitall.update_api_info():
+                loseitall.run_wallet_lifecycles()
         except Exception as error:
-            error_message = 'CAUGHT AN ERROR IN THE MAIN LOOP !!!'
+            # Anything not caught above, the bot must keep running
+            error_message = 'CAUGHT AN ERROR IN CYCLE !!!'
             print(error_message, error)
             logger.error('%s %s', error_message, error)
 
+        try:
+            loseitall.record_memory_usage()
+        except Exception as error:
+            logger.error('Could not record memory usage: %s', error)
+
         sleep(60)
@@ -1,10 +1,14 @@
 #!/usr/bin/env python3
 
 import sys
+from liquidation_engine import isolated_liquidation_price
 
 
 class kellyBet:
 
+    # Fraction of the wallet balance to bet, see kellyBet()
+    fixed_bet_size_factor = 0.125
+
     def __init__(self, wallet_balance, price_old, multiplier):
         self._wallet_balance = wallet_balance
         self._price_old = price_old
@@ -26,7 +30,7 @@ class kellyBet:
         #         (this is an assumption and would need to be calculated by
         #          analyzing historical data)
         # ==> f = .125 (bet size factor)
-        self._bet_size_factor = 0.125
+        self._bet_size_factor = self.fixed_bet_size_factor
 
         # Calculate trade details:
         self._bet_size = self._wallet_balance*self._bet_size_factor
@@ -51,6 +55,15 @@ class kellyBet:
         self._pnl_win = self._futures_buy * self._price_old * (1/self._leverage-1) + self._price_new * self._futures_buy
         self._pnl_lose = self._futures_buy * self._price_old * (1/self._leverage-1) + self._price_liq * self._futures_buy
 
+    def set_maintenance_margin(self, maint_margin_ratio, maint_amount):
+        # The liquidation price above assumes the whole margin is lost,
+        # Binance liquidates as soon as the maintenance margin is reached
+        self._price_liq = float(isolated_liquidation_price(
+            self._price_old, self._futures_buy, self._asset_total,
+            maint_margin_ratio, maint_amount))
+        self._price_drop_percentage_lose = 100*self._price_liq/self._price_old-100
+        self._pnl_lose = self._futures_buy * self._price_old * (1/self._leverage-1) + self._price_liq * self._futures_buy
+
     def print_pnl(self):
         print(f'PNL WIN:  {self._pnl_win:.2f} ')
         print(f'PNL LOSE: {self._pnl_lose:.2f}')
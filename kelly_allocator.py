@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+import logging
+import numpy as np
+
+logger = logging.getLogger('default_logger')
+
+
+class kelly_allocator:
+
+    def __init__(self, prior_kelly=0.125, prior_weight=20.,
+                 kelly_fraction=0.5, max_total=1., tolerance=1e-7,
+                 max_iterations=1000):
+
+        # Win probability per symbol and gross odds: Beta prior worth
+        # prior_weight bets, updated with every outcome. The prior is the
+        # win probability at which a single bet of prior_kelly is optimal,
+        # i.e. the assumption behind the fixed bet size of kellyBet.
+        self._prior_kelly = prior_kelly
+        self._prior_weight = prior_weight
+        self._wins = {}
+        self._bets = {}
+
+        # Fractional Kelly (0.5: half Kelly, less growth but much less
+        # variance if the win probabilities are overestimated), and maximum
+        # sum of all stakes as fraction of the capital
+        self._kelly_fraction = kelly_fraction
+        self._max_total = max_total
+
+        self._tolerance = tolerance
+        self._max_iterations = max_iterations
+
+        # Last solution per key (wallet ID) and the largest eigenvector of
+        # the last covariance, the next solve starts from them
+        self._solution = {}
+        self._eigenvector = None
+
+    def record_outcome(self, symbol, won):
+        self._wins[symbol] = self._wins.get(symbol, 0) + int(won)
+        self._bets[symbol] = self._bets.get(symbol, 0) + 1
+
+    def load_outcomes(self, history):
+        # history: structured array of load_bet_history()
+        for symbol, outcome in zip(history['symbol'], history['outcome']):
+            if outcome in ('WON', 'LOST'):
+                self.record_outcome(str(symbol), outcome == 'WON')
+
+    def win_probability(self, symbol, gross_odds):
+        # f = p - (1-p)/(b-1) solved for p
+        prior = (self._prior_kelly*(gross_odds-1.)+1.)/gross_odds
+        return ((self._wins.get(symbol, 0) + prior*self._prior_weight) /
+                (self._bets.get(symbol, 0) + self._prior_weight))
+
+    def _project(self, fractions, caps, budget):
+        # Closest point with 0 <= fractions <= caps and sum <= budget: clip,
+        # and if the sum is too large, shift all fractions down by the
+        # same amount (found by bisection)
+        projected = np.clip(fractions, 0., caps)
+        if projected.sum() <= budget:
+            return projected
+        lower, upper = 0., float(fractions.max())
+        for _ in range(60):
+            shift = (lower+upper)/2.
+            if np.clip(fractions-shift, 0., caps).sum() > budget:
+                lower = shift
+            else:
+                upper = shift
+        return np.clip(fractions-upper, 0., caps)
+
+    def _largest_eigenvalue(self, matrix):
+        # Power iteration, started from the last eigenvector
+        n = len(matrix)
+        vector = self._eigenvector
+        if vector is None or len(vector) != n:
+            vector = np.ones(n)/np.sqrt(n)
+        eigenvalue = 0.
+        for _ in range(100):
+            product = matrix @ vector
+            norm = np.linalg.norm(product)
+            if norm == 0.:
+                return 0.
+            vector = product/norm
+            if abs(norm-eigenvalue) <= 1e-6*norm:
+                break
+            eigenvalue = norm
+        self._eigenvector = vector
+        return norm
+
+    def allocate(self, keys, symbols, gross_odds, correlation, caps,
+                 locked=None):
+        # Growth optimal stakes (fractions of the capital, lost if the bet
+        # is lost) of simultaneous bets, one per key:
+        # symbols, gross_odds: of each bet (win: stake*gross_odds back)
+        # correlation: matrix of the outcomes, e.g. of the returns
+        # caps: maximum stake of each bet
+        # locked: stakes of running bets (NaN: bet to be placed), they are
+        #         kept and only count towards risk and max_total
+        #
+        # The expected log growth is approximated by f.mu - f.C.f/2 with
+        # mu the expected return per stake. The variances in C are chosen
+        # so that uncorrelated bets get exactly their single bet Kelly
+        # fraction p-(1-p)/(b-1), correlated bets share it. Maximized with
+        # accelerated projected gradient ascent (FISTA with adaptive
+        # restart), warm started from the last solution, O(n^2) per
+        # iteration.
+        n = len(keys)
+        gross_odds = np.asarray(gross_odds, dtype=float)
+        caps = np.asarray(caps, dtype=float)
+        locked = (np.full(n, np.nan) if locked is None
+                  else np.asarray(locked, dtype=float))
+
+        p = np.array([self.win_probability(symbol, odds)
+                      for symbol, odds in zip(symbols, gross_odds)])
+        net_odds = gross_odds-1.
+        edge = p*net_odds-(1.-p)
+        kelly = p-(1.-p)/net_odds
+        variance = np.where(kelly > 0., edge/np.where(kelly > 0., kelly, 1.),
+                            1.)
+        deviation = np.sqrt(variance)
+        covariance = (np.asarray(correlation, dtype=float) *
+                      np.outer(deviation, deviation))/self._kelly_fraction
+
+        # Only bets to be placed with a positive edge are optimized
+        is_locked = ~np.isnan(locked)
+        free = ~is_locked & (edge > 0.) & (caps > 0.)
+        fractions = np.where(is_locked, locked, 0.)
+        budget = max(self._max_total-fractions.sum(), 0.)
+        if not free.any() or budget == 0.:
+            return dict(zip(keys, fractions.tolist()))
+
+        mu = edge[free]
+        covariance_free = covariance[np.ix_(free, free)]
+        # Gradient contribution of the running bets is constant
+        mu = mu - covariance[np.ix_(free, is_locked)] @ fractions[is_locked]
+        step = 1./max(self._largest_eigenvalue(covariance_free), 1e-12)
+        caps_free = caps[free]
+
+        keys_free = [key for key, is_free in zip(keys, free) if is_free]
+        current = self._project(np.array([self._solution.get(key, 0.)
+                                          for key in keys_free]),
+                                caps_free, budget)
+        momentum = current
+        t = 1.
+        for iteration in range(self._max_iterations):
+            gradient = mu - covariance_free @ momentum
+            following = self._project(momentum+step*gradient, caps_free,
+                                      budget)
+            if np.max(np.abs(following-current)) < self._tolerance:
+                current = following
+                break
+            # Restart the momentum once it leads away from the optimum
+            if gradient @ (following-current) < 0.:
+                t = 1.
+            t_next = (1.+np.sqrt(1.+4.*t*t))/2.
+            momentum = following + (t-1.)/t_next*(following-current)
+            current, t = following, t_next
+
+        logger.debug('Kelly allocation of %d bets solved in %d iterations.',
+                     len(keys_free), iteration+1)
+        fractions[free] = current
+        self._solution = dict(zip(keys_free, current))
+        return dict(zip(keys, fractions.tolist()))
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+import sys
+from itertools import product
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from kellyBet import kellyBet
+
+
+def bet_factors(gross_odds, margin_factor, leverage):
+    # Use the kellyBet formulas on a unit wallet; every quantity scales
+    # linearly with the wallet balance, so the relative win and loss of one
+    # bet are all we need to compound a whole bet sequence:
+    #     win:  balance *= 1 + gain_value/balance
+    #     lose: balance *= 1 - asset_total/balance
+    # (the price does not matter, the leverage only changes the quantities)
+    myBet = kellyBet(1., 1., leverage)
+    myBet.kellyBet(gross_odds, margin_factor)
+    return 1. + myBet._gain_value, 1. - myBet._asset_total
+
+
+def _simulate_chunk(seed, n_paths, n_bets, bets, ruin_fraction, double_factor):
+    # Simulate n_paths bet sequences for every (p, win_factor, lose_factor)
+    # of bets at once. The same random numbers are used for all bets of the
+    # grid (common random numbers), which makes the grid points comparable
+    # and saves drawing them again.
+    #
+    # A balance only depends on the number of wins k and losses t-k so far:
+    #     log(balance_t) = k*log(win_factor) + (t-k)*log(lose_factor)
+    # i.e. a cumulative sum over the bets gives the whole path.
+    rng = np.random.default_rng(seed)
+    random = rng.random((n_paths, n_bets), dtype=np.float32)
+    bet_number = np.arange(1, n_bets+1, dtype=np.int32)
+    log_ruin = np.log(ruin_fraction)
+    log_double = np.log(double_factor)
+
+    results = []
+    for p, win_factor, lose_factor in bets:
+        wins = np.cumsum(random < p, axis=1, dtype=np.int32)
+        log_balance = (wins*np.float32(np.log(win_factor)) +
+                       (bet_number-wins)*np.float32(np.log(lose_factor)))
+
+        # Ruined wallets do not bet anymore, i.e. their balance freezes at
+        # the first bet below the ruin threshold
+        below_ruin = log_balance <= log_ruin
+        ruined = below_ruin.any(axis=1)
+        ruin_bet = np.where(ruined, below_ruin.argmax(axis=1), n_bets-1)
+        balance = np.exp(log_balance[np.arange(n_paths), ruin_bet],
+                         dtype=np.float64)
+
+        # Doubling only counts if it happened before the ruin
+        above_double = log_balance >= log_double
+        double_bet = above_double.argmax(axis=1)
+        doubled = above_double.any(axis=1) & (double_bet <= ruin_bet)
+        bets_to_double = np.where(doubled, double_bet+1., np.inf)
+
+        results.append((balance, ruined, bets_to_double))
+
+    return results
+
+
+class kelly_montecarlo:
+
+    def __init__(self, n_paths=1000000, n_bets=500, ruin_fraction=0.01,
+                 double_factor=2., chunk_size=20000, workers=1, seed=None):
+        self._n_paths = n_paths
+        self._n_bets = n_bets
+        # A wallet is ruined if its balance drops to this fraction of the
+        # initial balance (a bet on such a wallet would be below Binance's
+        # minimum notional anyway)
+        self._ruin_fraction = ruin_fraction
+        self._double_factor = double_factor
+        self._chunk_size = chunk_size
+        # workers > 1 distributes the chunks over a process pool
+        self._workers = workers
+        self._seed_sequence = np.random.SeedSequence(seed)
+
+    def _chunks(self):
+        sizes = [self._chunk_size]*(self._n_paths//self._chunk_size)
+        if self._n_paths % self._chunk_size:
+            sizes.append(self._n_paths % self._chunk_size)
+        return zip(self._seed_sequence.spawn(len(sizes)), sizes)
+
+    def _run_chunks(self, executor, bets):
+        args = [(seed, size, self._n_bets, bets, self._ruin_fraction,
+                 self._double_factor)
+                for seed, size in self._chunks()]
+        if executor is None:
+            return [_simulate_chunk(*arg) for arg in args]
+        return list(executor.map(_simulate_chunk, *zip(*args)))
+
+    def _summarize(self, results, p, gross_odds, margin_factor, leverage):
+        balance = np.concatenate([result[0] for result in results])
+        ruined = np.concatenate([result[1] for result in results])
+        bets_to_double = np.concatenate([result[2] for result in results])
+
+        # Never doubled counts as infinitely late, i.e. the median is only
+        # finite if at least half of all paths doubled the wallet
+        median_bets_to_double = float(np.median(bets_to_double))
+
+        percentiles = np.percentile(balance, [5, 25, 50, 75, 95])
+        return {'p': p,
+                'gross_odds': gross_odds,
+                'margin_factor': margin_factor,
+                'leverage': leverage,
+                'mean': float(balance.mean()),
+                'percentiles': dict(zip([5, 25, 50, 75, 95],
+                                        percentiles.tolist())),
+                'risk_of_ruin': float(ruined.mean()),
+                'median_bets_to_double': median_bets_to_double}
+
+    def simulate(self, p, gross_odds, margin_factor, leverage):
+        # Final balances are relative to the initial wallet balance
+        return self.simulate_grid([p], [gross_odds], [margin_factor],
+                                  [leverage])[0]
+
+    def simulate_grid(self, ps, gross_odds, margin_factors, leverages):
+        grid = list(product(ps, gross_odds, margin_factors, leverages))
+
+        # Different parameters can lead to the same bet (e.g. the leverage
+        # does not change the outcome), simulate every bet only once
+        grid_bets = [(p,) + bet_factors(odds, margin_factor, leverage)
+                     for p, odds, margin_factor, leverage in grid]
+        bets = list(dict.fromkeys(grid_bets))
+
+        executor = None
+        if self._workers > 1:
+            executor = ProcessPoolExecutor(max_workers=self._workers)
+        try:
+            chunks = self._run_chunks(executor, bets)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        results = []
+        for parameters, bet in zip(grid, grid_bets):
+            bet_index = bets.index(bet)
+            results.append(self._summarize([chunk[bet_index]
+                                            for chunk in chunks],
+                                           *parameters))
+        return results
+
+    @staticmethod
+    def print_results(results):
+        print(f'{"p":>5} {"odds":>5} {"margin":>6} {"lev":>4} '
+              f'{"mean":>10} {"p5":>8} {"median":>8} {"p95":>10} '
+              f'{"ruin %":>7} {"2x after":>8}')
+        for result in results:
+            percentiles = result['percentiles']
+            print(f'{result["p"]:5.2f} {result["gross_odds"]:5.2f} '
+                  f'{result["margin_factor"]:6.2f} {result["leverage"]:4g} '
+                  f'{result["mean"]:10.3g} {percentiles[5]:8.3g} '
+                  f'{percentiles[50]:8.3g} {percentiles[95]:10.3g} '
+                  f'{100*result["risk_of_ruin"]:7.2f} '
+                  f'{result["median_bets_to_double"]:8g}')
+
+
+if __name__ == '__main__':
+
+    # Usage: kelly_montecarlo.py <n_paths> <n_bets> [<workers>]
+    simulation = kelly_montecarlo(n_paths=int(sys.argv[1]),
+                                  n_bets=int(sys.argv[2]),
+                                  workers=int(sys.argv[3])
+                                  if len(sys.argv) > 3 else 1)
+
+    # --------------------------------------------------------------------------
+    # Parameter grid, cf. add_bet_parameters_to_wallet() in get-rich-quick-scheme.py
+    ps = [0.7, 0.75, 0.8, 0.85]
+    gross_odds = [1.1, 1.2, 1.4, 3.5]
+    margin_factors = [1.0, 2.0, 5.0]
+    leverages = [20]
+    # --------------------------------------------------------------------------
+
+    simulation.print_results(simulation.simulate_grid(ps, gross_odds,
+                                                      margin_factors,
+                                                      leverages))
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 from datetime import datetime
+from wallet_lifecycle import NEW_OR_RESETED
 
 
 class kelly_wallet:
@@ -14,6 +15,9 @@ class kelly_wallet:
         # win case price not stored yet -> get_filled_order_avg_price(current_wallet)        
         self._liquidation_price = -1 # lose case price
         self._margin_added = -1
+        self._bet_open_time = -1 # ms since epoch, when the bet was placed
+        self._bet_sequence = 0 # number of the current bet of this wallet
+        self._client_order_salt = '' # part of the client order IDs
         self._buy_order_id = -1
         self._buy_order_status = 'none'
         self._buy_order_executed_quantity = -1
@@ -21,20 +25,48 @@ class kelly_wallet:
         self._sell_order_status = 'none'
         self._sell_order_executed_quantity = -1
         self._symbol_no_usdt = self.get_symbol_without_usdt()
+        self._status = NEW_OR_RESETED # state in wallet lifecycle
+        self._bet = None # kellyBet of the current bet
+        self._failures = 0 # failed attempts in the current state
+        self._retry_time = 0 # do not retry before this time (s since epoch)
 
     def get_symbol_without_usdt(self):
         return(self._symbol.replace('USDT',''))
     
+    def client_order_id(self, side):
+        # Deterministic order ID for the current bet, e.g. kelly_111_42_buy
+        # or with salt kelly_3fa8c1_111_42_buy, used to find the order again
+        # after a timeout or restart
+        salt = f'{self._client_order_salt}_' if self._client_order_salt else ''
+        return (f'kelly_{salt}{self._wallet_id}_{self._bet_sequence}_'
+                f'{side.lower()}')
+
     def reset_sell_order_id(self):
         self._sell_order_id = -1
 
     def reset_buy_order_id(self):
         self._buy_order_id = -1
 
+    def reset(self):
+        # Forget everything about the last bet
+        self._entry_price = -1
+        self._liquidation_price = -1
+        self._margin_added = -1
+        self._bet_open_time = -1
+        self._buy_order_id = -1
+        self._buy_order_status = 'none'
+        self._buy_order_executed_quantity = -1
+        self._sell_order_id = -1
+        self._sell_order_status = 'none'
+        self._sell_order_executed_quantity = -1
+        self._bet = None
+        self._status = NEW_OR_RESETED
+
     def print_wallet_info(self):
 
         print('---------------------------------')
         print(f'WALLET INFO FOR ID {self._wallet_id}    {self._symbol}')
+        print(f'status: {self._status}')
         print(f'printtime:    {datetime.now().strftime("%d/%m/%Y %H:%M:%S")}')
         print(f'current balance: {self._balance:.2f} USDT')
         print(f'initial balance: {self._initial_balance:.2f} USDT')
@@ -43,6 +75,7 @@ class kelly_wallet:
         print(f'entry price: {self._entry_price}')
         print(f'liquidation_price: {self._liquidation_price}')
         print(f'margin added: {self._margin_added}')
+        print(f'bet sequence: {self._bet_sequence}')
         print(f'buy order id: {self._buy_order_id}')
         print(f'buy order status: {self._buy_order_status}')
         print(f'sell order id: {self._sell_order_id}')
@@ -79,6 +112,34 @@ class kelly_wallet:
     def margin_added(self):
         return self._margin_added
 
+    @property
+    def bet_open_time(self):
+        return self._bet_open_time
+
+    @property
+    def status(self):
+        return self._status
+
+    @property
+    def bet(self):
+        return self._bet
+
+    @property
+    def failures(self):
+        return self._failures
+
+    @property
+    def retry_time(self):
+        return self._retry_time
+
+    @property
+    def bet_sequence(self):
+        return self._bet_sequence
+
+    @property
+    def client_order_salt(self):
+        return self._client_order_salt
+
     @property
     def buy_order_id(self):
         return self._buy_order_id
@@ -130,6 +191,34 @@ class kelly_wallet:
     def margin_added(self, margin_added):
         self._margin_added = margin_added
 
+    @bet_open_time.setter
+    def bet_open_time(self, bet_open_time):
+        self._bet_open_time = bet_open_time
+
+    @status.setter
+    def status(self, status):
+        self._status = status
+
+    @bet.setter
+    def bet(self, bet):
+        self._bet = bet
+
+    @failures.setter
+    def failures(self, failures):
+        self._failures = failures
+
+    @retry_time.setter
+    def retry_time(self, retry_time):
+        self._retry_time = retry_time
+
+    @bet_sequence.setter
+    def bet_sequence(self, bet_sequence):
+        self._bet_sequence = bet_sequence
+
+    @client_order_salt.setter
+    def client_order_salt(self, client_order_salt):
+        self._client_order_salt = client_order_salt
+
     @buy_order_id.setter
     def buy_order_id(self, buy_order_id):
         self._buy_order_id = buy_order_id
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import logging
+from time import time
+import numpy as np
+
+logger = logging.getLogger('default_logger')
+
+
+def isolated_liquidation_price(entry_price, quantity, isolated_wallet,
+                               maint_margin_ratio, maint_amount):
+    # Liquidation price of an isolated position in one-way mode, see
+    # https://www.binance.com/en/support/faq/b3c689c1f50a44cabb3a84e663b81d93
+    #
+    #     LP = (WB + cum - side*|Q|*EP) / (|Q|*MMR - side*|Q|)
+    #
+    # where WB is the isolated wallet balance (initial plus added margin),
+    # cum the maintenance amount and MMR the maintenance margin ratio of the
+    # position's bracket, side +1 for long and -1 for short positions.
+    # Works on floats as well as on numpy arrays (quantity < 0: short).
+    side = np.sign(quantity)
+    size = np.abs(quantity)
+    return ((isolated_wallet + maint_amount - side*size*entry_price) /
+            (size*maint_margin_ratio - side*size))
+
+
+class liquidation_engine:
+
+    # Reload maintenance margin brackets after this many seconds
+    _brackets_max_age = 3600
+
+    def __init__(self, api, tolerance=0.001):
+        self._api = api
+
+        # Warn if the local and the Binance liquidation price differ by more
+        # than this (relative) tolerance
+        self._tolerance = tolerance
+
+        # symbol: (notional floors, maintenance margin ratios, cum amounts)
+        self._brackets = {}
+        self._brackets_time = 0
+
+    def _load_brackets(self):
+        if time()-self._brackets_time < self._brackets_max_age:
+            return
+        self._brackets = {}
+        for symbol_brackets in self._api.get_leverage_brackets():
+            brackets = sorted(symbol_brackets['brackets'],
+                              key=lambda bracket: bracket['notionalFloor'])
+            self._brackets[symbol_brackets['symbol']] = (
+                np.array([bracket['notionalFloor'] for bracket in brackets],
+                         dtype=float),
+                np.array([bracket['maintMarginRatio'] for bracket in brackets],
+                         dtype=float),
+                np.array([bracket['cum'] for bracket in brackets],
+                         dtype=float))
+        self._brackets_time = time()
+
+    def maintenance_margin(self, symbols, notionals):
+        # Maintenance margin ratio and amount of the brackets the notionals
+        # fall into
+        self._load_brackets()
+        symbols = np.atleast_1d(symbols)
+        notionals = np.abs(np.atleast_1d(np.asarray(notionals, dtype=float)))
+        ratios = np.empty(len(symbols))
+        amounts = np.empty(len(symbols))
+        for symbol in np.unique(symbols):
+            selection = symbols == symbol
+            floors, symbol_ratios, symbol_amounts = self._brackets[symbol]
+            index = np.searchsorted(floors, notionals[selection],
+                                    side='right')-1
+            ratios[selection] = symbol_ratios[index]
+            amounts[selection] = symbol_amounts[index]
+        return ratios, amounts
+
+    def liquidation_prices(self, symbols, entry_prices, quantities,
+                           isolated_wallets):
+        entry_prices = np.asarray(entry_prices, dtype=float)
+        quantities = np.asarray(quantities, dtype=float)
+        ratios, amounts = self.maintenance_margin(symbols,
+                                                  entry_prices*quantities)
+        return isolated_liquidation_price(entry_prices, quantities,
+                                          np.asarray(isolated_wallets,
+                                                     dtype=float),
+                                          ratios, amounts)
+
+    def wallet_liquidation_price(self, wallet):
+        entry_price = wallet.entry_price
+        quantity = wallet.buy_order_executed_quantity
+        isolated_wallet = (entry_price*quantity/wallet.leverage +
+                           max(wallet.margin_added, 0.))
+        return float(self.liquidation_prices([wallet.symbol], [entry_price],
+                                             [quantity],
+                                             [isolated_wallet])[0])
+
+    def verify(self, positions):
+        # Cross check the local liquidation prices of open positions
+        # (futures_position records) with Binance's
+        positions = [position for position in positions
+                     if position.margin_type == 'ISOLATED']
+        if not positions:
+            return np.empty(0)
+
+        liquidation_prices = self.liquidation_prices(
+            [position.symbol for position in positions],
+            [position.entry_price for position in positions],
+            [position.position_amt for position in positions],
+            [position.isolated_wallet for position in positions])
+        binance_prices = np.array([position.liquidation_price
+                                   for position in positions], dtype=float)
+
+        deviations = np.abs(liquidation_prices/binance_prices-1.)
+        for position, price, deviation in zip(positions, liquidation_prices,
+                                              deviations):
+            if deviation > self._tolerance:
+                logger.warning('Local liquidation price of %s differs from '
+                               'Binance: %s vs. %s (%.2f %%).',
+                               position.symbol, price,
+                               position.liquidation_price, 100*deviation)
+        return deviations
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+import sys
+import logging
+from time import time, sleep
+from api.binance.binance_api import binance_api
+from api.binance.market_data_bus import market_data_writer
+
+logger = logging.getLogger('default_logger')
+
+
+class market_data_feed:
+
+    def __init__(self, interval=5., metadata_interval=3600., path=None):
+        # Fetch mark prices every interval seconds, exchange info every
+        # metadata_interval seconds, and publish them for all bot processes
+        # on this host. Only public market data: the bots may trade on
+        # different accounts (leverage brackets are per account, every bot
+        # requests its own).
+        self._api = binance_api()
+        self._bus = market_data_writer(path)
+        self._interval = interval
+        self._metadata_interval = metadata_interval
+        self._metadata_time = 0
+
+        logger.info('Publish market data on %s.', self._bus.path)
+
+    def publish_prices(self):
+        self._bus.publish_prices(self._api.get_futures_market_prices())
+
+    def publish_metadata(self):
+        self._bus.publish_metadata({
+            'time': time(),
+            'exchange_info': self._api.client.futures_exchange_info()})
+        self._metadata_time = time()
+
+    def run(self):
+        while True:
+            start = time()
+            try:
+                if start-self._metadata_time > self._metadata_interval:
+                    self.publish_metadata()
+                self.publish_prices()
+            except Exception as error:
+                # The bots fall back to their own requests once the data
+                # is older than binance_api._market_data_max_age
+                logger.error('Could not publish market data: %s', error)
+            sleep(max(self._interval-(time()-start), 0.))
+
+
+if __name__ == '__main__':
+
+    # Usage: market_data_feed.py [<interval in s>]
+    # Start before the bots, see also get_rich_quick_scheme.__init__()
+    logging.basicConfig(level=logging.INFO,
+                        format='%(levelname)-8s - %(asctime)s - %(message)s')
+    feed = market_data_feed(*[float(arg) for arg in sys.argv[1:2]])
+    feed.run()
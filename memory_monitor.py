@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import logging
+import tracemalloc
+from time import time
+from collections import deque
+
+logger = logging.getLogger('default_logger')
+
+
+def resident_memory():
+    # Current resident set size (bytes), peak RSS where /proc is missing
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1])*os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kB on Linux, bytes on macOS
+        return peak if sys.platform == 'darwin' else peak*1024
+
+
+def _slope(values):
+    # Least squares slope (per cycle) and coefficient of determination
+    n = len(values)
+    mean_x = (n-1)/2.
+    mean_y = sum(values)/n
+    sxx = sum((x-mean_x)**2 for x in range(n))
+    sxy = sum((x-mean_x)*(y-mean_y) for x, y in enumerate(values))
+    syy = sum((y-mean_y)**2 for y in values)
+    slope = sxy/sxx
+    r2 = sxy*sxy/(sxx*syy) if syy > 0. else 0.
+    return slope, r2
+
+
+class memory_monitor:
+
+    def __init__(self, output_file='memory_profile.jsonl', top=5,
+                 trend_cycles=60, min_growth=8*1024*1024, min_r2=0.8,
+                 frames=1):
+
+        # One JSON line per cycle: RSS, traced memory, and the allocation
+        # sites (file:line) which grew most since the last cycle
+        self._output_file = output_file
+        self._top = top
+
+        # Warn if RSS grew by more than min_growth bytes over the last
+        # trend_cycles cycles, and the growth is steady (a linear fit
+        # explains at least min_r2 of the variance, i.e. not a single jump)
+        self._trend_cycles = trend_cycles
+        self._min_growth = min_growth
+        self._min_r2 = min_r2
+        self._rss = deque(maxlen=trend_cycles)
+        self._times = deque(maxlen=trend_cycles)
+        self._cycles_since_warning = trend_cycles
+
+        # Tracing costs some memory and speed, frames=1 keeps it small
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+                         tracemalloc.Filter(False, __file__),
+                         tracemalloc.Filter(False, '<frozen importlib.*'),
+                         tracemalloc.Filter(False, '<unknown>')]
+        self._snapshot = None
+        self._cycle = 0
+        # Snapshots of every trend_cycles cycles, the older one shows what
+        # grew over (at least) the whole trend window
+        self._baselines = deque(maxlen=2)
+
+    def _top_growth(self, snapshot, baseline):
+        if baseline is None:
+            return []
+        stats = snapshot.compare_to(baseline, 'lineno')
+        return [[f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}',
+                 stat.size_diff, stat.count_diff, stat.size]
+                for stat in stats[:self._top] if stat.size_diff > 0]
+
+    def record(self):
+        # Call once per cycle
+        self._cycle += 1
+        snapshot = tracemalloc.take_snapshot().filter_traces(self._filters)
+        traced, peak = tracemalloc.get_traced_memory()
+        rss = resident_memory()
+        top = self._top_growth(snapshot, self._snapshot)
+        self._snapshot = snapshot
+        if self._cycle % self._trend_cycles == 1:
+            self._baselines.append(snapshot)
+
+        with open(self._output_file, 'a') as output_file:
+            output_file.write(json.dumps({'time': int(time()),
+                                          'cycle': self._cycle,
+                                          'rss': rss,
+                                          'traced': traced,
+                                          'peak': peak,
+                                          'top': top},
+                                         separators=(',', ':')) + '\n')
+
+        self._rss.append(rss)
+        self._times.append(time())
+        self._check_trend(snapshot)
+        return rss
+
+    def _check_trend(self, snapshot):
+        self._cycles_since_warning += 1
+        if (len(self._rss) < self._trend_cycles or
+                self._cycles_since_warning < self._trend_cycles):
+            return
+        slope, r2 = _slope(list(self._rss))
+        growth = slope*(self._trend_cycles-1)
+        if growth < self._min_growth or r2 < self._min_r2:
+            return
+
+        hours = (self._times[-1]-self._times[0])/3600.
+        top = self._top_growth(snapshot, self._baselines[0])
+        logger.warning('Memory grows steadily: RSS +%.1f MB over the last %d '
+                       'cycles (%.1f MB/h), now %.1f MB. Top growing sites: '
+                       '%s (details in %s)', growth/2**20,
+                       self._trend_cycles,
+                       growth/2**20/hours if hours > 0. else 0.,
+                       self._rss[-1]/2**20,
+                       ', '.join(f'{site} +{size_diff/2**10:.0f} kB'
+                                 for site, size_diff, *_ in top[:3])
+                       or 'none', self._output_file)
+        self._cycles_since_warning = 0
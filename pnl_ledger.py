@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import logging
+from decimal import Decimal
+from time import time
+
+logger = logging.getLogger('default_logger')
+
+
+class pnl_ledger:
+
+    # Maximum number of entries per API response
+    _limit = 1000
+
+    # Maximum time range of a trade request by time (ms), 7 days
+    _trade_window = 7*24*3600*1000
+
+    def __init__(self, api, state_file='pnl_ledger.json'):
+
+        self._api = api
+        self._state_file = state_file
+
+        # Wallet lookup: a trade is attributed to the wallet that placed the
+        # order, funding to the wallet trading the symbol
+        self._symbol_wallets = {}
+        self._order_wallets = {}
+        # Orders of finished bets, dropped from the lookup after the next
+        # update has booked their last trades
+        self._released_orders = []
+
+        # Per endpoint cursors, so every update only downloads new entries:
+        # trades:  next trade ID per symbol, and until the first trade of a
+        #          symbol is found, the start of the next time window
+        # funding: time of the last entry and the IDs seen at that time
+        #          (startTime is inclusive, entries at that time are
+        #          downloaded again and have to be skipped)
+        now = int(time()*1000)
+        self._trade_cursors = {}
+        self._trade_start_times = {}
+        self._funding_cursor = {'time': now, 'ids': []}
+        self._start_time = now
+
+        # Running totals (exact decimals, as sent by Binance)
+        self._wallet_totals = {}
+        self._symbol_totals = {}
+
+        # USDT price per commission asset other than USDT (e.g. BNB), from
+        # the mark price of <asset>USDT, requested once per update
+        self._asset_prices = {}
+
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self._state_file):
+            return
+        with open(self._state_file) as state_file:
+            state = json.load(state_file)
+        self._start_time = state['start_time']
+        self._trade_cursors = state['trade_cursors']
+        self._trade_start_times = state.get('trade_start_times', {})
+        self._funding_cursor = state['funding_cursor']
+        self._order_wallets = {int(order_id): wallet_id for order_id, wallet_id
+                               in state['order_wallets'].items()}
+        self._released_orders = state.get('released_orders', [])
+        self._wallet_totals = {int(wallet_id): self._decode_totals(totals)
+                               for wallet_id, totals
+                               in state['wallet_totals'].items()}
+        self._symbol_totals = {symbol: self._decode_totals(totals)
+                               for symbol, totals
+                               in state['symbol_totals'].items()}
+
+    def save(self):
+        state = {'start_time': self._start_time,
+                 'trade_cursors': self._trade_cursors,
+                 'trade_start_times': self._trade_start_times,
+                 'funding_cursor': self._funding_cursor,
+                 'order_wallets': self._order_wallets,
+                 'released_orders': self._released_orders,
+                 'wallet_totals': {wallet_id: self._encode_totals(totals)
+                                   for wallet_id, totals
+                                   in self._wallet_totals.items()},
+                 'symbol_totals': {symbol: self._encode_totals(totals)
+                                   for symbol, totals
+                                   in self._symbol_totals.items()}}
+        # Write to a temporary file first, a crash must not corrupt the state
+        with open(self._state_file + '.tmp', 'w') as state_file:
+            json.dump(state, state_file)
+        os.replace(self._state_file + '.tmp', self._state_file)
+
+    @staticmethod
+    def _new_totals():
+        return {'realized_pnl': Decimal(0),
+                'commission': Decimal(0),
+                'funding': Decimal(0)}
+
+    @staticmethod
+    def _encode_totals(totals):
+        return {key: str(value) for key, value in totals.items()}
+
+    @staticmethod
+    def _decode_totals(totals):
+        return {key: Decimal(value) for key, value in totals.items()}
+
+    def register_wallet(self, wallet):
+        self._symbol_wallets[wallet.symbol] = wallet.wallet_id
+
+    def register_order(self, order_id, wallet):
+        self._order_wallets[order_id] = wallet.wallet_id
+
+    def release_orders(self, wallet):
+        # The bet of the wallet is over, its orders are not needed after
+        # the next update
+        self._released_orders.extend(
+            order_id for order_id, wallet_id in self._order_wallets.items()
+            if wallet_id == wallet.wallet_id and
+            order_id not in self._released_orders)
+
+    def _book(self, wallet_id, symbol, key, amount):
+        if wallet_id is not None:
+            totals = self._wallet_totals.setdefault(wallet_id,
+                                                    self._new_totals())
+            totals[key] += amount
+        totals = self._symbol_totals.setdefault(symbol, self._new_totals())
+        totals[key] += amount
+
+    def _book_trade(self, trade):
+        symbol = trade['symbol']
+        wallet_id = self._order_wallets.get(trade['orderId'],
+                                            self._symbol_wallets.get(symbol))
+
+        # Commissions in other assets (e.g. BNB) are converted with the
+        # current mark price, before anything of the trade is booked
+        commission = Decimal(trade['commission'])
+        asset = trade['commissionAsset']
+        if asset != 'USDT':
+            price = self._asset_price(asset)
+            if price is None:
+                logger.warning('Commission of trade %s paid in %s, no USDT '
+                               'price, not booked.', trade['id'], asset)
+                commission = None
+            else:
+                commission *= price
+
+        self._book(wallet_id, symbol, 'realized_pnl',
+                   Decimal(trade['realizedPnl']))
+        if commission is not None:
+            self._book(wallet_id, symbol, 'commission', commission)
+
+    def _asset_price(self, asset):
+        # None if Binance has no mark price of the asset in USDT, other
+        # errors abort the update, it continues from this trade next time
+        from binance.exceptions import BinanceAPIException
+        if asset not in self._asset_prices:
+            try:
+                self._asset_prices[asset] = Decimal(str(
+                    self._api.get_futures_market_price(asset + 'USDT')))
+            except BinanceAPIException as error:
+                logger.warning('No USDT price of %s: %s', asset, error)
+                self._asset_prices[asset] = None
+        return self._asset_prices[asset]
+
+    def _update_trades(self, symbol):
+        new_trades = 0
+        while True:
+            if symbol in self._trade_cursors:
+                trades = self._api.get_futures_account_trades(
+                    symbol, from_id=self._trade_cursors[symbol],
+                    limit=self._limit)
+            else:
+                # Search forward one window at a time, a request by time
+                # only covers 7 days (e.g. a wallet added later has no
+                # trades right after the ledger was created)
+                start_time = self._trade_start_times.get(symbol,
+                                                         self._start_time)
+                end_time = start_time+self._trade_window-1
+                trades = self._api.get_futures_account_trades(
+                    symbol, start_time=start_time, end_time=end_time,
+                    limit=self._limit)
+                if not trades:
+                    if end_time >= int(time()*1000):
+                        return new_trades
+                    self._trade_start_times[symbol] = end_time+1
+                    continue
+                self._trade_start_times.pop(symbol, None)
+
+            for trade in trades:
+                self._book_trade(trade)
+                self._trade_cursors[symbol] = trade['id']+1
+            new_trades += len(trades)
+
+            if len(trades) < self._limit:
+                return new_trades
+
+    def _update_funding(self):
+        new_entries = 0
+        while True:
+            entries = self._api.get_futures_income_history(
+                'FUNDING_FEE', self._funding_cursor['time'], limit=self._limit)
+
+            skipped = 0
+            for entry in entries:
+                if (entry['time'] == self._funding_cursor['time'] and
+                        entry['tranId'] in self._funding_cursor['ids']):
+                    skipped += 1
+                    continue
+
+                symbol = entry['symbol']
+                self._book(self._symbol_wallets.get(symbol), symbol,
+                           'funding', Decimal(entry['income']))
+
+                if entry['time'] != self._funding_cursor['time']:
+                    self._funding_cursor = {'time': entry['time'], 'ids': []}
+                self._funding_cursor['ids'].append(entry['tranId'])
+            new_entries += len(entries)-skipped
+
+            if len(entries) < self._limit or skipped == len(entries):
+                return new_entries
+
+    def update(self):
+        # Orders released before this update are dropped after it
+        released_orders = len(self._released_orders)
+        self._asset_prices = {}
+        trade_start_times = dict(self._trade_start_times)
+        new_entries = 0
+        for symbol in self._symbol_wallets:
+            new_entries += self._update_trades(symbol)
+        new_entries += self._update_funding()
+
+        for order_id in self._released_orders[:released_orders]:
+            self._order_wallets.pop(order_id, None)
+        del self._released_orders[:released_orders]
+
+        if (new_entries or released_orders or
+                trade_start_times != self._trade_start_times):
+            logger.info('Booked %d new ledger entries.', new_entries)
+            self.save()
+
+        return new_entries
+
+    def _net(self, totals):
+        # Commissions are positive amounts paid, funding is signed income
+        if totals is None:
+            return 0.
+        return float(totals['realized_pnl'] - totals['commission'] +
+                     totals['funding'])
+
+    def wallet_pnl(self, wallet_id):
+        return self._net(self._wallet_totals.get(wallet_id))
+
+    def symbol_pnl(self, symbol):
+        return self._net(self._symbol_totals.get(symbol))
+
+    def print_ledger_info(self):
+        print('---------------------------------')
+        print('PNL LEDGER (incl. fees and funding)')
+        for wallet_id, totals in sorted(self._wallet_totals.items()):
+            print(f'wallet {wallet_id}: '
+                  f'realized pnl {float(totals["realized_pnl"]):.4f} '
+                  f'commission {float(totals["commission"]):.4f} '
+                  f'funding {float(totals["funding"]):.4f} '
+                  f'--> net {self._net(totals):.4f} USDT')
+        for symbol, totals in sorted(self._symbol_totals.items()):
+            print(f'{symbol}: net {self._net(totals):.4f} USDT')
+        print('---------------------------------')
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import logging
+
+logger = logging.getLogger('default_logger')
+
+# Keys of a wallet in the config file, gross_odds and margin_factor are
+# optional (null: suggested from the volatility of the symbol)
+WALLET_KEYS = ('wallet_id', 'symbol', 'size_percentage', 'leverage')
+BET_KEYS = ('gross_odds', 'margin_factor')
+
+
+def parse_portfolio_config(config):
+    # {wallet_id: wallet config} from the content of a config file, e.g.
+    # {"wallets": [{"wallet_id": 111, "symbol": "BTCUSDT",
+    #               "size_percentage": 20, "leverage": 20,
+    #               "gross_odds": null, "margin_factor": null}, ...]}
+    wallets = {}
+    for wallet in config['wallets']:
+        missing = [key for key in WALLET_KEYS if key not in wallet]
+        if missing:
+            raise ValueError(f'Wallet {wallet} misses {", ".join(missing)}.')
+        wallet_id = int(wallet['wallet_id'])
+        if wallet_id in wallets:
+            raise ValueError(f'Wallet ID {wallet_id} is not unique.')
+        if int(wallet['leverage']) < 1:
+            raise ValueError(f'Leverage of wallet {wallet_id} is < 1.')
+        if float(wallet['size_percentage']) <= 0.:
+            raise ValueError(f'Size of wallet {wallet_id} is <= 0 %.')
+        # The Kelly bet size needs gross odds > 1 (a win pays more than the
+        # stake), and the added margin margin_factor-1 can not be negative
+        gross_odds = wallet.get('gross_odds')
+        if gross_odds is not None and not float(gross_odds) > 1.:
+            raise ValueError(f'Gross odds of wallet {wallet_id} are <= 1.')
+        margin_factor = wallet.get('margin_factor')
+        if margin_factor is not None and not float(margin_factor) >= 1.:
+            raise ValueError(f'Margin factor of wallet {wallet_id} is < 1.')
+        wallets[wallet_id] = {
+            'wallet_id': wallet_id,
+            'symbol': wallet['symbol'],
+            'size_percentage': float(wallet['size_percentage']),
+            'leverage': int(wallet['leverage']),
+            'gross_odds': (None if gross_odds is None
+                           else float(gross_odds)),
+            'margin_factor': (None if margin_factor is None
+                              else float(margin_factor))}
+
+    total = sum(wallet['size_percentage'] for wallet in wallets.values())
+    if total > 100.:
+        raise ValueError(f'Wallet sizes add up to {total} % > 100 %.')
+    return wallets
+
+
+class portfolio_config:
+
+    def __init__(self, config_file='portfolio.json'):
+        self._config_file = config_file
+        # Modification time and size of the last loaded version
+        self._version = None
+        self._wallets = {}
+        # Symbol of every wallet ID loaded so far: a wallet keeps its symbol
+        # (and its orders, bet sequence and ledger), also if it is removed
+        # and added again
+        self._symbols = {}
+
+    @property
+    def wallets(self):
+        return self._wallets
+
+    def wallet(self, wallet_id):
+        # Config of a wallet, None if it was removed from the config file
+        return self._wallets.get(wallet_id)
+
+    def reload(self):
+        # Load the config file if it changed since the last call (polled once
+        # per cycle, a stat call is cheap). Returns True if the wallets
+        # changed. An invalid file (e.g. saved half-way) is logged and the
+        # previous config stays active until the file is fixed.
+        stat = os.stat(self._config_file)
+        version = (stat.st_mtime_ns, stat.st_size)
+        if version == self._version:
+            return False
+
+        try:
+            with open(self._config_file) as config_file:
+                wallets = parse_portfolio_config(json.load(config_file))
+            for wallet_id, wallet in wallets.items():
+                symbol = self._symbols.get(wallet_id, wallet['symbol'])
+                if wallet['symbol'] != symbol:
+                    raise ValueError(f'Wallet {wallet_id} trades {symbol}, '
+                                     'use a new wallet ID for '
+                                     f'{wallet["symbol"]}.')
+        except (ValueError, KeyError, TypeError) as error:
+            logger.error('Invalid portfolio config %s, keep the previous '
+                         'one: %s', self._config_file, error)
+            return False
+
+        self._version = version
+        self._symbols.update((wallet_id, wallet['symbol'])
+                             for wallet_id, wallet in wallets.items())
+        if wallets == self._wallets:
+            return False
+        logger.info('Loaded portfolio config %s with %d wallets.',
+                    self._config_file, len(wallets))
+        self._wallets = wallets
+        return True
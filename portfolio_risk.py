@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+import logging
+from math import erf, exp, pi, sqrt
+import numpy as np
+
+logger = logging.getLogger('default_logger')
+
+
+def normal_pdf(z):
+    return exp(-z*z/2.)/sqrt(2.*pi)
+
+
+def normal_quantile(p):
+    # Inverse of the standard normal CDF (statistics.NormalDist needs
+    # Python 3.8), Newton's method on 0.5*(1+erf(z/sqrt(2))) = p
+    if not 0. < p < 1.:
+        raise ValueError('Probability must be in (0, 1).')
+    z = 0.
+    for _ in range(100):
+        step = (0.5*(1.+erf(z/sqrt(2.)))-p)/normal_pdf(z)
+        z -= step
+        if abs(step) < 1e-12:
+            break
+    return z
+
+
+class portfolio_risk:
+
+    def __init__(self, symbols, window=1440, min_samples=60, confidence=0.99,
+                 horizon=1440, max_var=None):
+
+        # Symbols of all wallets, in the order of the exposure vectors
+        self._symbols = list(symbols)
+        self._index = {symbol: idx for idx, symbol in enumerate(self._symbols)}
+        k = len(self._symbols)
+
+        # Rolling window of the last log returns (one row per update), and
+        # running sums over it, so an update costs O(k^2) instead of
+        # recomputing the covariance from the whole history
+        self._window = window
+        self._returns = np.zeros((window, k))
+        self._count = 0
+        self._sum = np.zeros(k)
+        self._cross = np.zeros((k, k))
+        self._last_prices = None
+
+        # Don't veto bets until the covariance is somewhat reliable
+        self._min_samples = min_samples
+
+        # VaR and ES at this confidence over this many updates (cycles),
+        # 1440 cycles of 60 s are one day
+        self._confidence = confidence
+        self._horizon = horizon
+        self._z = normal_quantile(confidence)
+        self._es_factor = normal_pdf(self._z)/(1.-confidence)
+
+        # Maximum VaR (USDT) of the portfolio including a new bet
+        self._max_var = max_var
+
+        self._var = 0.
+        self._es = 0.
+
+    @property
+    def samples(self):
+        return min(self._count, self._window)
+
+    @property
+    def var(self):
+        return self._var
+
+    @property
+    def es(self):
+        return self._es
+
+    @property
+    def max_var(self):
+        return self._max_var
+
+    @max_var.setter
+    def max_var(self, max_var):
+        self._max_var = max_var
+
+    def add_symbol(self, symbol):
+        # For wallets added at runtime. The returns of the new symbol in the
+        # current window are unknown and taken as 0, i.e. its variance is
+        # underestimated until the window is filled with real returns.
+        if symbol in self._index:
+            return
+        self._index[symbol] = len(self._symbols)
+        self._symbols.append(symbol)
+        self._returns = np.hstack([self._returns,
+                                   np.zeros((self._window, 1))])
+        self._sum = np.append(self._sum, 0.)
+        self._cross = np.pad(self._cross, ((0, 1), (0, 1)))
+        # Returns of the new symbol start with the next price
+        self._last_prices = None
+
+    def update(self, prices):
+        # prices: {symbol: price} containing at least all symbols
+        prices = np.array([prices[symbol] for symbol in self._symbols],
+                          dtype=float)
+        if self._last_prices is not None:
+            self._add_returns(np.log(prices/self._last_prices))
+        self._last_prices = prices
+
+    def _add_returns(self, returns):
+        slot = self._count % self._window
+        if self._count >= self._window:
+            oldest = self._returns[slot]
+            self._sum -= oldest
+            self._cross -= np.outer(oldest, oldest)
+        self._returns[slot] = returns
+        self._sum += returns
+        self._cross += np.outer(returns, returns)
+        self._count += 1
+
+    def covariance(self):
+        # Sample covariance of the returns per update
+        n = self.samples
+        if n < 2:
+            return np.zeros_like(self._cross)
+        mean = self._sum/n
+        return (self._cross - n*np.outer(mean, mean))/(n-1)
+
+    def correlation(self, symbols):
+        # Correlation matrix of the returns of symbols (may repeat), until
+        # there are min_samples returns only the same symbols are correlated
+        if self.samples < self._min_samples:
+            # (np.equal.outer on strings needs numpy 1.25)
+            return np.array([[symbol_a == symbol_b for symbol_b in symbols]
+                             for symbol_a in symbols], dtype=float)
+        covariance = self.covariance()
+        deviation = np.sqrt(np.diag(covariance))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            correlation = covariance/np.outer(deviation, deviation)
+        correlation[~np.isfinite(correlation)] = 0.
+        np.fill_diagonal(correlation, 1.)
+        index = [self._index[symbol] for symbol in symbols]
+        return correlation[np.ix_(index, index)]
+
+    def exposure_vector(self, exposures):
+        # exposures: {symbol: notional (USDT), negative for short positions}
+        vector = np.zeros(len(self._symbols))
+        for symbol, notional in exposures.items():
+            vector[self._index[symbol]] += notional
+        return vector
+
+    def _sigma(self, vector, covariance):
+        # Standard deviation of the portfolio value over the horizon
+        return np.sqrt(max(vector @ covariance @ vector, 0.)*self._horizon)
+
+    def publish(self, exposures):
+        # (Gaussian) VaR and expected shortfall of the current positions
+        sigma = self._sigma(self.exposure_vector(exposures),
+                            self.covariance())
+        self._var = self._z*sigma
+        self._es = self._es_factor*sigma
+        logger.info('Portfolio VaR(%.1f %%): %.2f, ES: %.2f (%d samples).',
+                    100*self._confidence, self._var, self._es, self.samples)
+        return self._var, self._es
+
+    def bet_scale(self, exposures, symbol, notional):
+        # Factor (0..1) by which a new bet has to be scaled, so the VaR of
+        # the portfolio including the bet stays below max_var, 0: veto
+        if self._max_var is None or self.samples < self._min_samples:
+            return 1.
+
+        covariance = self.covariance()*self._horizon
+        current = self.exposure_vector(exposures)
+        bet = self.exposure_vector({symbol: notional})
+
+        # Solve (current + s*bet)' C (current + s*bet) = (max_var/z)^2 for s
+        a = bet @ covariance @ bet
+        b = current @ covariance @ bet
+        c = current @ covariance @ current - (self._max_var/self._z)**2
+        if c >= 0.:
+            return 0.
+        if a <= 0.:
+            return 1.
+        scale = (-b + np.sqrt(b*b - a*c))/a
+        return float(min(max(scale, 0.), 1.))
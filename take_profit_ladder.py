@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+import sys
+import numpy as np
+
+
+def sell_fraction_for_kept_gain(margins, kept_share):
+    # Fraction of the units to sell at margin*entry price, so that
+    # kept_share of the gain stays in the units not sold, e.g. triple6
+    # (kept_share 1/3) and fifty50 (kept_share 1/2)
+    margins = np.asarray(margins, dtype=float)
+    return 1.-(1.-1./margins)*kept_share
+
+
+class take_profit_ladder:
+
+    def __init__(self, margins, sell_fractions, keep_ratios=0.):
+        # One take profit order (rung) per element of the last axis:
+        # margins: sell price / entry price, increasing
+        # sell_fractions: fraction of the units left at the rung to sell
+        # keep_ratios: fraction of the profit of the rung not reinvested
+        # Leading axes are a grid of ladders, evaluated all at once.
+        self._margins, self._sell_fractions, self._keep_ratios = (
+            np.broadcast_arrays(np.asarray(margins, dtype=float),
+                                np.asarray(sell_fractions, dtype=float),
+                                np.asarray(keep_ratios, dtype=float)))
+        if self._margins.ndim == 0:
+            raise ValueError('A ladder needs an axis of rungs.')
+        if np.any(np.diff(self._margins, axis=-1) <= 0.):
+            raise ValueError('Margins of the rungs must increase.')
+        if np.any((self._sell_fractions <= 0.) | (self._sell_fractions > 1.)):
+            raise ValueError('Sell fractions must be in (0, 1].')
+        if np.any((self._keep_ratios < 0.) | (self._keep_ratios > 1.)):
+            raise ValueError('Keep ratios must be in [0, 1].')
+
+    @property
+    def rungs(self):
+        return self._margins.shape[-1]
+
+    def evaluate(self, price_entry, asset, price_max=None):
+        # Quantities and cash flows of all rungs for a grid of entry prices
+        # and invested assets (broadcast against the leading axes of the
+        # ladder). With price_max (highest price reached), only the rungs
+        # up to that price are filled, e.g. to evaluate a ladder on
+        # historical prices. Proceeds first pay back the invested asset,
+        # the rest is profit, of which keep_ratio is kept.
+        price_entry = np.asarray(price_entry, dtype=float)[..., np.newaxis]
+        asset = np.asarray(asset, dtype=float)[..., np.newaxis]
+
+        prices = self._margins*price_entry
+        sell_fractions = self._sell_fractions
+        if price_max is not None:
+            filled = prices <= np.asarray(price_max, dtype=float)[...,
+                                                                  np.newaxis]
+            sell_fractions = np.where(filled, sell_fractions, 0.)
+
+        units = asset/price_entry
+        left = np.cumprod(1.-sell_fractions, axis=-1)
+        units_before = units*np.concatenate(
+            [np.ones_like(left[..., :1]), left[..., :-1]], axis=-1)
+        units_sold = units_before*sell_fractions
+        proceeds = units_sold*prices
+
+        paid_back = np.minimum(np.cumsum(proceeds, axis=-1), asset)
+        profit = proceeds-np.diff(paid_back, axis=-1, prepend=0.)
+        keep = self._keep_ratios*profit
+
+        return {'prices': prices,
+                'units_sold': units_sold,
+                'units_left': units*left,
+                'proceeds': proceeds,
+                'profit': profit,
+                'keep': keep,
+                'reinvest': proceeds-keep,
+                'total_proceeds': proceeds.sum(axis=-1),
+                'total_keep': keep.sum(axis=-1)}
+
+    def orders(self, wallet, step_size, tick_size):
+        # Limit SELL orders of a single ladder for the position of a
+        # kelly_wallet, as keyword arguments of
+        # binance_api.futures_create_limit_order(). step_size and tick_size
+        # are the precisions (decimal places) of the symbol. Quantities are
+        # rounded down, so the orders never sell more than the position.
+        if self._margins.ndim != 1:
+            raise ValueError('Orders need a single ladder, not a grid.')
+
+        quantity = wallet.buy_order_executed_quantity
+        if quantity <= 0. and wallet.bet is not None:
+            quantity = wallet.bet.futures_buy
+        price_entry = wallet.entry_price
+        if price_entry <= 0. and wallet.bet is not None:
+            price_entry = wallet.bet.price_old
+
+        sold = np.cumsum(self.evaluate(price_entry, quantity*price_entry)
+                         ['units_sold'])
+        scale = 10.**step_size
+        # Round the cumulative quantities, so the rounding errors do not add
+        # up (the small epsilon avoids 2.9999999 becoming 2.99)
+        sold = np.floor(sold*scale+1e-6)/scale
+        quantities = np.round(np.diff(sold, prepend=0.), step_size)
+        prices = np.round(self._margins*price_entry, tick_size)
+
+        return [{'symbol': wallet.symbol,
+                 'side': 'SELL',
+                 'quantity': float(rung_quantity),
+                 'price': float(rung_price),
+                 'timeInForce': 'GTC',
+                 'client_order_id': wallet.client_order_id(f'TP{rung+1}')}
+                for rung, (rung_quantity, rung_price)
+                in enumerate(zip(quantities, prices)) if rung_quantity > 0.]
+
+
+if __name__ == '__main__':
+
+    # Usage: take_profit_ladder.py <price> <asset> <margin>:<sell fraction>
+    #                              [<keep ratio>] ...
+    # e.g. take_profit_ladder.py 1.0 100 1.2:0.5 1.5:0.5:0.5 2.0:1
+    price_old = float(sys.argv[1])
+    asset_old = float(sys.argv[2])
+    rungs = [[float(value) for value in rung.split(':')]
+             for rung in sys.argv[3:]]
+    ladder = take_profit_ladder([rung[0] for rung in rungs],
+                                [rung[1] for rung in rungs],
+                                [rung[2] if len(rung) > 2 else 0.
+                                 for rung in rungs])
+    plan = ladder.evaluate(price_old, asset_old)
+
+    print(f'Buy {round(asset_old/price_old, 2)} units at '
+          f'{round(price_old, 5)}, pay {round(asset_old, 2)}.')
+    for rung in range(ladder.rungs):
+        print(f'Sell {round(plan["units_sold"][rung], 2)} units at '
+              f'{round(plan["prices"][rung], 5)}, get '
+              f'{round(plan["proceeds"][rung], 2)}: reinvest '
+              f'{round(plan["reinvest"][rung], 2)}, keep '
+              f'{round(plan["keep"][rung], 2)}.')
+    print(f'Keep {round(plan["units_left"][-1], 2)} units.')
@@ -0,0 +1,23 @@
+import os
+import importlib.util
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='session')
+def scheme(tmp_path_factory):
+    # get-rich-quick-scheme.py is a script (no valid module name), and logs
+    # to log.out in the working directory when it is loaded
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('log'))
+    try:
+        spec = importlib.util.spec_from_file_location(
+            'get_rich_quick_scheme',
+            os.path.join(ROOT, 'get-rich-quick-scheme.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        os.chdir(cwd)
+    return module
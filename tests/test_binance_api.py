@@ -0,0 +1,150 @@
+import json
+import threading
+
+import pytest
+import requests
+from binance.exceptions import BinanceAPIException
+
+from api.binance.binance_api import binance_api
+
+
+def api_error(code, message):
+    return BinanceAPIException(None, 400, json.dumps({'code': code,
+                                                      'msg': message}))
+
+
+class fake_client:
+
+    # Futures orders of the account by client order ID. Every send takes
+    # the next outcome: 'ok', 'lost' (times out before reaching Binance),
+    # 'timeout' (times out after reaching it), or an exception to raise.
+    def __init__(self, outcomes=(), orders=None):
+        self.outcomes = list(outcomes)
+        self.orders = dict(orders or {})
+        self.sent = 0
+        self.lookups = 0
+        self.lookup_error = None
+
+    def futures_get_order(self, symbol, origClientOrderId):
+        self.lookups += 1
+        if self.lookup_error is not None:
+            raise self.lookup_error
+        if origClientOrderId not in self.orders:
+            raise api_error(-2013, 'Order does not exist.')
+        return self.orders[origClientOrderId]
+
+    def futures_create_order(self, **params):
+        self.sent += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else 'ok'
+        if isinstance(outcome, Exception):
+            raise outcome
+        if outcome == 'lost':
+            raise requests.exceptions.ConnectTimeout('connect timeout')
+        order = {'orderId': len(self.orders)+1,
+                 'clientOrderId': params['newClientOrderId'],
+                 'symbol': params['symbol'], 'side': params['side'],
+                 'type': params['type'], 'status': 'FILLED',
+                 'price': '0', 'avgPrice': '100.0',
+                 'origQty': str(params['quantity']),
+                 'executedQty': str(params['quantity']),
+                 'updateTime': 1629596414966}
+        self.orders[params['newClientOrderId']] = order
+        if outcome == 'timeout':
+            raise requests.exceptions.ReadTimeout('read timeout')
+        return order
+
+
+def make_api(client):
+    # Without the constructor, which starts the clock sync
+    api = binance_api.__new__(binance_api)
+    api._client = client
+    api._client_lock = threading.Lock()
+    return api
+
+
+def buy(api, retry=False):
+    return api.futures_create_market_order('BTCUSDT', 'BUY', 0.5,
+                                           'kelly_1_7_buy', retry=retry)
+
+
+def test_first_send_without_lookup():
+    client = fake_client()
+    order = buy(make_api(client))
+    assert (order.client_order_id, order.executed_qty) == ('kelly_1_7_buy',
+                                                           0.5)
+    assert (client.sent, client.lookups) == (1, 0)
+
+
+def test_retry_returns_existing_order():
+    client = fake_client()
+    api = make_api(client)
+    first = buy(api)
+    order = buy(api, retry=True)
+    assert order.order_id == first.order_id
+    assert (client.sent, client.lookups) == (1, 1)
+
+
+def test_retry_sends_missing_order():
+    client = fake_client()
+    buy(make_api(client), retry=True)
+    assert (client.sent, client.lookups) == (1, 1)
+
+
+def test_timeout_after_order_reached_binance():
+    # A MARKET order fills at once, sending it again would buy twice
+    client = fake_client(['timeout'])
+    order = buy(make_api(client))
+    assert order.client_order_id == 'kelly_1_7_buy'
+    assert (client.sent, client.lookups) == (1, 1)
+
+
+def test_timeout_before_order_reached_binance():
+    client = fake_client(['lost', 'lost'])
+    buy(make_api(client))
+    assert (client.sent, client.lookups) == (3, 2)
+    assert len(client.orders) == 1
+
+
+def test_status_unknown_and_duplicate_order():
+    client = fake_client([api_error(-1007, 'Timeout waiting for response '
+                                    'from backend server.')])
+    buy(make_api(client))
+    assert (client.sent, client.lookups) == (2, 1)
+
+    # An open order with this ID exists (sent without retry)
+    order = fake_client().futures_create_order(
+        symbol='BTCUSDT', side='SELL', type='LIMIT', quantity=0.5,
+        newClientOrderId='kelly_1_7_sell')
+    client = fake_client([api_error(-4116, 'ClientOrderId is duplicated.')],
+                         {'kelly_1_7_sell': order})
+    assert make_api(client).futures_create_limit_order(
+        'BTCUSDT', 'SELL', 0.5, 'kelly_1_7_sell', price=120.).order_id == 1
+    assert (client.sent, client.lookups) == (1, 1)
+
+
+def test_gives_up_if_order_never_placed():
+    error = api_error(-1007, 'Timeout waiting for response from backend '
+                      'server.')
+    client = fake_client([error]*binance_api._order_attempts)
+    with pytest.raises(BinanceAPIException) as raised:
+        buy(make_api(client))
+    assert raised.value is error
+    assert client.sent == binance_api._order_attempts
+    # Before every send but the first, and once more at the end
+    assert client.lookups == binance_api._order_attempts
+    assert client.orders == {}
+
+
+def test_rejected_order_not_sent_again():
+    client = fake_client([api_error(-2019, 'Margin is insufficient.')])
+    with pytest.raises(BinanceAPIException):
+        buy(make_api(client), retry=True)
+    assert (client.sent, client.lookups) == (1, 1)
+
+
+def test_nothing_sent_if_lookup_fails():
+    client = fake_client()
+    client.lookup_error = requests.exceptions.ConnectionError('no network')
+    with pytest.raises(requests.exceptions.ConnectionError):
+        buy(make_api(client), retry=True)
+    assert client.sent == 0
@@ -0,0 +1,79 @@
+import os
+import zipfile
+
+import numpy as np
+
+from binance_data_importer import binance_data_store, parse_dump_path
+
+MINUTE = 60000
+
+
+def write_dump(source_dir, kind, symbol, period, start, rows):
+    # Kline dump as published on data.binance.vision, with a header line
+    directory = os.path.join(source_dir, kind, symbol, '1m')
+    os.makedirs(directory, exist_ok=True)
+    lines = ['open_time,open,high,low,close,volume,close_time,'
+             'quote_volume,count,taker_buy_volume,taker_buy_quote_volume,'
+             'ignore']
+    for row in range(rows):
+        open_time = start + row*MINUTE
+        lines.append(f'{open_time},{row},{row+1},{row-1},{row},1,'
+                     f'{open_time+MINUTE-1},1,1,1,1,0')
+    path = os.path.join(directory, f'{symbol}-1m-{period}.zip')
+    with zipfile.ZipFile(path, 'w') as dump:
+        dump.writestr(f'{symbol}-1m-{period}.csv', '\n'.join(lines))
+    return path
+
+
+def test_parse_dump_path():
+    assert parse_dump_path(os.path.join(
+        'futures', 'um', 'daily', 'markPriceKlines', 'BTCUSDT', '1m',
+        'BTCUSDT-1m-2021-08-21.zip')) == ('markPriceKlines', 'BTCUSDT', '1m',
+                                          '2021-08-21')
+    assert parse_dump_path(os.path.join('klines', 'notes.zip')) is None
+
+
+def test_import_and_load_range(tmp_path):
+    source_dir = str(tmp_path/'dumps')
+    write_dump(source_dir, 'klines', 'BTCUSDT', '2021-08-01', 0, 10)
+    write_dump(source_dir, 'klines', 'BTCUSDT', '2021-08-02', 10*MINUTE, 10)
+    store = binance_data_store(str(tmp_path/'store'))
+
+    assert store.import_dumps(source_dir, workers=1) == (2, 20)
+    assert store.import_dumps(source_dir, workers=1) == (0, 0)
+
+    result = store.load_range('klines', 'BTCUSDT', '1m', 5*MINUTE,
+                              15*MINUTE, ['open_time', 'close'])
+    np.testing.assert_array_equal(result['open_time'],
+                                  np.arange(5, 15)*MINUTE)
+    np.testing.assert_array_equal(result['close'], [5, 6, 7, 8, 9,
+                                                    0, 1, 2, 3, 4])
+
+
+def test_monthly_dump_replaces_daily_chunks(tmp_path):
+    source_dir = str(tmp_path/'dumps')
+    write_dump(source_dir, 'klines', 'BTCUSDT', '2021-08-01', 0, 10)
+    store = binance_data_store(str(tmp_path/'store'))
+    store.import_dumps(source_dir, workers=1)
+
+    write_dump(source_dir, 'klines', 'BTCUSDT', '2021-08', 0, 30)
+    assert store.import_dumps(source_dir, workers=1) == (1, 30)
+    assert sorted(os.listdir(tmp_path/'store'/'klines'/'BTCUSDT'/'1m')) == \
+        ['2021-08', 'index.json']
+    assert len(store.load_range('klines', 'BTCUSDT', '1m', 0,
+                                30*MINUTE)['open_time']) == 30
+
+
+def test_index_rebuilt_after_interrupted_run(tmp_path):
+    # Chunks were renamed into place, but the run stopped before the index
+    # was written: the next run (without new dumps) writes it
+    source_dir = str(tmp_path/'dumps')
+    write_dump(source_dir, 'klines', 'BTCUSDT', '2021-08-01', 0, 10)
+    store = binance_data_store(str(tmp_path/'store'))
+    store.import_dumps(source_dir, workers=1)
+    os.remove(tmp_path/'store'/'klines'/'BTCUSDT'/'1m'/'index.json')
+
+    store = binance_data_store(str(tmp_path/'store'))
+    assert store.import_dumps(source_dir, workers=1) == (0, 0)
+    assert len(store.load_range('klines', 'BTCUSDT', '1m', 0,
+                                10*MINUTE)['open_time']) == 10
@@ -0,0 +1,377 @@
+import os
+import json
+
+import pytest
+
+from api.binance.records import futures_order, futures_position
+from kelly_allocator import kelly_allocator
+from kelly_wallet import kelly_wallet
+from kellyBet import kellyBet
+from liquidation_engine import isolated_liquidation_price, liquidation_engine
+from pnl_ledger import pnl_ledger
+from portfolio_config import portfolio_config
+from portfolio_risk import portfolio_risk
+from volatility_indicators import volatility_indicators
+from wallet_lifecycle import (wallet_lifecycle, NEW_OR_RESETED,
+                              GOT_BET_PARAMETERS, FUTURES_ORDERED,
+                              FUTURES_PAID, SELL_ORDERED)
+
+
+class fake_api:
+
+    # Orders (by client order ID) and positions of the account. Requests
+    # in fail raise the given error, after they reached "Binance" if the
+    # error is in fail_after.
+    def __init__(self):
+        self.orders = {}
+        self.positions = []
+        self.margin_added = []
+        self.retries = []
+        self.position_configs = []
+        self.fail = {}
+        self.fail_after = {}
+
+    def _send(self, request, send):
+        if request in self.fail:
+            raise self.fail[request]
+        result = send()
+        if request in self.fail_after:
+            raise self.fail_after[request]
+        return result
+
+    def _create_order(self, symbol, side, type, quantity, client_order_id,
+                      price=0.):
+        # Idempotent like binance_api
+        if client_order_id not in self.orders:
+            self.orders[client_order_id] = futures_order(
+                len(self.orders)+1, client_order_id, symbol, side, type,
+                'FILLED' if type == 'MARKET' else 'NEW', price, 100.,
+                quantity, quantity if type == 'MARKET' else 0., 0, 0)
+        return self.orders[client_order_id]
+
+    def get_futures_order(self, symbol, client_order_id):
+        return self.orders.get(client_order_id)
+
+    def futures_create_market_order(self, symbol, side, quantity,
+                                    client_order_id, retry=False):
+        self.retries.append(retry)
+        return self._send('BUY', lambda: self._create_order(
+            symbol, side, 'MARKET', quantity, client_order_id))
+
+    def futures_create_limit_order(self, symbol, side, quantity,
+                                   client_order_id, price=-1,
+                                   timeInForce='GTC', retry=False):
+        self.retries.append(retry)
+        return self._send('SELL', lambda: self._create_order(
+            symbol, side, 'LIMIT', quantity, client_order_id, price))
+
+    def futures_change_position_margin(self, symbol, amount, type=1):
+        return self._send('margin', lambda: self.margin_added.append(amount))
+
+    def get_futures_open_positions(self):
+        return self.positions
+
+    def get_leverage_brackets(self):
+        return [{'symbol': 'BTCUSDT',
+                 'brackets': [{'notionalFloor': 0, 'maintMarginRatio': 0.004,
+                               'cum': 0.0}]}]
+
+    def get_futures_all_orders(self):
+        return list(self.orders.values())
+
+    def set_position_config(self, symbol, leverage, margin_type='ISOLATED'):
+        self.position_configs.append((symbol, leverage, margin_type))
+
+    def get_futures_market_price(self, symbol):
+        return 100.
+
+    def get_account_balance(self, asset):
+        return 10000., 10000.
+
+    def get_step_size_precision(self, symbol, filter_type='MARKET_LOT_SIZE'):
+        return 3
+
+    def get_tick_size_precision(self, symbol):
+        return 2
+
+
+def make_wallet(wallet_id, symbol, balance=1000., leverage=10):
+    wallet = kelly_wallet(wallet_id, symbol)
+    wallet.balance = wallet.initial_balance = balance
+    wallet.leverage = leverage
+    return wallet
+
+
+@pytest.fixture
+def bot(scheme, tmp_path):
+    # The bot without its constructor, which connects to Binance
+    bot = scheme.get_rich_quick_scheme.__new__(scheme.get_rich_quick_scheme)
+    bot.dry_run = False
+    bot._api = fake_api()
+    bot.pnl_ledger = pnl_ledger(bot._api, str(tmp_path/'pnl_ledger.json'))
+    bot.liquidation_engine = liquidation_engine(bot._api)
+    bot._bet_sequences_file = str(tmp_path/'bet_sequences.json')
+    bot.client_order_salt = ''
+    bot.bet_sequences = {}
+    bot.max_margin_failures = 3
+    bot.wallet_portfolio = []
+    bot.portfolio_config = portfolio_config(str(tmp_path/'portfolio.json'))
+    bot.volatility_indicators = volatility_indicators(
+        str(tmp_path/'volatility_indicators.json'))
+    bot.kelly_allocator = kelly_allocator()
+    bot.kelly_allocation = {}
+    return bot
+
+
+def test_kelly_allocation_with_bet_continued_after_restart(bot):
+    # Reconciled after a restart: orders and margin, but no bet plan
+    running = make_wallet(1, 'BTCUSDT')
+    running.status = SELL_ORDERED
+    running.entry_price = 100.
+    running.buy_order_executed_quantity = 1.
+    running.margin_added = 5.
+    free = make_wallet(2, 'ETHUSDT')
+    bot.wallet_portfolio = [running, free]
+    bot.portfolio_risk = portfolio_risk(['BTCUSDT', 'ETHUSDT'])
+
+    assert running.bet is None
+    assert bot.get_open_stake(running) == pytest.approx(15.)
+    bot.update_kelly_allocation()
+
+    assert list(bot.kelly_allocation) == [2]
+    assert 0. < bot.kelly_allocation[2] <= (kellyBet.fixed_bet_size_factor *
+                                            free.balance)
+    assert bot.get_kelly_bet_balance(free) == pytest.approx(
+        bot.kelly_allocation[2]/kellyBet.fixed_bet_size_factor)
+
+
+def make_bet(balance=1000., price=100., leverage=10, margin_factor=2.):
+    # Half of the stake is added margin
+    bet = kellyBet(balance, price, leverage)
+    bet.kellyBet(1.2, margin_factor)
+    return bet
+
+
+def ordering_lifecycle(bot):
+    # The lifecycle from ordering to the SELL order, without backoff
+    return wallet_lifecycle({NEW_OR_RESETED: lambda wallet: NEW_OR_RESETED,
+                             GOT_BET_PARAMETERS: bot.order_futures,
+                             FUTURES_ORDERED: bot.pay_futures,
+                             FUTURES_PAID: bot.order_sell,
+                             SELL_ORDERED: lambda wallet: SELL_ORDERED},
+                            backoff_base=0.)
+
+
+def betting_wallet(status, bet_sequence=7):
+    wallet = make_wallet(1, 'BTCUSDT')
+    wallet.status = status
+    wallet.bet_sequence = bet_sequence
+    wallet.bet = make_bet()
+    return wallet
+
+
+def position(isolated_wallet, quantity=1.25, entry_price=100.,
+             leverage=10):
+    return futures_position('BTCUSDT', quantity, entry_price, entry_price,
+                            0., 0., leverage, 'ISOLATED', isolated_wallet,
+                            quantity*entry_price, 0)
+
+
+def test_bet_ordered_and_paid(bot):
+    wallet = betting_wallet(GOT_BET_PARAMETERS)
+    ordering_lifecycle(bot).run(wallet)
+    assert wallet.status == SELL_ORDERED
+    assert wallet.buy_order_id == bot._api.orders['kelly_1_7_buy'].order_id
+    assert wallet.sell_order_id == bot._api.orders['kelly_1_7_sell'].order_id
+    assert bot._api.margin_added == [62.5]
+    assert wallet.margin_added == 62.5
+
+
+def test_rejected_buy_order_plans_a_new_bet(bot):
+    # E.g. insufficient margin: the stale plan is not sent again
+    bot._api.fail['BUY'] = ValueError('Margin is insufficient.')
+    wallet = betting_wallet(GOT_BET_PARAMETERS)
+    lifecycle = ordering_lifecycle(bot)
+    lifecycle.run(wallet)
+    assert (wallet.status, wallet.failures) == (GOT_BET_PARAMETERS, 1)
+
+    lifecycle.run(wallet)
+    assert wallet.status == NEW_OR_RESETED
+    assert wallet.bet is None
+    assert wallet.failures == 0
+    assert bot._api.orders == {}
+
+
+def test_buy_order_placed_before_timeout_is_continued(bot):
+    bot._api.fail_after['BUY'] = TimeoutError('read timeout')
+    wallet = betting_wallet(GOT_BET_PARAMETERS)
+    lifecycle = ordering_lifecycle(bot)
+    lifecycle.run(wallet)
+    assert wallet.status == GOT_BET_PARAMETERS
+
+    del bot._api.fail_after['BUY']
+    lifecycle.run(wallet)
+    assert wallet.status == SELL_ORDERED
+    assert list(bot._api.orders) == ['kelly_1_7_buy', 'kelly_1_7_sell']
+    # Only the retried BUY order is looked up by binance_api
+    assert bot._api.retries == [False, True, False]
+
+
+def test_margin_added_before_timeout_is_not_added_again(bot):
+    bot._api.fail_after['margin'] = TimeoutError('read timeout')
+    wallet = betting_wallet(FUTURES_ORDERED)
+    lifecycle = ordering_lifecycle(bot)
+    lifecycle.run(wallet)
+    assert wallet.status == FUTURES_ORDERED
+
+    # Initial margin 12.5, plus the added margin (less fees)
+    bot._api.positions = [position(12.5+62.4)]
+    lifecycle.run(wallet)
+    assert wallet.status == SELL_ORDERED
+    assert bot._api.margin_added == [62.5]
+    assert wallet.margin_added == 62.5
+
+
+def test_margin_given_up_after_failures(bot):
+    # The position is open, it gets its SELL order without added margin
+    bot._api.fail['margin'] = ValueError('Margin is insufficient.')
+    bot._api.positions = [position(12.5)]
+    wallet = betting_wallet(FUTURES_ORDERED)
+    lifecycle = ordering_lifecycle(bot)
+    for failures in range(1, bot.max_margin_failures+1):
+        lifecycle.run(wallet)
+        assert (wallet.status, wallet.failures) == (FUTURES_ORDERED,
+                                                    failures)
+
+    lifecycle.run(wallet)
+    assert wallet.status == SELL_ORDERED
+    assert wallet.margin_added == 0.
+    assert 'kelly_1_7_sell' in bot._api.orders
+
+
+def test_cycle_continues_if_logging_fails(bot):
+    # Only the order status is essential, e.g. the clock metrics are not
+    order = bot._api._create_order('BTCUSDT', 'SELL', 'LIMIT', 1.25,
+                                   'kelly_1_7_sell', 120.)
+    wallet = betting_wallet(SELL_ORDERED)
+    wallet.sell_order_id = order.order_id
+    bot.wallet_portfolio = [wallet]
+    # Neither the clock metrics (not in the fake API) nor the wallet info
+    # can be logged
+    assert not hasattr(bot._api, 'get_clock_metrics')
+    bot.print_info_of_all_wallets = None
+
+    assert bot.update_api_info()
+    assert wallet.sell_order_status == 'NEW'
+
+
+def test_client_order_ids_of_a_new_sequences_file_have_a_salt(bot):
+    sequences = bot.load_bet_sequences()
+    salt = bot.client_order_salt
+    assert sequences == {} and len(salt) == 6
+
+    wallet = make_wallet(111, 'BTCUSDT')
+    wallet.client_order_salt = salt
+    bot.start_new_bet_sequence(wallet)
+    assert wallet.client_order_id('BUY') == f'kelly_{salt}_111_1_buy'
+
+    # Kept with the sequences
+    bot.client_order_salt = ''
+    assert bot.load_bet_sequences() == {111: 1}
+    assert bot.client_order_salt == salt
+
+    # If the file is lost, the IDs of the first bets differ from the old ones
+    os.remove(bot._bet_sequences_file)
+    assert bot.load_bet_sequences() == {}
+    assert bot.client_order_salt not in ('', salt)
+
+
+def test_sequences_file_without_salt(bot):
+    # Written before the salt was added, the IDs of running bets stay valid
+    with open(bot._bet_sequences_file, 'w') as sequences_file:
+        json.dump({'111': 42}, sequences_file)
+    assert bot.load_bet_sequences() == {111: 42}
+    assert bot.client_order_salt == ''
+    wallet = make_wallet(111, 'BTCUSDT')
+    wallet.bet_sequence = 42
+    assert wallet.client_order_id('SELL') == 'kelly_111_42_sell'
+
+
+def reconciling_wallet(bot, bet_sequence=7):
+    wallet = make_wallet(1, 'BTCUSDT')
+    wallet.bet_sequence = bet_sequence
+    bot.pnl_ledger.register_wallet(wallet)
+    return wallet
+
+
+def place_bet(bot, buy=True, sell=True):
+    # Orders of bet 7 of wallet 1 before the restart
+    if buy:
+        bot._api._create_order('BTCUSDT', 'BUY', 'MARKET', 1.25,
+                               'kelly_1_7_buy')
+    if sell:
+        bot._api._create_order('BTCUSDT', 'SELL', 'LIMIT', 1.25,
+                               'kelly_1_7_sell', 120.)
+
+
+def test_reconcile_running_bet(bot):
+    place_bet(bot)
+    bot._api.positions = [position(12.5+62.5)]
+    wallet = reconciling_wallet(bot)
+    bot.reconcile_wallet_orders(wallet)
+
+    assert wallet.status == SELL_ORDERED
+    assert wallet.sell_order_id == bot._api.orders['kelly_1_7_sell'].order_id
+    assert (wallet.entry_price, wallet.buy_order_executed_quantity) == \
+        (100., 1.25)
+    assert wallet.margin_added == pytest.approx(62.5)
+    assert wallet.liquidation_price == pytest.approx(
+        isolated_liquidation_price(100., 1.25, 75., 0.004, 0.))
+    assert bot.get_open_stake(wallet) == pytest.approx(75.)
+    # Trades of both orders are booked to the wallet
+    assert sorted(bot.pnl_ledger._order_wallets.values()) == [1, 1]
+
+
+@pytest.mark.parametrize('buy, sell, sell_status', [
+    (False, False, None),     # no bet placed before the restart
+    (True, False, None),      # SELL order missing, checked manually
+    (False, True, 'NEW'),     # BUY order missing, checked manually
+    (True, True, 'FILLED'),   # bet won before the restart
+    (True, True, 'EXPIRED')])  # bet lost before the restart
+def test_reconcile_no_running_bet(bot, buy, sell, sell_status):
+    place_bet(bot, buy, sell)
+    if sell_status is not None:
+        bot._api.orders['kelly_1_7_sell'].status = sell_status
+    wallet = reconciling_wallet(bot)
+    bot.reconcile_wallet_orders(wallet)
+    assert wallet.status == NEW_OR_RESETED
+    assert wallet.sell_order_id == -1
+
+
+def test_reconcile_first_bet(bot):
+    # No bet yet, nothing to look up
+    wallet = reconciling_wallet(bot, bet_sequence=0)
+    bot._api.get_futures_order = None
+    bot.reconcile_wallet_orders(wallet)
+    assert wallet.status == NEW_OR_RESETED
+
+
+@pytest.mark.parametrize('dry_run', [True, False])
+def test_position_config_not_changed_in_dry_run(bot, tmp_path, dry_run):
+    with open(tmp_path/'portfolio.json', 'w') as config_file:
+        json.dump({'wallets': [{'wallet_id': 1, 'symbol': 'BTCUSDT',
+                                'size_percentage': 10, 'leverage': 10}]},
+                  config_file)
+    bot.portfolio_config.reload()
+    bot.portfolio_capital = 10000.
+    bot.portfolio_risk = portfolio_risk(['BTCUSDT'], max_var=1000.)
+    bot.market_prices = {'BTCUSDT': 100.}
+    bot.min_bet_scale = 0.1
+    bot.dry_run = dry_run
+    wallet = make_wallet(1, 'BTCUSDT')
+    bot.wallet_portfolio = [wallet]
+
+    assert bot.add_bet_parameters_to_wallet(wallet) == GOT_BET_PARAMETERS
+    assert bot._api.position_configs == ([] if dry_run
+                                         else [('BTCUSDT', 10, 'ISOLATED')])
+    assert wallet.bet_sequence == (0 if dry_run else 1)
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from kelly_allocator import kelly_allocator
+
+
+def single_kelly(p, gross_odds):
+    return p-(1.-p)/(gross_odds-1.)
+
+
+def test_prior_is_fixed_kelly_bet():
+    allocator = kelly_allocator(prior_kelly=0.125)
+    p = allocator.win_probability('BTCUSDT', 1.2)
+    assert single_kelly(p, 1.2) == pytest.approx(0.125)
+
+    # Outcomes move the estimate away from the prior
+    for _ in range(20):
+        allocator.record_outcome('BTCUSDT', True)
+    assert allocator.win_probability('BTCUSDT', 1.2) > p
+    assert allocator.win_probability('ETHUSDT', 1.2) == pytest.approx(p)
+
+
+def test_uncorrelated_bets_get_fractional_kelly():
+    allocator = kelly_allocator(kelly_fraction=0.5, max_total=1.)
+    fractions = allocator.allocate(['a', 'b'], ['BTCUSDT', 'ETHUSDT'],
+                                   [1.2, 1.4], np.eye(2), [1., 1.])
+    for key, gross_odds in zip(['a', 'b'], [1.2, 1.4]):
+        p = allocator.win_probability('any', gross_odds)
+        assert fractions[key] == pytest.approx(
+            0.5*single_kelly(p, gross_odds), abs=1e-5)
+
+
+def test_correlated_bets_share_the_stake():
+    allocator = kelly_allocator(kelly_fraction=0.5)
+    fractions = allocator.allocate(['a', 'b'], ['BTCUSDT', 'BTCUSDT'],
+                                   [1.2, 1.2], np.ones((2, 2)), [1., 1.])
+    assert fractions['a']+fractions['b'] == pytest.approx(0.5*0.125,
+                                                          abs=1e-5)
+
+
+def test_locked_bets_caps_and_max_total():
+    allocator = kelly_allocator(kelly_fraction=0.5)
+
+    # A running bet of the same symbol leaves nothing for a new one
+    fractions = allocator.allocate(['a', 'b'], ['BTCUSDT', 'BTCUSDT'],
+                                   [1.2, 1.2], np.ones((2, 2)), [1., 1.],
+                                   locked=[0.0625, np.nan])
+    assert fractions['a'] == 0.0625
+    assert fractions['b'] == pytest.approx(0., abs=1e-5)
+
+    # Caps and the total are respected
+    fractions = allocator.allocate(['a', 'b'], ['BTCUSDT', 'ETHUSDT'],
+                                   [1.2, 1.2], np.eye(2), [0.01, 1.])
+    assert fractions['a'] == pytest.approx(0.01)
+    allocator = kelly_allocator(kelly_fraction=1., max_total=0.1)
+    fractions = allocator.allocate(['a', 'b'], ['BTCUSDT', 'ETHUSDT'],
+                                   [1.2, 1.2], np.eye(2), [1., 1.])
+    assert fractions['a']+fractions['b'] == pytest.approx(0.1, abs=1e-6)
+    assert fractions['a'] == pytest.approx(fractions['b'], abs=1e-5)
+
+
+def test_no_edge_no_stake():
+    allocator = kelly_allocator()
+    for _ in range(200):
+        allocator.record_outcome('BTCUSDT', False)
+    fractions = allocator.allocate(['a'], ['BTCUSDT'], [1.2], np.eye(1),
+                                   [1.])
+    assert fractions['a'] == 0.
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from liquidation_engine import isolated_liquidation_price, liquidation_engine
+
+
+# VETUSDT position as returned by futures_position_information(), see the
+# DEBUG INFO in get-rich-quick-scheme.py: 20x isolated long, notional of
+# about 220 USDT, i.e. the first bracket (maintenance margin ratio 1 %,
+# maintenance amount 0)
+VET_POSITION = {'symbol': 'VETUSDT', 'positionAmt': '1660',
+                'entryPrice': '0.1327488795181', 'markPrice': '0.12813000',
+                'liquidationPrice': '0.12743750', 'leverage': '20',
+                'marginType': 'isolated', 'isolatedWallet': '10.93088776'}
+
+BRACKETS = [{'symbol': 'VETUSDT',
+             'brackets': [{'notionalFloor': 0, 'maintMarginRatio': 0.01,
+                           'cum': 0.0},
+                          {'notionalFloor': 5000, 'maintMarginRatio': 0.025,
+                           'cum': 75.0},
+                          {'notionalFloor': 25000, 'maintMarginRatio': 0.05,
+                           'cum': 700.0}]}]
+
+
+class fake_api:
+
+    def get_leverage_brackets(self):
+        return BRACKETS
+
+
+def test_matches_binance_liquidation_price():
+    price = isolated_liquidation_price(float(VET_POSITION['entryPrice']),
+                                       float(VET_POSITION['positionAmt']),
+                                       float(VET_POSITION['isolatedWallet']),
+                                       0.01, 0.)
+    assert price == pytest.approx(float(VET_POSITION['liquidationPrice']),
+                                  rel=1e-4)
+
+
+def test_whole_margin_lost_without_maintenance_margin():
+    # Without maintenance margin, the position is liquidated when the loss
+    # equals the isolated wallet
+    entry_price, quantity, isolated_wallet = 100., 2., 10.
+    assert isolated_liquidation_price(entry_price, quantity, isolated_wallet,
+                                      0., 0.) == pytest.approx(95.)
+    assert isolated_liquidation_price(entry_price, -quantity, isolated_wallet,
+                                      0., 0.) == pytest.approx(105.)
+
+
+def test_brackets_by_notional():
+    engine = liquidation_engine(fake_api())
+    ratios, amounts = engine.maintenance_margin(
+        ['VETUSDT']*4, [100., 5000., 10000., -30000.])
+    np.testing.assert_allclose(ratios, [0.01, 0.025, 0.025, 0.05])
+    np.testing.assert_allclose(amounts, [0., 75., 75., 700.])
+
+
+def test_vectorized_equals_single_positions():
+    engine = liquidation_engine(fake_api())
+    entry_prices = np.array([0.13, 0.12, 0.14])
+    quantities = np.array([1660., 60000., -200000.])
+    isolated_wallets = np.abs(entry_prices*quantities)/20.
+    prices = engine.liquidation_prices(['VETUSDT']*3, entry_prices,
+                                       quantities, isolated_wallets)
+    for price, entry_price, quantity, isolated_wallet in zip(
+            prices, entry_prices, quantities, isolated_wallets):
+        ratio, amount = engine.maintenance_margin('VETUSDT',
+                                                  entry_price*quantity)
+        assert price == pytest.approx(isolated_liquidation_price(
+            entry_price, quantity, isolated_wallet, ratio[0], amount[0]))
@@ -0,0 +1,190 @@
+import types
+from decimal import Decimal
+
+import pytest
+
+import pnl_ledger
+
+DAY = 24*3600*1000
+START = 1629500000000
+
+
+class fake_api:
+
+    # Trades and funding fees of the account, answered like Binance does
+    # (ascending, at most limit entries, requests by time cover <= 7 days)
+    def __init__(self, trades=(), funding=(), prices=None):
+        self.trades = list(trades)
+        self.funding = list(funding)
+        self.prices = prices or {}
+        self.requests = []
+
+    def get_futures_account_trades(self, symbol, from_id=None,
+                                   start_time=None, end_time=None,
+                                   limit=1000):
+        self.requests.append((symbol, from_id, start_time, end_time))
+        trades = [trade for trade in self.trades if trade['symbol'] == symbol]
+        if from_id is not None:
+            trades = [trade for trade in trades if trade['id'] >= from_id]
+        else:
+            if end_time is None:
+                end_time = start_time+7*DAY
+            assert end_time-start_time <= 7*DAY
+            trades = [trade for trade in trades
+                      if start_time <= trade['time'] <= end_time]
+        return trades[:limit]
+
+    def get_futures_income_history(self, income_type, start_time,
+                                   limit=1000):
+        return [entry for entry in self.funding
+                if entry['time'] >= start_time][:limit]
+
+    def get_futures_market_price(self, symbol):
+        return self.prices[symbol]
+
+
+def trade(trade_id, time, order_id, pnl='0', commission='0.1',
+          asset='USDT', symbol='BTCUSDT'):
+    return {'id': trade_id, 'time': time, 'orderId': order_id,
+            'symbol': symbol, 'realizedPnl': pnl, 'commission': commission,
+            'commissionAsset': asset}
+
+
+def funding(tran_id, time, income, symbol='BTCUSDT'):
+    return {'tranId': tran_id, 'time': time, 'income': income,
+            'symbol': symbol}
+
+
+@pytest.fixture
+def now(monkeypatch):
+    # Milliseconds since epoch as seen by the ledger
+    clock = types.SimpleNamespace(time=START)
+    monkeypatch.setattr(pnl_ledger, 'time', lambda: clock.time/1000.)
+    return clock
+
+
+def make_ledger(api, tmp_path, wallet_id=1, symbol='BTCUSDT'):
+    ledger = pnl_ledger.pnl_ledger(api, str(tmp_path/'pnl_ledger.json'))
+    ledger.register_wallet(types.SimpleNamespace(wallet_id=wallet_id,
+                                                 symbol=symbol))
+    return ledger
+
+
+def test_trades_booked_once(tmp_path, now):
+    api = fake_api([trade(1, START+1, 10, pnl='0', commission='0.1'),
+                    trade(2, START+2, 11, pnl='5', commission='0.2')])
+    ledger = make_ledger(api, tmp_path)
+    now.time = START+DAY
+
+    assert ledger.update() == 2
+    assert ledger.update() == 0
+    assert ledger.wallet_pnl(1) == pytest.approx(5-0.3)
+
+    # New trades are requested from the next trade ID on, also after a
+    # restart
+    api.trades.append(trade(3, START+3, 11, pnl='1', commission='0'))
+    ledger = make_ledger(api, tmp_path)
+    assert ledger.update() == 1
+    assert api.requests[-2][1] == 3
+    assert ledger.wallet_pnl(1) == pytest.approx(6-0.3)
+
+
+def test_first_trade_after_seven_days(tmp_path, now):
+    # E.g. a wallet added to the portfolio later: its first trade is not in
+    # the first 7 days after the ledger was created
+    api = fake_api([trade(1, START+20*DAY, 10, pnl='2', commission='0')])
+    ledger = make_ledger(api, tmp_path)
+    now.time = START+2*DAY
+    assert ledger.update() == 0
+
+    now.time = START+21*DAY
+    assert ledger.update() == 1
+    assert ledger.wallet_pnl(1) == pytest.approx(2.)
+    starts = [request[2] for request in api.requests
+              if request[2] is not None]
+    assert starts == [START, START, START+7*DAY, START+14*DAY]
+
+    # The window searched last is persisted
+    api.trades.append(trade(2, START+22*DAY, 11, pnl='1', commission='0'))
+    now.time = START+23*DAY
+    ledger = make_ledger(api, tmp_path)
+    assert ledger.update() == 1
+
+
+def test_trades_attributed_to_wallet_of_order(tmp_path, now):
+    api = fake_api([trade(1, START+1, 10, pnl='3', commission='0'),
+                    trade(2, START+2, 20, pnl='4', commission='0')])
+    ledger = make_ledger(api, tmp_path)
+    ledger.register_order(20, types.SimpleNamespace(wallet_id=2))
+    ledger.update()
+    assert ledger.wallet_pnl(1) == pytest.approx(3.)
+    assert ledger.wallet_pnl(2) == pytest.approx(4.)
+    assert ledger.symbol_pnl('BTCUSDT') == pytest.approx(7.)
+
+
+def test_commission_in_bnb(tmp_path, now):
+    api = fake_api([trade(1, START+1, 10, pnl='1', commission='0.01',
+                          asset='BNB')],
+                   prices={'BNBUSDT': 300.})
+    ledger = make_ledger(api, tmp_path)
+    ledger.update()
+    assert ledger.wallet_pnl(1) == pytest.approx(1-3.)
+
+
+def test_commission_price_error_books_nothing(tmp_path, now):
+    # The update is aborted and continues from the same trade, i.e. the
+    # realized PNL is not booked twice
+    api = fake_api([trade(1, START+1, 10, pnl='1', commission='0.01',
+                          asset='BNB')])
+    ledger = make_ledger(api, tmp_path)
+    with pytest.raises(KeyError):
+        ledger.update()
+    assert ledger.wallet_pnl(1) == 0.
+
+    api.prices['BNBUSDT'] = 300.
+    ledger.update()
+    assert ledger.wallet_pnl(1) == pytest.approx(1-3.)
+
+
+def test_funding_entries_at_cursor_time_not_booked_twice(tmp_path, now):
+    # startTime is inclusive, entries at the time of the last entry are
+    # returned again
+    api = fake_api(funding=[funding(1, START+10, '-0.5'),
+                            funding(2, START+20, '-0.25')])
+    ledger = make_ledger(api, tmp_path)
+    assert ledger.update() == 2
+    assert ledger.update() == 0
+
+    # Another entry at the same time as the last one
+    api.funding.append(funding(3, START+20, '1'))
+    ledger = make_ledger(api, tmp_path)
+    assert ledger.update() == 1
+    assert ledger.wallet_pnl(1) == pytest.approx(0.25)
+
+
+def test_funding_pages(tmp_path, now, monkeypatch):
+    # The second page starts at the time of the last entry of the first
+    monkeypatch.setattr(pnl_ledger.pnl_ledger, '_limit', 3)
+    api = fake_api(funding=[funding(tran_id, START+time, '1')
+                            for tran_id, time in enumerate([0, 10, 10, 20,
+                                                            30])])
+    ledger = make_ledger(api, tmp_path)
+    assert ledger.update() == 5
+    assert ledger.wallet_pnl(1) == pytest.approx(5.)
+
+
+def test_released_orders_dropped_after_next_update(tmp_path, now):
+    api = fake_api()
+    ledger = make_ledger(api, tmp_path)
+    wallet = types.SimpleNamespace(wallet_id=1)
+    ledger.register_order(10, wallet)
+    ledger.release_orders(wallet)
+    # A trade of the finished bet booked in the next update still goes to
+    # its wallet
+    api.trades.append(trade(1, START+1, 10, pnl='1', commission='0'))
+    ledger.register_wallet(types.SimpleNamespace(wallet_id=2,
+                                                 symbol='BTCUSDT'))
+    ledger.update()
+    assert ledger.wallet_pnl(1) == pytest.approx(1.)
+    assert ledger._order_wallets == {}
+    assert Decimal(ledger._symbol_totals['BTCUSDT']['realized_pnl']) == 1
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from portfolio_config import parse_portfolio_config, portfolio_config
+
+
+def wallet(wallet_id=111, symbol='BTCUSDT', **options):
+    config = {'wallet_id': wallet_id, 'symbol': symbol,
+              'size_percentage': 20, 'leverage': 20}
+    config.update(options)
+    return config
+
+
+def test_parse():
+    wallets = parse_portfolio_config({'wallets': [
+        wallet(), wallet(222, 'ETHUSDT', gross_odds=1.4, margin_factor=5)]})
+    assert wallets[111]['gross_odds'] is None
+    assert wallets[111]['margin_factor'] is None
+    assert (wallets[222]['gross_odds'], wallets[222]['margin_factor']) == \
+        (1.4, 5.)
+
+
+@pytest.mark.parametrize('options', [
+    {'gross_odds': 1.0},         # divides by zero in the Kelly formula
+    {'gross_odds': 0.8},
+    {'gross_odds': float('nan')},
+    {'margin_factor': 0.5},      # negative added margin
+    {'leverage': 0},
+    {'size_percentage': 0}])
+def test_invalid_wallet(options):
+    with pytest.raises(ValueError):
+        parse_portfolio_config({'wallets': [wallet(**options)]})
+
+
+def test_invalid_portfolio():
+    with pytest.raises(ValueError):
+        parse_portfolio_config({'wallets': [wallet(), wallet()]})
+    with pytest.raises(ValueError):
+        parse_portfolio_config({'wallets': [
+            wallet(size_percentage=60), wallet(222, size_percentage=50)]})
+
+
+def test_invalid_file_keeps_previous_config(tmp_path):
+    config_file = tmp_path/'portfolio.json'
+    config_file.write_text(json.dumps({'wallets': [wallet()]}))
+    config = portfolio_config(str(config_file))
+    assert config.reload()
+
+    config_file.write_text(json.dumps({'wallets': [wallet(gross_odds=1)]}))
+    assert not config.reload()
+    assert config.wallet(111)['gross_odds'] is None
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from portfolio_risk import normal_quantile, portfolio_risk
+
+
+def make_risk(max_var=None, updates=200, min_samples=60):
+    # Two correlated symbols with random walk prices
+    risk = portfolio_risk(['BTCUSDT', 'ETHUSDT'], window=500,
+                          min_samples=min_samples, confidence=0.99,
+                          horizon=60, max_var=max_var)
+    rng = np.random.default_rng(1)
+    common = rng.normal(0., 0.002, updates)
+    prices = np.exp(np.cumsum(np.column_stack(
+        [common + rng.normal(0., 0.001, updates),
+         common + rng.normal(0., 0.002, updates)]), axis=0))
+    for btc, eth in prices*[40000., 3000.]:
+        risk.update({'BTCUSDT': btc, 'ETHUSDT': eth})
+    return risk
+
+
+def portfolio_var(risk, exposures):
+    vector = risk.exposure_vector(exposures)
+    return (normal_quantile(0.99) *
+            np.sqrt(vector @ risk.covariance() @ vector*60))
+
+
+def test_normal_quantile():
+    assert normal_quantile(0.5) == pytest.approx(0., abs=1e-12)
+    assert normal_quantile(0.975) == pytest.approx(1.959963984540054)
+    assert normal_quantile(0.99) == pytest.approx(2.3263478740408408)
+    assert normal_quantile(0.01) == pytest.approx(-2.3263478740408408)
+
+
+def test_bet_scale_reaches_max_var():
+    exposures = {'BTCUSDT': 1000.}
+    risk = make_risk()
+    var_current = portfolio_var(risk, exposures)
+    var_full = portfolio_var(risk, {'BTCUSDT': 1000., 'ETHUSDT': 2000.})
+    risk.max_var = (var_current+var_full)/2.
+
+    scale = risk.bet_scale(exposures, 'ETHUSDT', 2000.)
+    assert 0. < scale < 1.
+    assert portfolio_var(risk, {'BTCUSDT': 1000., 'ETHUSDT': scale*2000.}) \
+        == pytest.approx(risk.max_var)
+
+
+def test_bet_scale_limits():
+    exposures = {'BTCUSDT': 1000.}
+    risk = make_risk()
+    var_current = portfolio_var(risk, exposures)
+
+    # The bet fits completely
+    risk.max_var = 10.*portfolio_var(risk, {'BTCUSDT': 1000.,
+                                            'ETHUSDT': 2000.})
+    assert risk.bet_scale(exposures, 'ETHUSDT', 2000.) == 1.
+
+    # The current positions alone exceed max_var: veto
+    risk.max_var = var_current/2.
+    assert risk.bet_scale(exposures, 'ETHUSDT', 2000.) == 0.
+
+    # No limit, or not enough samples yet
+    risk.max_var = None
+    assert risk.bet_scale(exposures, 'ETHUSDT', 2000.) == 1.
+    risk = make_risk(max_var=1e-9, updates=30)
+    assert risk.bet_scale(exposures, 'ETHUSDT', 2000.) == 1.
+
+
+def test_correlation_of_repeated_symbols():
+    # Before min_samples only the same symbols are correlated
+    risk = make_risk(updates=10)
+    np.testing.assert_array_equal(
+        risk.correlation(['BTCUSDT', 'ETHUSDT', 'BTCUSDT']),
+        [[1., 0., 1.], [0., 1., 0.], [1., 0., 1.]])
+    risk = make_risk()
+    correlation = risk.correlation(['BTCUSDT', 'ETHUSDT', 'BTCUSDT'])
+    assert correlation[0, 2] == pytest.approx(1.)
+    assert 0.5 < correlation[0, 1] < 1.
@@ -0,0 +1,77 @@
+import types
+import numpy as np
+import pytest
+
+from take_profit_ladder import take_profit_ladder, sell_fraction_for_kept_gain
+
+PRICES = np.array([0.01, 1., 2.49, 40000.])[:, np.newaxis]
+ASSETS = np.array([10., 100., 12345.])
+
+
+def test_triple6():
+    # Closed form of triple6 before it used the ladder
+    margin = 1.2
+    unit_buy = ASSETS/PRICES
+    unit_sell = (1-((1-(1/margin))/3))*unit_buy
+    asset_new = unit_sell*margin*PRICES
+    asset_keep = (asset_new-ASSETS)/2
+
+    plan = take_profit_ladder([margin],
+                              [sell_fraction_for_kept_gain(margin, 1/3)],
+                              [1/2]).evaluate(PRICES, ASSETS)
+    np.testing.assert_allclose(plan['prices'][..., 0], margin*PRICES)
+    np.testing.assert_allclose(plan['units_sold'][..., 0], unit_sell)
+    np.testing.assert_allclose(plan['units_left'][..., 0],
+                               unit_buy-unit_sell)
+    np.testing.assert_allclose(plan['proceeds'][..., 0], asset_new)
+    np.testing.assert_allclose(plan['keep'][..., 0], asset_keep)
+    np.testing.assert_allclose(plan['reinvest'][..., 0],
+                               asset_new-asset_keep)
+
+
+def test_fifty50():
+    # Closed form of fifty50 before it used the ladder
+    margin = 1.2
+    unit_buy = ASSETS/PRICES
+    unit_sell = (1-((1-(1/margin))/2))*unit_buy
+
+    plan = take_profit_ladder([margin],
+                              [sell_fraction_for_kept_gain(margin, 1/2)]
+                              ).evaluate(PRICES, ASSETS)
+    np.testing.assert_allclose(plan['units_sold'][..., 0], unit_sell)
+    np.testing.assert_allclose(plan['units_left'][..., 0],
+                               unit_buy-unit_sell)
+    np.testing.assert_allclose(plan['proceeds'][..., 0],
+                               unit_sell*margin*PRICES)
+    np.testing.assert_allclose(plan['keep'][..., 0], 0.)
+
+
+def test_rungs_above_price_max_are_not_filled():
+    ladder = take_profit_ladder([1.1, 1.2, 1.5], [0.5, 0.5, 1.])
+    plan = ladder.evaluate(100., 1000., price_max=125.)
+    np.testing.assert_allclose(plan['units_sold'], [5., 2.5, 0.])
+    np.testing.assert_allclose(plan['units_left'], [5., 2.5, 2.5])
+    # Proceeds first pay back the asset
+    plan = ladder.evaluate(100., 1000.)
+    np.testing.assert_allclose(plan['profit'].sum(),
+                               plan['total_proceeds']-1000.)
+
+
+def test_orders_never_sell_more_than_the_position():
+    wallet = types.SimpleNamespace(
+        symbol='ADAUSDT', buy_order_executed_quantity=103.,
+        entry_price=2.494, bet=None,
+        client_order_id=lambda side: f'kelly_1_7_{side.lower()}')
+    ladder = take_profit_ladder([1.1, 1.2, 1.3], [1/3, 1/2, 1.])
+    orders = ladder.orders(wallet, step_size=0, tick_size=4)
+    assert sum(order['quantity'] for order in orders) == 103.
+    assert [order['price'] for order in orders] == [2.7434, 2.9928, 3.2422]
+    assert [order['client_order_id'] for order in orders] == \
+        ['kelly_1_7_tp1', 'kelly_1_7_tp2', 'kelly_1_7_tp3']
+
+
+def test_invalid_ladders():
+    with pytest.raises(ValueError):
+        take_profit_ladder([1.2, 1.1], [0.5, 1.])
+    with pytest.raises(ValueError):
+        take_profit_ladder([1.2], [0.])
@@ -0,0 +1,90 @@
+import json
+
+import numpy as np
+import pytest
+
+from volatility_indicators import volatility_indicator, volatility_indicators
+
+START = 1629500000.
+
+
+def random_walk(ticks, volatility=0.0005, price=100., seed=1):
+    returns = np.random.default_rng(seed).normal(0., volatility, ticks)
+    return price*np.exp(np.cumsum(returns))
+
+
+def feed(indicators, prices, start, cycle=60.):
+    for tick, price in enumerate(prices):
+        indicators.update({'BTCUSDT': float(price)}, start+tick*cycle)
+    return start+len(prices)*cycle
+
+
+def test_defaults_until_enough_ticks(tmp_path):
+    indicators = volatility_indicators(str(tmp_path/'state.json'),
+                                       min_ticks=60)
+    indicators.indicator('BTCUSDT')
+    feed(indicators, random_walk(59), START)
+    assert indicators.suggest('BTCUSDT', 20) == (1.2, 1.0)
+    feed(indicators, random_walk(1), START+59*60.)
+    assert indicators.suggest('BTCUSDT', 20) != (1.2, 1.0)
+
+
+def test_realized_volatility_per_tick():
+    indicator = volatility_indicator()
+    for tick, price in enumerate(random_walk(2000, volatility=0.001)):
+        indicator.update(float(price), START+tick*60.)
+    assert indicator.volatility == pytest.approx(0.001, rel=0.3)
+
+
+def test_no_warm_up_after_restart(tmp_path):
+    state_file = str(tmp_path/'state.json')
+    indicators = volatility_indicators(state_file)
+    indicators.indicator('BTCUSDT')
+    prices = random_walk(300)
+    now = feed(indicators, prices[:200], START)
+    indicators.save()
+    suggestion = indicators.suggest('BTCUSDT', 20)
+
+    restarted = volatility_indicators(state_file)
+    assert restarted.suggest('BTCUSDT', 20) == suggestion
+    # Without downtime, the indicators continue as if there was no restart
+    feed(indicators, prices[200:], now)
+    feed(restarted, prices[200:], now)
+    assert restarted.suggest('BTCUSDT', 20) == indicators.suggest(
+        'BTCUSDT', 20)
+
+
+def test_price_change_during_downtime_not_one_tick(tmp_path):
+    # One hour down, the price moved by 3 % meanwhile
+    state_file = str(tmp_path/'state.json')
+    indicators = volatility_indicators(state_file)
+    indicators.indicator('BTCUSDT')
+    prices = random_walk(200)
+    now = feed(indicators, prices, START)
+    indicators.save()
+    _, margin_factor = indicators.suggest('BTCUSDT', 20)
+    assert margin_factor < 2.
+
+    restarted = volatility_indicators(state_file)
+    feed(restarted, random_walk(5, price=1.03*prices[-1], seed=2),
+         now+3600.)
+    assert restarted.suggest('BTCUSDT', 20)[1] == pytest.approx(
+        margin_factor, rel=0.2)
+
+    # Had the gap been one tick, the margin factor would be at its maximum
+    feed(indicators, random_walk(5, price=1.03*prices[-1], seed=2), now)
+    assert indicators.suggest('BTCUSDT', 20)[1] == 5.
+
+
+def test_state_saved_without_time(tmp_path):
+    # The gap to the first price after the restart is unknown, its return
+    # is not used
+    state_file = tmp_path/'state.json'
+    state_file.write_text(json.dumps({'BTCUSDT': {
+        'ticks': 100, 'price': 100., 'ema': 100., 'atr': 0.05,
+        'variance': 1e-6}}))
+    indicators = volatility_indicators(str(state_file))
+    indicators.update({'BTCUSDT': 110.}, START)
+    indicator = indicators.indicator('BTCUSDT')
+    assert (indicator.atr, indicator.variance) == (0.05, 1e-6)
+    assert (indicator.price, indicator.time) == (110., START)
@@ -0,0 +1,101 @@
+import types
+
+import pytest
+
+import wallet_lifecycle
+from kelly_wallet import kelly_wallet
+from wallet_lifecycle import (NEW_OR_RESETED, GOT_BET_PARAMETERS,
+                              FUTURES_ORDERED, FUTURES_PAID, SELL_ORDERED)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(time=1000.)
+    monkeypatch.setattr(wallet_lifecycle, 'time', lambda: clock.time)
+    return clock
+
+
+def recording_handlers(calls, transitions):
+    # Handlers which record their calls and follow the given transitions
+    def handler(state):
+        def run(wallet):
+            calls.append(state)
+            return transitions[state]
+        return run
+    return {state: handler(state) for state in transitions}
+
+
+def test_advances_as_far_as_possible(clock):
+    calls = []
+    lifecycle = wallet_lifecycle.wallet_lifecycle(recording_handlers(
+        calls, {NEW_OR_RESETED: GOT_BET_PARAMETERS,
+                GOT_BET_PARAMETERS: FUTURES_ORDERED,
+                FUTURES_ORDERED: FUTURES_PAID,
+                FUTURES_PAID: SELL_ORDERED,
+                SELL_ORDERED: SELL_ORDERED}))
+    wallet = kelly_wallet(1, 'BTCUSDT')
+    lifecycle.run(wallet)
+    assert wallet.status == SELL_ORDERED
+    assert calls == [NEW_OR_RESETED, GOT_BET_PARAMETERS, FUTURES_ORDERED,
+                     FUTURES_PAID, SELL_ORDERED]
+
+
+def test_every_state_at_most_once_per_cycle(clock):
+    # E.g. a dry run goes back to the start after ordering
+    calls = []
+    lifecycle = wallet_lifecycle.wallet_lifecycle(recording_handlers(
+        calls, {NEW_OR_RESETED: GOT_BET_PARAMETERS,
+                GOT_BET_PARAMETERS: NEW_OR_RESETED}))
+    wallet = kelly_wallet(1, 'BTCUSDT')
+    lifecycle.run(wallet)
+    assert wallet.status == NEW_OR_RESETED
+    assert calls == [NEW_OR_RESETED, GOT_BET_PARAMETERS]
+
+
+def test_failed_step_retried_with_backoff(clock):
+    attempts = []
+
+    def order_futures(wallet):
+        attempts.append(clock.time)
+        if len(attempts) <= 8:
+            raise ConnectionError('timeout')
+        return FUTURES_ORDERED
+
+    lifecycle = wallet_lifecycle.wallet_lifecycle(
+        {GOT_BET_PARAMETERS: order_futures,
+         FUTURES_ORDERED: lambda wallet: FUTURES_ORDERED},
+        backoff_base=30., backoff_max=3600.)
+    wallet = kelly_wallet(1, 'BTCUSDT')
+    wallet.status = GOT_BET_PARAMETERS
+
+    delays = []
+    while wallet.status == GOT_BET_PARAMETERS:
+        lifecycle.run(wallet)
+        if wallet.status == GOT_BET_PARAMETERS:
+            delays.append(wallet.retry_time-clock.time)
+            assert wallet.failures == len(delays)
+            # Not retried before the backoff has passed
+            clock.time += delays[-1]-1.
+            lifecycle.run(wallet)
+            assert len(attempts) == len(delays)
+            clock.time += 1.
+    assert delays == [30., 60., 120., 240., 480., 960., 1920., 3600.]
+    assert wallet.status == FUTURES_ORDERED
+    assert wallet.failures == 0
+    assert wallet.retry_time == 0
+
+
+def test_failing_wallet_does_not_stop_the_others(clock):
+    def add_bet_parameters(wallet):
+        if wallet.wallet_id == 1:
+            raise ValueError('no price')
+        return GOT_BET_PARAMETERS
+
+    lifecycle = wallet_lifecycle.wallet_lifecycle(
+        {NEW_OR_RESETED: add_bet_parameters,
+         GOT_BET_PARAMETERS: lambda wallet: GOT_BET_PARAMETERS})
+    wallets = [kelly_wallet(1, 'BTCUSDT'), kelly_wallet(2, 'ETHUSDT')]
+    lifecycle.run_all(wallets)
+    assert [wallet.status for wallet in wallets] == [NEW_OR_RESETED,
+                                                     GOT_BET_PARAMETERS]
+    assert [wallet.failures for wallet in wallets] == [1, 0]
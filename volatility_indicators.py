@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import logging
+from math import log, sqrt
+from time import time
+
+logger = logging.getLogger('default_logger')
+
+
+class volatility_indicator:
+
+    # All state is in these attributes, see to_dict() and from_dict()
+    _state = ('ticks', 'price', 'time', 'ema', 'atr', 'variance')
+
+    def __init__(self, ema_span=60, atr_span=14, variance_decay=0.94,
+                 max_gap=180.):
+        # Smoothing factors of the exponential moving averages
+        self._ema_alpha = 2./(ema_span+1.)
+        self._atr_alpha = 1./atr_span  # Wilder's smoothing
+        self._variance_decay = variance_decay  # RiskMetrics lambda
+
+        # A price more than max_gap seconds after the last one (e.g. after
+        # downtime) is not one tick later, its return is dropped
+        self._max_gap = max_gap
+
+        self.ticks = 0
+        self.price = None
+        self.time = None  # s since epoch of the last price
+        self.ema = None
+        self.atr = 0.
+        self.variance = 0.
+
+    def update(self, price, now=None):
+        # O(1) per tick. There are no high and low prices between two ticks,
+        # the true range is the absolute price change. now: time of the
+        # price (s since epoch).
+        if now is None:
+            now = time()
+        gap = self.time is None or now-self.time > self._max_gap
+        self.ticks += 1
+        self.time = now
+        if self.price is None:
+            self.price = self.ema = price
+            return
+
+        self.ema += self._ema_alpha*(price-self.ema)
+        if gap:
+            self.price = price
+            return
+
+        true_range = abs(price-self.price)
+        log_return = log(price/self.price)
+
+        self.atr += self._atr_alpha*(true_range-self.atr)
+        self.variance = (self._variance_decay*self.variance +
+                         (1.-self._variance_decay)*log_return**2)
+        self.price = price
+
+    @property
+    def volatility(self):
+        # Realized volatility (standard deviation of log returns) per tick
+        return sqrt(self.variance)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self._state}
+
+    def from_dict(self, state):
+        # States saved without time: the gap is unknown
+        for name in self._state:
+            setattr(self, name, state.get(name))
+
+
+class volatility_indicators:
+
+    def __init__(self, state_file='volatility_indicators.json',
+                 min_ticks=60, horizon=1440, liquidation_sigmas=3.,
+                 take_profit_atrs=1., margin_factor_range=(1., 5.),
+                 gross_odds_range=(1.05, 3.5),
+                 defaults=(1.2, 1.0)):
+
+        self._state_file = state_file
+        self._indicators = {}
+
+        # Suggestions need at least min_ticks ticks, use defaults before
+        self._min_ticks = min_ticks
+        self._defaults = defaults
+
+        # The bet should last about horizon ticks: the liquidation price is
+        # placed liquidation_sigmas standard deviations (over the horizon)
+        # below the entry price, the sell price take_profit_atrs ATRs (over
+        # the horizon) above
+        self._horizon = horizon
+        self._liquidation_sigmas = liquidation_sigmas
+        self._take_profit_atrs = take_profit_atrs
+        self._margin_factor_range = margin_factor_range
+        self._gross_odds_range = gross_odds_range
+
+        self._load()
+
+    def _load(self):
+        # Restore the state of the last run, i.e. no warm-up after a restart
+        # (the first price change after the downtime is not used)
+        if not os.path.exists(self._state_file):
+            return
+        with open(self._state_file) as state_file:
+            for symbol, state in json.load(state_file).items():
+                self.indicator(symbol).from_dict(state)
+
+    def save(self):
+        state = {symbol: indicator.to_dict()
+                 for symbol, indicator in self._indicators.items()}
+        with open(self._state_file + '.tmp', 'w') as state_file:
+            json.dump(state, state_file)
+        os.replace(self._state_file + '.tmp', self._state_file)
+
+    def indicator(self, symbol):
+        if symbol not in self._indicators:
+            self._indicators[symbol] = volatility_indicator()
+        return self._indicators[symbol]
+
+    def update(self, prices, now=None):
+        # prices: {symbol: price}, only symbols with an indicator are updated
+        # (create them with indicator(symbol))
+        if now is None:
+            now = time()
+        for symbol, indicator in self._indicators.items():
+            if symbol in prices:
+                indicator.update(prices[symbol], now)
+
+    @staticmethod
+    def _clamp(value, value_range):
+        return min(max(value, value_range[0]), value_range[1])
+
+    def suggest(self, symbol, leverage, log=True):
+        # Suggest gross_odds and margin_factor for a new bet on symbol.
+        # With kellyBet, the liquidation price is margin_factor/leverage and
+        # the sell price (gross_odds-1)*margin_factor/leverage (relative to
+        # the entry price) away from the entry price.
+        indicator = self.indicator(symbol)
+        if indicator.ticks < self._min_ticks:
+            return self._defaults
+
+        liquidation_distance = (self._liquidation_sigmas *
+                                indicator.volatility*sqrt(self._horizon))
+        margin_factor = self._clamp(leverage*liquidation_distance,
+                                    self._margin_factor_range)
+
+        take_profit_distance = (self._take_profit_atrs *
+                                indicator.atr/indicator.ema *
+                                sqrt(self._horizon))
+        gross_odds = self._clamp(1.+take_profit_distance *
+                                 leverage/margin_factor,
+                                 self._gross_odds_range)
+
+        if log:
+            logger.info('Volatility of %s: %.3g %%/tick, ATR %.3g, EMA %.6g '
+                        '--> gross odds %.2f, margin factor %.2f.',
+                        symbol, 100*indicator.volatility, indicator.atr,
+                        indicator.ema, gross_odds, margin_factor)
+        return gross_odds, margin_factor
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import logging
+from time import time
+
+logger = logging.getLogger('default_logger')
+
+# Wallet states, see also wallet_lifecycle_concept.txt
+NEW_OR_RESETED = 'NEW OR RESETED'
+GOT_BET_PARAMETERS = 'GOT BET PARAMETERS'
+FUTURES_ORDERED = 'FUTURES ORDERED'
+FUTURES_PAID = 'FUTURES PAID'
+SELL_ORDERED = 'SELL ORDERED'
+WON = 'WON'
+LOST = 'LOST'
+CANCELED = 'CANCELED'
+WON_OR_LOST_PROCESSED = 'WON_OR_LOST_PROCESSED'
+
+
+class wallet_lifecycle:
+
+    def __init__(self, handlers, backoff_base=30., backoff_max=3600.):
+
+        # handlers: {state: function(wallet) returning the next state}
+        # A handler only returns the next state once its step is done (and
+        # sent to Binance), so a failed step is simply run again. A handler
+        # sees the failed attempts in wallet.failures, e.g. to give up a
+        # step which keeps failing.
+        self._handlers = handlers
+
+        # Failed wallets are retried after backoff_base*2**(failures-1)
+        # seconds, at most after backoff_max seconds
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+
+    def _backoff(self, wallet):
+        wallet.failures += 1
+        delay = min(self._backoff_base*2**(wallet.failures-1),
+                    self._backoff_max)
+        wallet.retry_time = time()+delay
+        return delay
+
+    def run(self, wallet):
+        # Advance a wallet as far as possible within this cycle, every state
+        # at most once (e.g. a dry run goes back to the start)
+        if time() < wallet.retry_time:
+            logger.info('Wallet in state %s waits for retry [index=%d].',
+                        wallet.status, wallet.wallet_id)
+            return
+
+        visited = []
+        while wallet.status not in visited:
+            state = wallet.status
+            visited.append(state)
+
+            try:
+                next_state = self._handlers[state](wallet)
+            except Exception as error:
+                delay = self._backoff(wallet)
+                error_message = 'CAUGHT AN ERROR IN STATE ' + state
+                print(error_message, wallet.symbol, error)
+                logger.error('%s %s, retry in %d s [index=%d].',
+                             error_message, error, delay, wallet.wallet_id)
+                return
+
+            wallet.failures = 0
+            wallet.retry_time = 0
+            if next_state != state:
+                logger.info('Wallet state %s --> %s [index=%d].',
+                            state, next_state, wallet.wallet_id)
+                wallet.status = next_state
+
+    def run_all(self, wallets):
+        # A failing wallet does not stop the others
+        for wallet in wallets:
+            self.run(wallet)